@@ -0,0 +1,74 @@
+"""
+Compare `clean_text` against the previous multi-pass implementation on the
+bundled corpus.
+
+Usage:
+    python benchmarks/bench_clean_text.py [--repeat 5]
+"""
+
+import argparse
+import json
+import re
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from lib.utils import clean_text
+
+
+def legacy_clean_text(text: str) -> str:
+    """The previous multi-pass implementation"""
+    text = re.sub(r"[\u2060\u200b\u200c\u200d]", "", text)
+    text = re.sub(r"\n\s*([a-zA-Z])\s*\n", r" \1 ", text)
+    text = re.sub(
+        r"\{\s*\\displaystyle\s*([^}]+)\s*\}", r"{\\displaystyle \1}", text
+    )
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\s+([,.!?;:])", r"\1", text)
+    text = re.sub(r"\(\s+", "(", text)
+    text = re.sub(r"\s+\)", ")", text)
+    return text.strip()
+
+
+def load_texts(path: Path) -> list[str]:
+    texts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            doc = json.loads(line)
+            texts.append(doc["summary"])
+            texts.extend(chunk["content"] for chunk in doc["chunks"])
+    return texts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--corpus", type=Path, default=ROOT / "dataset" / "wiki_doc.jsonl"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    texts = load_texts(args.corpus)
+    size = sum(map(len, texts)) / 1e6
+    print(f"{len(texts)} texts, {size:.1f}M characters")
+    for name, fn in [
+        ("multi-pass", legacy_clean_text),
+        ("single-pass", clean_text),
+    ]:
+        best = min(
+            timeit.repeat(
+                lambda fn=fn: [fn(t) for t in texts],
+                number=1,
+                repeat=args.repeat,
+            )
+        )
+        print(
+            f"{name:>12}: {best * 1000:8.1f} ms ({size / best:.1f} M chars/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+Offline benchmarks of the preprocessing and generation hot paths.
+
+Replays the bundled corpus through `clean_text`, `chunk_text`,
+`_get_chunks`, `format_context` and prompt construction, and drives
+`generate_batch` against a deterministic fake OpenAI-compatible backend.
+Every benchmark reports its throughput (best of `--repeat` runs), peak
+traced memory and retained blocks: the memory blocks it leaves allocated,
+its result included. These are not allocation counts, tracemalloc only
+sees the blocks still alive when a snapshot is taken. Runs are timed in
+CPU time, so waiting for a busy CPU doesn't count, and throughput is also
+given relative to a fixed pure-Python calibration loop timed in the same
+process, which cancels out the machine speed. Results are compared with
+`benchmarks/baseline.json`: a relative throughput drop (still there when
+measured again), peak memory or retained blocks growth past their
+tolerances exits with status 1.
+
+Usage:
+    python benchmarks/suite.py [--repeat 5] [--only clean_text,generate]
+    python benchmarks/suite.py --save  # record a new baseline
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import NamedTuple
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from lib import llm as llm_module
+from lib.budget import pack_prompt
+from lib.chunker import chunk_text
+from lib.corpus import load_articles
+from lib.llm import AsyncOpenAIClient, generate_batch
+from lib.prompt import build_prompt
+from lib.tokenizer import count_encoded
+from lib.types import Article
+from lib.utils import clean_text, format_context
+from lib.wikipedia import _get_chunks, _parse_extract
+from settings import settings
+
+BASELINE = ROOT / "benchmarks" / "baseline.json"
+BATCH_SIZE = 16
+CALIBRATION_TEXT = " ".join(f"word{i}" for i in range(500))
+
+
+class Benchmark(NamedTuple):
+    name: str
+    items: int
+    run: Callable[[], object]
+
+
+class Result(NamedTuple):
+    items: int
+    seconds: float
+    peak_kib: float
+    retained_blocks: int
+    calibration_seconds: float = 0.0  # filled in once the suite has run
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds
+
+    @property
+    def relative(self) -> float:
+        """Items per calibration loop, comparable between runs"""
+        return self.throughput * self.calibration_seconds
+
+
+def fake_transport() -> httpx.MockTransport:
+    """Chat completions answered from a hash of the prompt, with usage"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        prompt = body["messages"][0]["content"]
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        content = json.dumps(
+            {"question": f"What is {digest[:8]}?", "answer": digest[8:24]}
+        )
+        return httpx.Response(
+            200,
+            json={
+                "id": digest,
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (len(prompt) + len(content)) // 4,
+                },
+            },
+        )
+
+    return httpx.MockTransport(handler)
+
+
+def extract(article: Article) -> str:
+    """Plain-text extract with `== Heading ==` markers, as fetched"""
+    parts = [article.summary]
+    for chunk in article.chunks:
+        marks = "=" * (chunk["level"] + 1)
+        parts.append(f"{marks} {chunk['heading']} {marks}\n{chunk['content']}")
+    return "\n\n".join(parts)
+
+
+def benchmarks(articles: list[Article]) -> list[Benchmark]:
+    texts = [a.summary for a in articles] + [
+        c["content"] for a in articles for c in a.chunks
+    ]
+    sections = [_parse_extract(extract(a))[1] for a in articles]
+    contexts = [
+        a.chunks[i : i + 3] for a in articles for i in range(len(a.chunks))
+    ]
+    prompts = [build_prompt("factual", context[:1]) for context in contexts]
+    batches = [
+        prompts[i : i + BATCH_SIZE] for i in range(0, len(prompts), BATCH_SIZE)
+    ]
+    client = AsyncOpenAIClient(
+        base_url="http://fake/v1", max_retries=0, transport=fake_transport()
+    )
+
+    def generate() -> list:
+        return [generate_batch(b, client, use_cache=False) for b in batches]
+
+    return [
+        Benchmark(
+            "clean_text",
+            len(texts),
+            lambda: [clean_text(t) for t in texts],
+        ),
+        Benchmark(
+            "chunk_text",
+            len(texts),
+            lambda: [chunk_text(t, settings.CHUNK_TOKENS) for t in texts],
+        ),
+        Benchmark(
+            "get_chunks",
+            len(sections),
+            lambda: [_get_chunks(s, settings.CHUNK_TOKENS) for s in sections],
+        ),
+        Benchmark(
+            "format_context",
+            len(contexts),
+            lambda: [format_context(c) for c in contexts],
+        ),
+        Benchmark(
+            "build_prompt",
+            2 * len(contexts),
+            lambda: [
+                build_prompt(type_q, c)
+                for c in contexts
+                for type_q in ["factual", "multihop"]
+            ],
+        ),
+        Benchmark(
+            "pack_prompt",
+            len(contexts),
+            lambda: [pack_prompt("multihop", c) for c in contexts],
+        ),
+        Benchmark("generate", len(prompts), generate),
+    ]
+
+
+def calibrate() -> int:
+    """A fixed pure-Python loop of string operations and calls"""
+    total = 0
+    for _ in range(50):
+        for word in CALIBRATION_TEXT.split():
+            total += len(word.upper().replace("word", "w"))
+    return total
+
+
+def best_time(fn: Callable[[], object], repeat: int) -> float:
+    """
+    Least CPU seconds per call out of `repeat` rounds, each one long enough
+    (0.2s) to time reliably
+    """
+    timer = timeit.Timer(fn, timer=time.process_time)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def time_run(benchmark: Benchmark, repeat: int) -> float:
+    def run() -> None:
+        count_encoded.cache_clear()  # every call counts its own tokens
+        benchmark.run()
+
+    return best_time(run, repeat)
+
+
+def measure(benchmark: Benchmark, repeat: int) -> Result:
+    best = time_run(benchmark, repeat)
+
+    # memory in a separate run, tracing slows everything down
+    count_encoded.cache_clear()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        result = benchmark.run()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    retained = sum(
+        max(stat.count_diff, 0) for stat in after.compare_to(before, "filename")
+    )
+    return Result(benchmark.items, best, peak / 1024, retained)
+
+
+def compare(
+    name: str,
+    result: Result,
+    baseline: dict,
+    tolerance: float,
+    memory_tolerance: float,
+    retained_tolerance: float,
+) -> list[str]:
+    """Regressions of a result against its baseline entry"""
+    if baseline.get("items") != result.items:
+        return []  # another corpus or limit, not comparable
+    problems = []
+    if result.relative < baseline["relative"] * (1 - tolerance):
+        problems.append(
+            f"{name}: relative throughput {result.relative:,.1f} is "
+            f"{1 - result.relative / baseline['relative']:.0%} below "
+            f"the baseline {baseline['relative']:,.1f}"
+        )
+    for field, allowed in [
+        ("peak_kib", memory_tolerance),
+        ("retained_blocks", retained_tolerance),
+    ]:
+        value, limit = getattr(result, field), baseline[field]
+        if value > limit * (1 + allowed) and value - limit > 64:
+            problems.append(
+                f"{name}: {field} {value:,.0f} is "
+                f"{value / limit - 1:.0%} above the baseline {limit:,.0f}"
+            )
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--corpus", type=Path, default=ROOT / "dataset" / "wiki_doc.jsonl"
+    )
+    parser.add_argument("--limit", type=int, help="use the first N articles")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="comma-separated benchmark names")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument(
+        "--save", action="store_true", help="write the results as baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="allowed relative throughput drop (default: 0.3)",
+    )
+    parser.add_argument(
+        "--memory-tolerance",
+        type=float,
+        default=0.1,
+        help="allowed peak memory growth (default: 0.1)",
+    )
+    parser.add_argument(
+        "--retained-tolerance",
+        type=float,
+        default=0.1,
+        help="allowed retained blocks growth (default: 0.1)",
+    )
+    args = parser.parse_args()
+
+    # offline and comparable between machines: no tokenizer download, no
+    # caches, the dev backend (served by the fake transport)
+    settings.TOKENIZER = "approx"
+    settings.ENVIRONMENT = "dev"
+    llm_module.get_response_cache = lambda: None
+
+    articles = list(load_articles(args.corpus))[: args.limit]
+    selected = args.only.split(",") if args.only else None
+    suite = [
+        b for b in benchmarks(articles) if not selected or b.name in selected
+    ]
+    baseline = (
+        json.loads(args.baseline.read_text("utf-8"))["results"]
+        if args.baseline.exists() and not args.save
+        else {}
+    )
+
+    # the speed of this machine: the fastest calibration rounds, run between
+    # the benchmarks so they see the same load
+    calibration = best_time(calibrate, args.repeat)
+    results: dict[str, Result] = {}
+    for benchmark in suite:
+        results[benchmark.name] = measure(benchmark, args.repeat)
+        calibration = min(calibration, best_time(calibrate, args.repeat))
+    for benchmark in suite:
+        result = results[benchmark.name]._replace(
+            calibration_seconds=calibration
+        )
+        base = baseline.get(benchmark.name)
+        if base and result.relative < base["relative"] * (1 - args.tolerance):
+            # one slow round is noise more often than a regression
+            seconds = time_run(benchmark, args.repeat)
+            result = result._replace(seconds=min(result.seconds, seconds))
+        results[benchmark.name] = result
+
+    print(f"{len(articles)} articles from {args.corpus.name}")
+    print(f"calibration loop: {calibration * 1000:.2f} CPU ms")
+    print(
+        f"{'benchmark':<15}{'items':>8}{'CPU ms':>10}{'items/s':>12}"
+        f"{'relative':>10}{'peak KiB':>11}{'retained':>10}{'vs baseline':>13}"
+    )
+    problems: list[str] = []
+    for benchmark in suite:
+        result = results[benchmark.name]
+        base = baseline.get(benchmark.name)
+        change = (
+            f"{result.relative / base['relative'] - 1:+.0%}"
+            if base and base["items"] == result.items
+            else "-"
+        )
+        print(
+            f"{benchmark.name:<15}{result.items:>8}"
+            f"{result.seconds * 1000:>10.1f}{result.throughput:>12,.0f}"
+            f"{result.relative:>10.4g}{result.peak_kib:>11,.0f}"
+            f"{result.retained_blocks:>10,}{change:>13}"
+        )
+        if base:
+            problems += compare(
+                benchmark.name,
+                result,
+                base,
+                args.tolerance,
+                args.memory_tolerance,
+                args.retained_tolerance,
+            )
+
+    if args.save:
+        record = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "corpus": args.corpus.name,
+            "results": {
+                name: {
+                    "items": r.items,
+                    "seconds": round(r.seconds, 6),
+                    "throughput": round(r.throughput, 1),
+                    "relative": float(f"{r.relative:.4g}"),
+                    "peak_kib": round(r.peak_kib, 1),
+                    "retained_blocks": r.retained_blocks,
+                }
+                for name, r in results.items()
+            },
+        }
+        args.baseline.write_text(json.dumps(record, indent=2) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+    elif problems:
+        print("\nRegressions:", *problems, sep="\n  ")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Convert articles between wiki_doc.jsonl and the memory-mapped corpus format.
+
+Usage:
+    python src/convert.py dataset/wiki_doc.jsonl dataset/wiki_doc.corpus
+    python src/convert.py dataset/wiki_doc.corpus wiki_doc.jsonl
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from lib.corpus import corpus_to_jsonl, jsonl_to_corpus
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("src", help="JSONL file or corpus directory")
+    parser.add_argument("dst")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if Path(args.src).is_dir():
+        n = corpus_to_jsonl(args.src, args.dst)
+    else:
+        n = jsonl_to_corpus(args.src, args.dst)
+    print(
+        f"{n} articles written to {args.dst}"
+        f" in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
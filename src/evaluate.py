@@ -0,0 +1,62 @@
+"""
+Score ranked retrieval results against the gold chunks of a QA dataset.
+
+The runs file has one JSON object per query, in any order:
+
+    {"id": 0, "chunks": [4, 2, 7]}
+    {"question": "What is ...?", "chunks": [["Prime number", 4], 1]}
+
+`id` is the line number of the pair in the QA file (or match on
+`question`); `chunks` are the retrieved chunks, best first.
+
+Usage:
+    python src/evaluate.py dataset/wiki_qa.jsonl runs.jsonl --k 1 5 10
+"""
+
+import argparse
+import json
+
+from lib.metrics import GROUPS, METRICS, evaluate_files
+
+
+def format_table(rows: dict[str, dict[str, float]], ks: list[int]) -> str:
+    header = ["", "n"] + [f"{m}@{k}" for m in METRICS for k in ks]
+    lines = [header]
+    for name, row in rows.items():
+        lines.append(
+            [name, str(row.get("queries", ""))]
+            + [f"{row[f'{m}@{k}']:.4f}" for m in METRICS for k in ks]
+        )
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.ljust(w) for cell, w in zip(line, widths)).rstrip()
+        for line in lines
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("qa", help="QA dataset (wiki_qa.jsonl)")
+    parser.add_argument("runs", help="ranked retrieval results (JSONL)")
+    parser.add_argument("--k", nargs="+", type=int, default=[1, 3, 5, 10])
+    parser.add_argument(
+        "--by", nargs="*", choices=GROUPS, default=GROUPS, help="breakdowns"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print the full report as JSON"
+    )
+    args = parser.parse_args()
+
+    report = evaluate_files(args.qa, args.runs, ks=args.k, groups=args.by)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    overall = {"overall": {"queries": report["queries"]} | report["overall"]}
+    print(format_table(overall, args.k))
+    for group in args.by:
+        print(f"\nby {group}")
+        print(format_table(report[group], args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import NamedTuple
+
+from lib.llm import SharedClient, generate_batch, shared_client
+from lib.types import QAFormat
+from settings import settings
+
+
+class Request(NamedTuple):
+    prompt: str
+    params: dict
+    use_cache: bool
+    future: Future
+
+
+class MicroBatcher:
+    """
+    Coalesces generation requests from concurrent callers (e.g. UI
+    sessions) into shared engine calls.
+
+    A single worker thread takes the first waiting request, collects more
+    for up to `window` seconds or until `max_batch` are waiting, and runs
+    them as one `generate_batch` call; every caller gets its own result
+    through a future. The engine is only ever called from that thread.
+    """
+
+    def __init__(
+        self,
+        client: SharedClient,
+        max_batch: int = settings.BATCH_MAX_SIZE,
+        window: float = settings.BATCH_WINDOW_MS / 1000,
+    ) -> None:
+        self.client = client
+        self.max_batch = max_batch
+        self.window = window
+        self._queue: queue.Queue[Request] = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+
+    def submit(
+        self, prompt: str, params: dict = {}, use_cache: bool = True
+    ) -> "Future[QAFormat]":
+        future: Future[QAFormat] = Future()
+        self._queue.put(Request(prompt, params, use_cache, future))
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="llm-batcher", daemon=True
+                )
+                self._worker.start()
+        return future
+
+    def generate(
+        self,
+        prompt: str,
+        params: dict = {},
+        use_cache: bool = True,
+        timeout: float | None = None,
+    ) -> QAFormat:
+        """Like `llm.generate`, sharing the engine call with other callers"""
+        return self.submit(prompt, params, use_cache).result(timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(
+                        self._queue.get(timeout=remaining)
+                        if remaining > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: list[Request]) -> None:
+        # requests only share a call with the same sampling params
+        groups: dict[tuple[str, bool], list[Request]] = {}
+        for request in batch:
+            if request.future.set_running_or_notify_cancel():
+                key = (
+                    json.dumps(request.params, sort_keys=True),
+                    request.use_cache,
+                )
+                groups.setdefault(key, []).append(request)
+        for requests in groups.values():
+            try:
+                results = generate_batch(
+                    [r.prompt for r in requests],
+                    self.client.get(),
+                    requests[0].params,
+                    requests[0].use_cache,
+                )
+            except Exception as e:
+                results = [e] * len(requests)
+            for request, result in zip(requests, results):
+                if isinstance(result, Exception):
+                    request.future.set_exception(result)
+                else:
+                    request.future.set_result(result)
+
+
+shared_batcher = MicroBatcher(shared_client)
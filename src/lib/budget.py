@@ -0,0 +1,87 @@
+from typing import NamedTuple
+
+from lib.chunker import chunk_text
+from lib.prompt import build_prompt
+from lib.tokenizer import count_tokens
+from lib.types import Chunk
+from settings import settings
+
+# Room left for what the serving side wraps around a prompt (chat template,
+# special tokens)
+TEMPLATE_RESERVE = 16
+
+
+class PackedPrompt(NamedTuple):
+    """A prompt filled with as much of the selected context as fits"""
+
+    prompt: str
+    tokens: int
+    kept: list[int]  # positions in the selection that made it in
+    trimmed: list[int]  # kept, but only their first sentences
+    dropped: list[int]
+
+
+def prompt_budget(max_tokens: int = 100) -> int:
+    """Prompt tokens available once `max_tokens` are reserved for the output"""
+    return settings.CTX_WINDOW - max_tokens - TEMPLATE_RESERVE
+
+
+def check_prompt(prompt: str, max_tokens: int = 100) -> ValueError | None:
+    tokens = count_tokens(prompt)
+    if tokens > prompt_budget(max_tokens):
+        return ValueError(
+            f"Prompt too large: {tokens} tokens + {max_tokens} to generate "
+            f"don't fit in CTX_WINDOW={settings.CTX_WINDOW}"
+        )
+    return None
+
+
+def pack_prompt(
+    type_q: str, context: list[Chunk], max_tokens: int = 100
+) -> PackedPrompt:
+    """
+    Build the prompt for `type_q` with the chunks in order while they fit
+    the token budget. The first chunk that doesn't fit is cut to its
+    leading sentences and the ones after it are dropped. Every candidate
+    prompt is measured whole, so the result always passes `check_prompt`.
+    """
+    budget = prompt_budget(max_tokens)
+    if count_tokens(build_prompt(type_q, [])) > budget:
+        raise ValueError(
+            f"CTX_WINDOW={settings.CTX_WINDOW} is too small for the prompt"
+        )
+
+    chunks: list[Chunk] = []
+    kept: list[int] = []
+    trimmed: list[int] = []
+    for i, chunk in enumerate(context):
+        if count_tokens(build_prompt(type_q, [*chunks, chunk])) <= budget:
+            chunks.append(chunk)
+            kept.append(i)
+            continue
+
+        # room for the content, then less by what the prompt still overflows
+        empty: Chunk = {**chunk, "content": ""}
+        room = budget - count_tokens(build_prompt(type_q, [*chunks, empty]))
+        while room > 0:
+            spans = chunk_text(chunk["content"], room, count=count_tokens)
+            if not spans:
+                break
+            candidate = [*chunks, {**chunk, "content": spans[0].text}]
+            over = count_tokens(build_prompt(type_q, candidate)) - budget
+            if over <= 0:
+                chunks = candidate
+                kept.append(i)
+                trimmed.append(i)
+                break
+            room = min(room, spans[0].tokens) - over
+        break
+
+    prompt = build_prompt(type_q, chunks)
+    return PackedPrompt(
+        prompt=prompt,
+        tokens=count_tokens(prompt),
+        kept=kept,
+        trimmed=trimmed,
+        dropped=[i for i in range(len(context)) if i not in kept],
+    )
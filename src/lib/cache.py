@@ -0,0 +1,313 @@
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from lib.telemetry import telemetry
+from lib.types import Article, QAFormat
+from settings import settings
+
+
+def _key(*parts) -> str:
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SQLiteCache:
+    """
+    Base of the on-disk caches: a SQLite connection in WAL mode shared by
+    threads behind a lock, and least recently used eviction of the rows of
+    `table` once their sizes add up to more than `max_bytes`.
+
+    `table` needs `key`, `size` and `accessed` columns. Triggers keep the
+    total size in the `sizes` table, so neither a put nor an eviction
+    scans the whole table.
+    """
+
+    table: str
+    schema: str
+
+    def __init__(self, path: str | Path, max_bytes: int) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        table = self.table
+        self._db.executescript(
+            self.schema
+            + f"""
+            CREATE TABLE IF NOT EXISTS sizes (
+                name TEXT PRIMARY KEY,
+                total INTEGER NOT NULL
+            );
+            -- counted once, for files written before the triggers existed
+            INSERT OR IGNORE INTO sizes
+                SELECT '{table}', COALESCE(SUM(size), 0) FROM {table};
+            CREATE TRIGGER IF NOT EXISTS {table}_size_insert
+                AFTER INSERT ON {table} BEGIN
+                    UPDATE sizes SET total = total + NEW.size
+                    WHERE name = '{table}';
+                END;
+            CREATE TRIGGER IF NOT EXISTS {table}_size_update
+                AFTER UPDATE OF size ON {table} BEGIN
+                    UPDATE sizes SET total = total + NEW.size - OLD.size
+                    WHERE name = '{table}';
+                END;
+            CREATE TRIGGER IF NOT EXISTS {table}_size_delete
+                AFTER DELETE ON {table} BEGIN
+                    UPDATE sizes SET total = total - OLD.size
+                    WHERE name = '{table}';
+                END;
+            """
+        )
+
+    def _upsert(self, **row) -> None:
+        """Insert the row or replace the one with the same key, then evict"""
+        columns = ", ".join(row)
+        values = ", ".join("?" * len(row))
+        updates = ", ".join(f"{c} = excluded.{c}" for c in row if c != "key")
+        self._db.execute(
+            f"INSERT INTO {self.table} ({columns}) VALUES ({values})"
+            f" ON CONFLICT (key) DO UPDATE SET {updates}",
+            tuple(row.values()),
+        )
+        self._evict()
+
+    def _touch(self, key: str, now: float) -> None:
+        self._db.execute(
+            f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key)
+        )
+
+    def total_size(self) -> int:
+        (total,) = self._db.execute(
+            "SELECT total FROM sizes WHERE name = ?", (self.table,)
+        ).fetchone()
+        return total
+
+    def _evict(self) -> None:
+        excess = self.total_size() - self.max_bytes
+        if excess <= 0:
+            return
+        # walk the oldest rows (through the `accessed` index) only until
+        # they free enough, then drop them in one statement
+        n = 0
+        for (size,) in self._db.execute(
+            f"SELECT size FROM {self.table} ORDER BY accessed"
+        ):
+            n += 1
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.execute(
+            f"DELETE FROM {self.table} WHERE key IN"
+            f" (SELECT key FROM {self.table} ORDER BY accessed LIMIT ?)",
+            (n,),
+        )
+
+
+class ArticleCache(SQLiteCache):
+    """
+    On-disk cache of cleaned and chunked articles (SQLite).
+
+    Entries are keyed by (title, language, revision id, chunking params), so
+    an edit on Wikipedia or a different chunk size never serves stale data.
+    The last seen revision of every (title, language) is remembered for
+    `ttl` seconds, which lets `latest` answer without touching the network.
+    Least recently used entries are evicted once the stored articles exceed
+    `max_bytes`.
+    """
+
+    table = "articles"
+    schema = """
+            CREATE TABLE IF NOT EXISTS articles (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS articles_accessed ON articles (accessed);
+            CREATE TABLE IF NOT EXISTS revisions (
+                title TEXT NOT NULL,
+                language TEXT NOT NULL,
+                revid INTEGER NOT NULL,
+                checked REAL NOT NULL,
+                PRIMARY KEY (title, language)
+            );
+            """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_bytes: int = 512 * 2**20,
+        ttl: float = 24 * 3600,
+    ) -> None:
+        self.ttl = ttl
+        super().__init__(path, max_bytes)
+
+    def get(
+        self,
+        title: str,
+        language: str,
+        revid: int,
+        params: dict,
+        checked: bool = True,
+    ) -> Article | None:
+        """
+        Cached article for a revision. `checked` means `revid` was just read
+        from Wikipedia, which restarts the `ttl` of `latest`
+        """
+        key = _key(title, language, revid, params)
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT data FROM articles WHERE key = ?", (key,)
+            ).fetchone()
+            telemetry.inc(
+                "cache_requests_total",
+                cache="article",
+                result="miss" if row is None else "hit",
+            )
+            if row is None:
+                return None
+            self._touch(key, time.time())
+            if checked:
+                self._set_revision(title, language, revid)
+        return Article.model_validate_json(zlib.decompress(row[0]))
+
+    def latest(self, title: str, language: str, params: dict) -> Article | None:
+        """
+        Cached article for the last revision checked less than `ttl` ago.
+        Reading it doesn't count as a check, so it expires `ttl` seconds
+        after the last fetch however often it is read
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT revid FROM revisions"
+                " WHERE title = ? AND language = ? AND checked > ?",
+                (title, language, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        return self.get(title, language, row[0], params, checked=False)
+
+    def put(
+        self, title: str, language: str, revid: int, params: dict, article: Article
+    ) -> None:
+        data = zlib.compress(article.model_dump_json().encode("utf-8"))
+        with self._lock, self._db:
+            self._set_revision(title, language, revid)
+            self._upsert(
+                key=_key(title, language, revid, params),
+                data=data,
+                size=len(data),
+                accessed=time.time(),
+            )
+
+    def _set_revision(self, title: str, language: str, revid: int) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO revisions VALUES (?, ?, ?, ?)",
+            (title, language, revid, time.time()),
+        )
+
+
+@functools.cache
+def get_article_cache() -> ArticleCache | None:
+    """Shared article cache, disabled with `ARTICLE_CACHE_MB=0`"""
+    if settings.ARTICLE_CACHE_MB <= 0:
+        return None
+    return ArticleCache(
+        Path(settings.CACHE_DIR) / "articles.db",
+        max_bytes=settings.ARTICLE_CACHE_MB * 2**20,
+        ttl=settings.ARTICLE_CACHE_TTL,
+    )
+
+
+class ResponseCache(SQLiteCache):
+    """
+    On-disk cache of generated Q/A pairs (SQLite).
+
+    Entries are keyed by a hash of (model, prompt, sampling params, output
+    schema), so any change to one of them is a miss. Entries older than
+    `ttl` seconds are ignored and least recently used ones are evicted once
+    the stored responses exceed `max_bytes`. WAL mode and a busy timeout let
+    several worker processes share the same file.
+    """
+
+    table = "responses"
+    schema = """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_accessed
+                ON responses (accessed);
+            CREATE INDEX IF NOT EXISTS responses_created
+                ON responses (created);
+            """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_bytes: int = 256 * 2**20,
+        ttl: float = 30 * 24 * 3600,
+    ) -> None:
+        self.ttl = ttl
+        super().__init__(path, max_bytes)
+
+    @staticmethod
+    def key(model: str, prompt: str, params: dict) -> str:
+        return _key(model, prompt, params, QAFormat.model_json_schema())
+
+    def get(self, model: str, prompt: str, params: dict) -> QAFormat | None:
+        key = self.key(model, prompt, params)
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT data FROM responses WHERE key = ? AND created > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            telemetry.inc(
+                "cache_requests_total",
+                cache="response",
+                result="miss" if row is None else "hit",
+            )
+            if row is None:
+                return None
+            self._touch(key, now)
+        return QAFormat.model_validate_json(row[0])
+
+    def put(
+        self, model: str, prompt: str, params: dict, response: QAFormat
+    ) -> None:
+        data = response.model_dump_json()
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM responses WHERE created <= ?", (now - self.ttl,)
+            )
+            self._upsert(
+                key=self.key(model, prompt, params),
+                data=data,
+                size=len(data),
+                created=now,
+                accessed=now,
+            )
+
+
+@functools.cache
+def get_response_cache() -> ResponseCache | None:
+    """Shared response cache, disabled with `RESPONSE_CACHE_MB=0`"""
+    if settings.RESPONSE_CACHE_MB <= 0:
+        return None
+    return ResponseCache(
+        Path(settings.CACHE_DIR) / "responses.db",
+        max_bytes=settings.RESPONSE_CACHE_MB * 2**20,
+        ttl=settings.RESPONSE_CACHE_TTL,
+    )
@@ -0,0 +1,111 @@
+import re
+from collections.abc import Callable
+from typing import NamedTuple
+
+from lib.tokenizer import count_tokens
+
+# Coarsest to finest places to break a text at
+SEPARATORS = [
+    re.compile(r"\s*\n\s*\n\s*"),  # paragraphs
+    re.compile(r"(?<=[.!?])\s+"),  # sentences
+    re.compile(r"\s+"),  # words
+]
+
+
+class TextSpan(NamedTuple):
+    """A chunk of a text and where it comes from"""
+
+    text: str
+    start: int
+    end: int
+    tokens: int
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int,
+    overlap: int = 0,
+    count: Callable[[str], int] = count_tokens,
+) -> list[TextSpan]:
+    """
+    Split text into chunks of at most `max_tokens` tokens, breaking at
+    paragraphs, then sentences, then words.
+
+    The text is cut into the largest pieces that fit, which are then packed
+    greedily, measuring every slice whole (separators included); every
+    chunk is a single slice of `text`, so
+    `text[span.start:span.end] == span.text`. Consecutive chunks repeat up
+    to `overlap` tokens worth of trailing pieces, and every chunk has at
+    least one piece the previous one didn't.
+    """
+    if overlap >= max_tokens:
+        raise ValueError("overlap must be smaller than max_tokens")
+    start = len(text) - len(text.lstrip())
+    end = len(text.rstrip())
+    if start >= end:
+        return []
+    pieces = _pieces(text, start, end, max_tokens, count)
+
+    spans: list[TextSpan] = []
+    i = fresh = 0  # first piece of the chunk, first one not chunked yet
+    while True:
+        # the slice with one new piece always fits (see the carry below),
+        # then grow it while the whole slice, separators included, fits
+        start = pieces[i][0]
+        j = fresh + 1
+        tokens = count(text[start : pieces[j - 1][1]])
+        while j < len(pieces):
+            grown = count(text[start : pieces[j][1]])
+            if grown > max_tokens:
+                break
+            tokens = grown
+            j += 1
+        end = pieces[j - 1][1]
+        spans.append(TextSpan(text[start:end], start, end, tokens))
+        if j == len(pieces):
+            return spans
+
+        # carry trailing pieces over while the slice up to the next new
+        # piece still fits
+        k, carried = j, 0
+        while (
+            k - 1 > i
+            and carried + pieces[k - 1][2] <= overlap
+            and count(text[pieces[k - 1][0] : pieces[j][1]]) <= max_tokens
+        ):
+            k -= 1
+            carried += pieces[k][2]
+        i, fresh = k, j
+
+
+def _pieces(
+    text: str,
+    start: int,
+    end: int,
+    max_tokens: int,
+    count: Callable[[str], int],
+    level: int = 0,
+) -> list[tuple[int, int, int]]:
+    """`(start, end, tokens)` of the largest pieces of `text` that fit"""
+    tokens = count(text[start:end])
+    if tokens <= max_tokens:
+        return [(start, end, tokens)]
+    if level == len(SEPARATORS):
+        # a single "word" over the budget: cut it proportionally
+        size = max(1, (end - start) * max_tokens // tokens)
+        return [
+            (i, min(i + size, end), count(text[i : min(i + size, end)]))
+            for i in range(start, end, size)
+        ]
+
+    pieces = []
+    last = start
+    for match in SEPARATORS[level].finditer(text, start, end):
+        if match.start() > last:
+            pieces += _pieces(
+                text, last, match.start(), max_tokens, count, level + 1
+            )
+        last = match.end()
+    if last < end:
+        pieces += _pieces(text, last, end, max_tokens, count, level + 1)
+    return pieces
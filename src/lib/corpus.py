@@ -0,0 +1,185 @@
+import json
+import mmap
+import os
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import numpy as np
+
+from lib.sink import read_jsonl
+from lib.types import Article, Chunk
+
+CORPUS_VERSION = 1
+# strings are (offset, length) slices of the UTF-8 heap
+ARTICLE_DTYPE = np.dtype(
+    [
+        ("title", "<i8", 2),
+        ("source", "<i8", 2),
+        ("language", "<i8", 2),
+        ("summary", "<i8", 2),
+        ("first_chunk", "<i8"),
+        ("n_chunks", "<i8"),
+    ]
+)
+CHUNK_DTYPE = np.dtype(
+    [
+        ("heading", "<i8", 2),
+        ("content", "<i8", 2),
+        ("level", "<i8"),
+        ("article", "<i8"),
+    ]
+)
+
+
+def write_corpus(articles: Iterable[Article], path: str | Path) -> int:
+    """
+    Write articles to a corpus directory: `heap.bin` with every string,
+    `articles.npy` and `chunks.npy` tables pointing into it. Strings are
+    streamed to the heap; only the fixed-size table rows stay in memory.
+    Returns the number of articles.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    article_rows: list[tuple] = []
+    chunk_rows: list[tuple] = []
+    with open(path / "heap.bin", "wb") as heap:
+        offset = 0
+
+        def put(text: str) -> tuple[int, int]:
+            nonlocal offset
+            data = text.encode("utf-8")
+            heap.write(data)
+            offset += len(data)
+            return offset - len(data), len(data)
+
+        for article in articles:
+            first_chunk = len(chunk_rows)
+            for chunk in article.chunks:
+                chunk_rows.append(
+                    (
+                        put(chunk["heading"]),
+                        put(chunk["content"]),
+                        chunk["level"],
+                        len(article_rows),
+                    )
+                )
+            article_rows.append(
+                (
+                    put(article.title),
+                    put(article.source),
+                    put(article.language),
+                    put(article.summary),
+                    first_chunk,
+                    len(article.chunks),
+                )
+            )
+    np.save(path / "articles.npy", np.array(article_rows, dtype=ARTICLE_DTYPE))
+    np.save(path / "chunks.npy", np.array(chunk_rows, dtype=CHUNK_DTYPE))
+    meta = {
+        "version": CORPUS_VERSION,
+        "articles": len(article_rows),
+        "chunks": len(chunk_rows),
+    }
+    (path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    return len(article_rows)
+
+
+class Corpus:
+    """
+    Read-only, memory-mapped view of a corpus directory (`write_corpus`).
+
+    Opening it reads nothing but `meta.json`; `article(j)` and
+    `chunk(j, i)` decode just the strings they return, so a job touching
+    a few chunks doesn't pay for the rest of the corpus.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text("utf-8"))
+        if meta["version"] != CORPUS_VERSION:
+            raise ValueError(
+                f"Unsupported corpus version {meta['version']} in {path}"
+            )
+        self.articles = np.load(self.path / "articles.npy", mmap_mode="r")
+        self.chunks = np.load(self.path / "chunks.npy", mmap_mode="r")
+        with open(self.path / "heap.bin", "rb") as f:
+            self._heap = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if f.seek(0, 2)
+                else b""
+            )
+        self._titles: dict[tuple[str, str], int] | None = None
+
+    def __len__(self) -> int:
+        return len(self.articles)
+
+    def __iter__(self) -> Iterator[Article]:
+        for j in range(len(self)):
+            yield self.article(j)
+
+    def _str(self, span) -> str:
+        start, length = int(span[0]), int(span[1])
+        return self._heap[start : start + length].decode("utf-8")
+
+    def title(self, j: int) -> str:
+        return self._str(self.articles[j]["title"])
+
+    def language(self, j: int) -> str:
+        return self._str(self.articles[j]["language"])
+
+    def n_chunks(self, j: int) -> int:
+        return int(self.articles[j]["n_chunks"])
+
+    def chunk(self, j: int, i: int) -> Chunk:
+        """Chunk `i` of article `j`"""
+        row = self.articles[j]
+        if not 0 <= i < row["n_chunks"]:
+            raise IndexError(f"article {j} has no chunk {i}")
+        chunk = self.chunks[int(row["first_chunk"]) + i]
+        return Chunk(
+            heading=self._str(chunk["heading"]),
+            level=int(chunk["level"]),
+            content=self._str(chunk["content"]),
+        )
+
+    def article(self, j: int) -> Article:
+        row = self.articles[j]
+        return Article(
+            title=self._str(row["title"]),
+            source=self._str(row["source"]),
+            language=self._str(row["language"]),
+            chunks=[self.chunk(j, i) for i in range(int(row["n_chunks"]))],
+            summary=self._str(row["summary"]),
+        )
+
+    def find(self, title: str, language: str) -> int | None:
+        """Index of an article (decodes the titles once)"""
+        if self._titles is None:
+            self._titles = {
+                (self.title(j), self.language(j)): j for j in range(len(self))
+            }
+        return self._titles.get((title, language))
+
+
+def jsonl_to_corpus(src: str | Path, dst: str | Path) -> int:
+    return write_corpus(
+        (Article.model_validate(record) for record in read_jsonl(src)), dst
+    )
+
+
+def corpus_to_jsonl(src: str | Path, dst: str | Path) -> int:
+    corpus = Corpus(src)
+    tmp = Path(f"{dst}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(article.model_dump_json() + "\n" for article in corpus)
+    os.replace(tmp, dst)
+    return len(corpus)
+
+
+def load_articles(path: str | Path) -> Iterator[Article]:
+    """Articles of a corpus directory or a `wiki_doc.jsonl` file"""
+    if Path(path).is_dir():
+        yield from Corpus(path)
+    else:
+        for record in read_jsonl(path):
+            yield Article.model_validate(record)
@@ -0,0 +1,137 @@
+import functools
+import re
+import threading
+import zlib
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from lib.sink import read_jsonl
+from lib.types import QA
+from settings import settings
+
+RE_WORD = re.compile(r"\w+")
+MERSENNE = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingles(text: str, n: int = 5) -> set[str]:
+    """Character n-grams of the text, ignoring case and punctuation"""
+    text = " ".join(RE_WORD.findall(text.casefold()))
+    return {text[i : i + n] for i in range(max(1, len(text) - n + 1))}
+
+
+def lsh_params(threshold: float, num_perm: int) -> tuple[int, int]:
+    """
+    Bands and rows per band whose S-curve `1 - (1 - s^r)^b` best separates
+    similarities above and below `threshold` (least false positive plus
+    false negative area).
+    """
+    s = np.linspace(0, 1, 201)
+    best, params = np.inf, (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        p = 1 - (1 - s**rows) ** bands
+        error = np.where(s < threshold, p, 1 - p).mean()
+        if error < best:
+            best, params = error, (bands, rows)
+    return params
+
+
+class DuplicateIndex:
+    """
+    Incremental near-duplicate detector: MinHash signatures of the texts
+    in an LSH index (`bands` buckets per text).
+
+    A new text is only compared with the texts sharing a bucket with it,
+    so checking one costs about the same however many were added. Texts
+    only match within the same `scope`, e.g. the same article.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.6,
+        num_perm: int = 128,
+        seed: int = 1,
+    ) -> None:
+        self.threshold = threshold
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE, num_perm, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self._buckets: dict[tuple, list[int]] = defaultdict(list)
+        self._signatures: list[np.ndarray] = []
+        self.texts: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles(text)), np.uint64
+        )
+        # overflow of the product is part of the hash
+        with np.errstate(over="ignore"):
+            permuted = (hashes[:, None] * self._a + self._b) % MERSENNE
+        return (permuted & MAX_HASH).min(axis=0).astype(np.uint32)
+
+    def find(self, text: str, scope: str = "") -> str | None:
+        """The most similar text added before, if above the threshold"""
+        with self._lock:
+            return self._find(self.signature(text), scope)[0]
+
+    def add(self, text: str, scope: str = "") -> str | None:
+        """
+        Add `text` unless it is a near-duplicate; then return the text it
+        duplicates instead
+        """
+        signature = self.signature(text)
+        with self._lock:
+            duplicate, keys = self._find(signature, scope)
+            if duplicate is None:
+                for key in keys:
+                    self._buckets[key].append(len(self.texts))
+                self._signatures.append(signature)
+                self.texts.append(text)
+            return duplicate
+
+    def add_qa(self, qa: QA | dict) -> str | None:
+        """`add` the question of a pair, scoped to its article"""
+        if isinstance(qa, QA):
+            qa = qa.model_dump()
+        return self.add(
+            qa["question"], f"{qa['language']}:{qa['article_title']}"
+        )
+
+    def _find(
+        self, signature: np.ndarray, scope: str
+    ) -> tuple[str | None, list[tuple]]:
+        r = self.rows
+        keys = [
+            (scope, band, signature[band * r : (band + 1) * r].tobytes())
+            for band in range(self.bands)
+        ]
+        candidates = {i for key in keys for i in self._buckets.get(key, ())}
+        best, similarity = None, self.threshold
+        for i in sorted(candidates):
+            estimate = np.mean(self._signatures[i] == signature)
+            if estimate >= similarity:
+                best, similarity = i, estimate
+        return (None if best is None else self.texts[best]), keys
+
+
+@functools.cache
+def get_duplicate_index(name: str) -> DuplicateIndex | None:
+    """
+    Shared index of the questions in `DATASET_DIR/<name>`, disabled with
+    `DEDUP_THRESHOLD=0`
+    """
+    if settings.DEDUP_THRESHOLD <= 0:
+        return None
+    index = DuplicateIndex(settings.DEDUP_THRESHOLD)
+    if settings.DATASET_DIR:
+        for qa in read_jsonl(Path(settings.DATASET_DIR) / name):
+            index.add_qa(qa)
+    return index
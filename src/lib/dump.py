@@ -0,0 +1,358 @@
+import bz2
+import functools
+import html
+import json
+import mmap
+import re
+import xml.etree.ElementTree as ET
+from collections.abc import Iterator
+from pathlib import Path
+from typing import IO
+
+from lib.telemetry import telemetry
+from lib.types import Article
+from lib.wikipedia import article_from_extract
+from settings import settings
+
+RE_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+RE_REF = re.compile(r"<ref[^>/]*/>|<ref[^>]*>.*?</ref>", re.DOTALL | re.I)
+RE_MATH = re.compile(r"<math[^>]*>(.*?)</math>", re.DOTALL | re.I)
+RE_MEDIA = re.compile(
+    r"\[\[(?:File|Image|Category|Archivo|Imagen|Categoría|Anexo):", re.I
+)
+RE_LINK = re.compile(r"\[\[([^\[\]|]*)(?:\|([^\[\]]*))?\]\]")
+RE_EXT_LINK = re.compile(r"\[(?:https?:)?//[^\s\]]+\s*([^\]]*)\]")
+RE_EMPHASIS = re.compile(r"'{2,5}")
+RE_TAG = re.compile(r"<[^>]+>")
+RE_HEADING = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$", re.M)
+RE_FORMULA = re.compile(r"\x00(\d+)\x00")
+RE_LANG = re.compile(r"^([a-z_-]+?)wiki")
+
+RE_INDEX_TITLE = re.compile(rb"<page>\s*<title>(.*?)</title>", re.DOTALL)
+RE_JSON_TITLE = re.compile(rb'"title":\s*("(?:[^"\\]|\\.)*")')
+
+
+class WikiDump:
+    """
+    Local Wikipedia dump used as an article source.
+
+    Supports MediaWiki XML dumps (`.xml` or `.xml.bz2`, including the
+    multistream variant) and extracted-text dumps (JSONL with `title` and
+    `text` per line, as written by WikiExtractor `--json`). Iterating
+    streams the pages without loading the file into memory; uncompressed
+    files are memory-mapped. With an index (`offset:pageid:title` per line,
+    like the official `*-multistream-index.txt.bz2`) `get` reads a single
+    page in O(1).
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        language: str | None = None,
+        index_path: str | Path | None = None,
+        max_chunk_tokens: int = settings.CHUNK_TOKENS,
+    ) -> None:
+        self.path = Path(path)
+        match = RE_LANG.match(self.path.name)
+        self.language = language or (match.group(1) if match else "en")
+        self.max_chunk_tokens = max_chunk_tokens
+        self.index_path = Path(index_path) if index_path else None
+        self._index: dict[str, int] | None = None
+
+    @property
+    def is_xml(self) -> bool:
+        return ".xml" in self.path.suffixes
+
+    def __iter__(self) -> Iterator[Article]:
+        if self.is_xml:
+            with self._open() as f:
+                for title, wikitext in _iter_xml_pages(f):
+                    yield self._from_wikitext(title, wikitext)
+        else:
+            with self._open() as f:
+                for line in iter(f.readline, b""):
+                    if line.strip():
+                        yield self._from_json(json.loads(line))
+
+    def get(self, title: str) -> Article | None:
+        """Look up one article by title through the index"""
+        if self._index is None:
+            self._index = load_index(
+                self.index_path or index_path_for(self.path)
+            )
+        offset = self._index.get(title)
+        if offset is None:
+            return None
+
+        if self.path.suffix == ".bz2":
+            if not self.is_xml:
+                raise ValueError("Indexed lookups need an uncompressed file")
+            pages = _read_bz2_stream(self.path, offset)
+        elif self.is_xml:
+            with self._open() as mm:
+                end = mm.find(b"</page>", offset) + len(b"</page>")
+                pages = mm[offset:end]
+        else:
+            with self._open() as mm:
+                mm.seek(offset)
+                return self._from_json(json.loads(mm.readline()))
+
+        for page_title, wikitext in _iter_xml_pages(
+            [b"<pages>", pages, b"</pages>"]
+        ):
+            if page_title == title:
+                return self._from_wikitext(title, wikitext)
+        return None
+
+    def build_index(self, index_path: str | Path | None = None) -> Path:
+        """Write an `offset:pageid:title` index for an uncompressed dump"""
+        if self.path.suffix == ".bz2":
+            raise ValueError("Use the official multistream index for bz2 dumps")
+        index_path = Path(index_path or index_path_for(self.path))
+        with self._open() as mm, open(index_path, "w", encoding="utf-8") as f:
+            if self.is_xml:
+                for match in RE_INDEX_TITLE.finditer(mm):
+                    title = html.unescape(match.group(1).decode("utf-8"))
+                    f.write(f"{match.start()}:0:{title}\n")
+            else:
+                offset = 0
+                for line in iter(mm.readline, b""):
+                    if match := RE_JSON_TITLE.search(line):
+                        f.write(f"{offset}:0:{json.loads(match.group(1))}\n")
+                    offset += len(line)
+        self.index_path = index_path
+        self._index = None
+        return index_path
+
+    def _open(self) -> IO[bytes] | mmap.mmap:
+        if self.path.suffix == ".bz2":
+            return bz2.open(self.path, "rb")
+        with open(self.path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _source(self, title: str) -> str:
+        slug = title.replace(" ", "_")
+        return f"https://{self.language}.wikipedia.org/wiki/{slug}"
+
+    def _from_wikitext(self, title: str, wikitext: str) -> Article:
+        return article_from_extract(
+            title=title,
+            source=self._source(title),
+            language=self.language,
+            extract=wikitext_to_text(wikitext),
+            max_chunk_tokens=self.max_chunk_tokens,
+        )
+
+    def _from_json(self, page: dict) -> Article:
+        text = page.get("text", "")
+        if not RE_HEADING.search(text):
+            # no section markers: first paragraph as summary, the whole
+            # page as a single section
+            intro = text.strip().split("\n\n", 1)[0]
+            text = f"{intro}\n\n== {page['title']} ==\n{text}"
+        return article_from_extract(
+            title=page["title"],
+            source=page.get("url") or self._source(page["title"]),
+            language=self.language,
+            extract=RE_HEADING.sub(r"\n\n\1 \2 \1\n", text),
+            max_chunk_tokens=self.max_chunk_tokens,
+        )
+
+
+@telemetry.timed("fetch")
+def get_dump_articles(
+    title: str, langs: str | list[str] = "en"
+) -> list[Article]:
+    """
+    `get_wikipedia_article` counterpart backed by the `WIKI_DUMPS` files.
+
+    Dumps carry no langlinks, so `title` is looked up as is in the dump of
+    every language instead of following the English page to its
+    translations: it only finds pages titled the same in each language.
+    Raises `ValueError` naming the dumps that don't have it.
+    """
+    langs = [langs] if isinstance(langs, str) else langs
+    dumps = _configured_dumps()
+    missing = [lang for lang in langs if lang not in dumps]
+    if missing:
+        raise ValueError(f"No dump configured in WIKI_DUMPS for: {missing}")
+
+    articles = []
+    for lang in langs:
+        dump = dumps[lang]
+        if not (dump.index_path or index_path_for(dump.path)).exists():
+            dump.build_index()
+        if article := dump.get(title):
+            articles.append(article)
+        else:
+            missing.append(lang)
+    if missing:
+        raise ValueError(
+            f"'{title}' is not in the dump of: {missing} (dumps have no"
+            " langlinks, use the title of the page in that language)"
+        )
+    return articles
+
+
+@functools.cache
+def _configured_dumps() -> dict[str, WikiDump]:
+    """Parse `WIKI_DUMPS`, e.g. `en=/data/enwiki.xml.bz2;es=/data/es.jsonl`"""
+    dumps = {}
+    for entry in filter(None, settings.WIKI_DUMPS.split(";")):
+        lang, path = entry.split("=", 1)
+        dumps[lang.strip()] = WikiDump(path.strip(), language=lang.strip())
+    return dumps
+
+
+def index_path_for(path: str | Path) -> Path:
+    """Official multistream index next to the dump, or `<dump>.index.txt`"""
+    path = Path(path)
+    if path.name.endswith("-multistream.xml.bz2"):
+        name = path.name.replace(".xml.bz2", "-index.txt.bz2")
+        return path.with_name(name)
+    return Path(f"{path}.index.txt")
+
+
+def load_index(index_path: str | Path) -> dict[str, int]:
+    """Read an `offset:pageid:title` index into a title -> offset map"""
+    index_path = Path(index_path)
+    opener = bz2.open if index_path.suffix == ".bz2" else open
+    index = {}
+    with opener(index_path, "rt", encoding="utf-8") as f:
+        for line in f:
+            offset, _, title = line.rstrip("\n").split(":", 2)
+            index[title] = int(offset)
+    return index
+
+
+def wikitext_to_text(wikitext: str) -> str:
+    """
+    Reduce wikitext to the plain text format of the TextExtracts API:
+    markup removed, math kept as `{\\displaystyle ...}` and headings as
+    `== Heading ==` lines.
+    """
+    text = RE_COMMENT.sub("", wikitext)
+    text = RE_REF.sub("", text)
+    # keep LaTeX out of the way of the template stripping ({{ and }} are
+    # common inside formulas) and put it back at the end
+    formulas: list[str] = []
+
+    def hide_math(match: re.Match) -> str:
+        formulas.append(f"{{\\displaystyle {match.group(1).strip()}}}")
+        return f"\x00{len(formulas) - 1}\x00"
+
+    text = RE_MATH.sub(hide_math, text)
+    text = _strip_nested(text, "{{", "}}")
+    text = _strip_nested(text, "{|", "|}")
+    text = _strip_media_links(text)
+    text = RE_LINK.sub(lambda m: m.group(2) or m.group(1), text)
+    text = RE_EXT_LINK.sub(r"\1", text)
+    text = RE_EMPHASIS.sub("", text)
+    text = RE_TAG.sub("", text)
+    text = html.unescape(text)
+    text = RE_HEADING.sub(r"\n\n\1 \2 \1\n", text)
+    return RE_FORMULA.sub(lambda m: formulas[int(m.group(1))], text)
+
+
+def _strip_nested(text: str, open_tag: str, close_tag: str) -> str:
+    """Remove (possibly nested) `open_tag ... close_tag` spans in one pass"""
+    parts = []
+    depth = last = i = 0
+    while True:
+        i_open = text.find(open_tag, i)
+        i_close = text.find(close_tag, i)
+        if i_close == -1 or (i_open == -1 and depth == 0):
+            break
+        if i_open != -1 and i_open < i_close:
+            if depth == 0:
+                parts.append(text[last:i_open])
+                last = i_open
+            depth += 1
+            i = i_open + len(open_tag)
+        else:
+            if depth > 0:
+                depth -= 1
+                if depth == 0:
+                    last = i_close + len(close_tag)
+            i = i_close + len(close_tag)
+    # an unbalanced span is kept as is rather than dropping the page tail
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+def _strip_media_links(text: str) -> str:
+    """Drop `[[File:...]]` / `[[Category:...]]` links, captions included"""
+    parts = []
+    last = 0
+    for match in RE_MEDIA.finditer(text):
+        if match.start() < last:
+            continue
+        depth, i = 0, match.start()
+        while i < len(text) - 1:
+            pair = text[i : i + 2]
+            if pair == "[[":
+                depth += 1
+                i += 2
+            elif pair == "]]":
+                depth -= 1
+                i += 2
+                if depth == 0:
+                    break
+            else:
+                i += 1
+        parts.append(text[last : match.start()])
+        last = i
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+def _iter_xml_pages(source) -> Iterator[tuple[str, str]]:
+    """
+    Stream `(title, wikitext)` of the main-namespace, non-redirect pages.
+
+    `source` is a binary file object or an iterable of byte chunks. Parsed
+    elements are cleared as soon as a page is done, keeping memory flat.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    chunks = (
+        iter(lambda: source.read(1 << 20), b"")
+        if hasattr(source, "read")
+        else source
+    )
+    root = None
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if root is None and event == "start":
+                root = elem
+            if event != "end" or _local(elem.tag) != "page":
+                continue
+            fields = {_local(child.tag): child for child in elem.iter()}
+            ns = fields.get("ns")
+            if "redirect" not in fields and (ns is None or ns.text == "0"):
+                text = fields.get("text")
+                yield (
+                    fields["title"].text or "",
+                    (text.text if text is not None else "") or "",
+                )
+            elem.clear()
+            if root is not None:
+                root.clear()
+
+
+def _read_bz2_stream(path: Path, offset: int) -> bytes:
+    """Decompress the single bz2 stream starting at `offset` (multistream)"""
+    decompressor = bz2.BZ2Decompressor()
+    data = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while not decompressor.eof:
+            block = f.read(1 << 16)
+            if not block:
+                break
+            data.append(decompressor.decompress(block))
+    return b"".join(data)
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
@@ -0,0 +1,201 @@
+import json
+import re
+from collections import Counter
+from collections.abc import Iterable
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from lib.sink import read_jsonl
+from lib.types import Article
+
+RE_TOKEN = re.compile(r"\w+")
+ARRAYS = ["offsets", "postings", "weights", "doc_article", "doc_chunk"]
+
+
+def tokenize(text: str) -> list[str]:
+    return RE_TOKEN.findall(text.casefold())
+
+
+class Hit(NamedTuple):
+    """A retrieved chunk"""
+
+    language: str
+    title: str
+    chunk: int
+    score: float
+
+
+class BM25Index:
+    """
+    Inverted index over the chunks of a set of articles, scored with BM25.
+
+    Postings are stored as flat arrays, sorted by term: the chunks
+    containing term `t` are `postings[offsets[t]:offsets[t + 1]]`, each with
+    its precomputed BM25 term weight, so a query only sums the weights of
+    its terms' postings. Saved as `.npy` files plus `meta.json` and
+    memory-mapped on `load`, so opening a large index is instant and its
+    pages are shared between processes.
+    """
+
+    def __init__(
+        self,
+        terms: list[str],
+        articles: list[list[str]],
+        arrays: dict[str, np.ndarray],
+        params: dict[str, float],
+    ) -> None:
+        self.terms = terms
+        self.vocab = {term: i for i, term in enumerate(terms)}
+        self.articles = articles
+        self.params = params
+        self.offsets = arrays["offsets"]
+        self.postings = arrays["postings"]
+        self.weights = arrays["weights"]
+        self.doc_article = arrays["doc_article"]
+        self.doc_chunk = arrays["doc_chunk"]
+
+    def __len__(self) -> int:
+        return len(self.doc_chunk)
+
+    @classmethod
+    def build(
+        cls, articles: Iterable[Article], k1: float = 1.2, b: float = 0.75
+    ) -> "BM25Index":
+        """Index every chunk (heading and content) of `articles`"""
+        vocab: dict[str, int] = {}
+        meta: list[list[str]] = []
+        doc_article: list[int] = []
+        doc_chunk: list[int] = []
+        lengths: list[int] = []
+        term_ids: list[int] = []
+        doc_ids: list[int] = []
+        freqs: list[int] = []
+        for article in articles:
+            meta.append([article.language, article.title])
+            for i, chunk in enumerate(article.chunks):
+                doc = len(doc_chunk)
+                doc_article.append(len(meta) - 1)
+                doc_chunk.append(i)
+                tokens = tokenize(f"{chunk['heading']}\n{chunk['content']}")
+                lengths.append(len(tokens))
+                for term, n in Counter(tokens).items():
+                    term_ids.append(vocab.setdefault(term, len(vocab)))
+                    doc_ids.append(doc)
+                    freqs.append(n)
+
+        terms = np.asarray(term_ids, dtype=np.int64)
+        docs = np.asarray(doc_ids, dtype=np.int32)
+        tf = np.asarray(freqs, dtype=np.float64)
+        length = np.asarray(lengths, dtype=np.float64)
+        order = np.lexsort((docs, terms))
+        df = np.bincount(terms, minlength=len(vocab))
+        n_docs = len(length)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * length[docs] / max(length.mean(), 1.0))
+        weights = idf[terms] * tf * (k1 + 1) / (tf + norm)
+        arrays = {
+            "offsets": np.concatenate([[0], np.cumsum(df)]).astype(np.int64),
+            "postings": docs[order],
+            "weights": weights[order].astype(np.float32),
+            "doc_article": np.asarray(doc_article, dtype=np.int32),
+            "doc_chunk": np.asarray(doc_chunk, dtype=np.int32),
+        }
+        return cls(list(vocab), meta, arrays, {"k1": k1, "b": b})
+
+    @classmethod
+    def from_jsonl(cls, path: str | Path, **kwargs) -> "BM25Index":
+        """Index the articles of a `wiki_doc.jsonl` file"""
+        return cls.build(
+            (Article.model_validate(record) for record in read_jsonl(path)),
+            **kwargs,
+        )
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            np.save(path / f"{name}.npy", getattr(self, name))
+        meta = {
+            "params": self.params,
+            "terms": self.terms,
+            "articles": self.articles,
+        }
+        (path / "meta.json").write_text(
+            json.dumps(meta, ensure_ascii=False), encoding="utf-8"
+        )
+
+    @classmethod
+    def load(cls, path: str | Path, mmap: bool = True) -> "BM25Index":
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text("utf-8"))
+        arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None)
+            for name in ARRAYS
+        }
+        return cls(meta["terms"], meta["articles"], arrays, meta["params"])
+
+    def search(
+        self,
+        queries: list[str],
+        k: int = 10,
+        language: str | None = None,
+        batch_size: int = 1024,
+    ) -> list[list[Hit]]:
+        """Top `k` chunks for every query, best first"""
+        allowed = None
+        if language is not None:
+            allowed = np.array(
+                [lang == language for lang, _ in self.articles], dtype=bool
+            )[self.doc_article]
+        hits = []
+        for start in range(0, len(queries), batch_size):
+            block = queries[start : start + batch_size]
+            hits += self._search_block(block, k, allowed)
+        return hits
+
+    def _search_block(
+        self, queries: list[str], k: int, allowed: np.ndarray | None
+    ) -> list[list[Hit]]:
+        query_ids, term_ids = [], []
+        for i, query in enumerate(queries):
+            terms = {self.vocab.get(term) for term in tokenize(query)}
+            terms.discard(None)
+            query_ids += [i] * len(terms)
+            term_ids += terms
+        hits: list[list[Hit]] = [[] for _ in queries]
+        if not term_ids:
+            return hits
+
+        # gather the postings of every (query, term) pair in one go
+        terms = np.asarray(term_ids, dtype=np.int64)
+        starts = self.offsets[terms]
+        lengths = self.offsets[terms + 1] - starts
+        ends = np.cumsum(lengths)
+        positions = np.arange(ends[-1]) + np.repeat(
+            starts - ends + lengths, lengths
+        )
+        docs = self.postings[positions].astype(np.int64)
+        weights = self.weights[positions]
+        owners = np.repeat(np.asarray(query_ids, dtype=np.int64), lengths)
+        if allowed is not None:
+            keep = allowed[docs]
+            docs, weights, owners = docs[keep], weights[keep], owners[keep]
+
+        # sum the weights per (query, chunk), then rank within each query
+        pairs, inverse = np.unique(
+            owners * len(self) + docs, return_inverse=True
+        )
+        scores = np.bincount(inverse.ravel(), weights=weights)
+        owner, doc = np.divmod(pairs, len(self))
+        order = np.lexsort((doc, -scores, owner))
+        owner = owner[order]
+        rank = np.arange(len(order)) - np.searchsorted(owner, owner)
+        top = order[rank < k]
+        for i, d, score in zip(
+            owner[rank < k].tolist(), doc[top].tolist(), scores[top].tolist()
+        ):
+            language, title = self.articles[self.doc_article[d]]
+            hits[i].append(Hit(language, title, int(self.doc_chunk[d]), score))
+        return hits
@@ -0,0 +1,393 @@
+import contextlib
+import functools
+import json
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import NamedTuple
+
+from lib.budget import pack_prompt
+from lib.dedup import DuplicateIndex
+from lib.llm import generate_batch
+from lib.sink import JsonlSink
+from lib.types import QA, Article
+from lib.utils import RateLimiter
+from settings import settings
+
+
+class Task(NamedTuple):
+    """A claimed generation job"""
+
+    id: int
+    type: str
+    article: Article
+    chunks: list[int]
+    attempts: int
+
+
+class JobQueue:
+    """
+    Persistent queue of (article, chunk indices, question type) jobs
+    (SQLite).
+
+    Jobs go `pending -> running -> done`, or back to `pending` with a
+    later `next_at` after a failure, until `failed` for good. A running
+    job is leased for `lease` seconds (its `next_at`), renewed by
+    `heartbeat` while it is worked on. The queue outlives the process:
+    jobs whose lease ran out, e.g. left `running` by a crash, are requeued
+    on `requeue_running`, and adding a job twice is a no-op, so re-running
+    a build only does what is left. The paused flag is shared with other
+    processes using the same file.
+    """
+
+    def __init__(self, path: str | Path, lease: float = 60.0) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS articles (
+                title TEXT NOT NULL,
+                language TEXT NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (title, language)
+            );
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                type TEXT NOT NULL,
+                title TEXT NOT NULL,
+                language TEXT NOT NULL,
+                chunks TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_at REAL NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, next_at);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+
+    def add_article(self, article: Article) -> bool:
+        """Store an article for its jobs; False if it was already there"""
+        data = zlib.compress(article.model_dump_json().encode("utf-8"))
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO articles VALUES (?, ?, ?)",
+                (article.title, article.language, data),
+            )
+        return cursor.rowcount > 0
+
+    def add(
+        self, type_q: str, article: Article, chunks: list[int], n: int = 0
+    ) -> bool:
+        """
+        Enqueue a job; `n` tells apart repeated jobs over the same chunks.
+        False if it was already queued (whatever its status).
+        """
+        key = json.dumps(
+            [type_q, article.language, article.title, chunks, n],
+            ensure_ascii=False,
+        )
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO jobs"
+                " (key, type, title, language, chunks) VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    type_q,
+                    article.title,
+                    article.language,
+                    json.dumps(chunks),
+                ),
+            )
+        return cursor.rowcount > 0
+
+    def claim(self, n: int) -> list[Task]:
+        """Mark up to `n` ready jobs as running and return them"""
+        with self._lock, self._db:
+            rows = self._db.execute(
+                "UPDATE jobs SET status = 'running', next_at = ? WHERE id IN ("
+                " SELECT id FROM jobs WHERE status = 'pending'"
+                " AND next_at <= ? ORDER BY id LIMIT ?)"
+                " RETURNING id, type, title, language, chunks, attempts",
+                (time.time() + self.lease, time.time(), n),
+            ).fetchall()
+            articles = {}
+            for _, _, title, language, _, _ in rows:
+                if (title, language) not in articles:
+                    (data,) = self._db.execute(
+                        "SELECT data FROM articles"
+                        " WHERE title = ? AND language = ?",
+                        (title, language),
+                    ).fetchone()
+                    articles[(title, language)] = Article.model_validate_json(
+                        zlib.decompress(data)
+                    )
+        return sorted(
+            (
+                Task(id, type_q, articles[(title, lang)], json.loads(chunks), n)
+                for id, type_q, title, lang, chunks, n in rows
+            ),
+            key=lambda task: task.id,
+        )
+
+    def heartbeat(self, ids: list[int]) -> None:
+        """Extend the lease of running jobs"""
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE jobs SET next_at = ?"
+                " WHERE id = ? AND status = 'running'",
+                [(time.time() + self.lease, id) for id in ids],
+            )
+
+    def complete(self, ids: list[int]) -> None:
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE jobs SET status = 'done', error = NULL WHERE id = ?",
+                [(id,) for id in ids],
+            )
+
+    def retry(self, id: int, error: str, delay: float) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = 'pending', attempts = attempts + 1,"
+                " next_at = ?, error = ? WHERE id = ?",
+                (time.time() + delay, error, id),
+            )
+
+    def fail(self, id: int, error: str) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', attempts = attempts + 1,"
+                " error = ? WHERE id = ?",
+                (error, id),
+            )
+
+    def requeue_running(self) -> int:
+        """
+        Put back running jobs whose lease ran out (their process stopped);
+        jobs another live runner is working on are left alone
+        """
+        with self._lock, self._db:
+            return self._db.execute(
+                "UPDATE jobs SET status = 'pending', next_at = 0"
+                " WHERE status = 'running' AND next_at <= ?",
+                (time.time(),),
+            ).rowcount
+
+    def retry_failed(self) -> int:
+        with self._lock, self._db:
+            return self._db.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, next_at = 0"
+                " WHERE status = 'failed'"
+            ).rowcount
+
+    def pause(self) -> None:
+        self._set_meta("paused", "1")
+
+    def resume(self) -> None:
+        self._set_meta("paused", "0")
+
+    @property
+    def paused(self) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE key = 'paused'"
+            ).fetchone()
+        return row is not None and row[0] == "1"
+
+    def progress(self) -> dict[str, int]:
+        """Number of jobs per status"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        counts = dict.fromkeys(["pending", "running", "done", "failed"], 0)
+        return counts | dict(rows)
+
+    def next_ready_in(self) -> float | None:
+        """Seconds until a pending job is due, None when none is left"""
+        with self._lock:
+            (next_at,) = self._db.execute(
+                "SELECT MIN(next_at) FROM jobs WHERE status = 'pending'"
+            ).fetchone()
+        return None if next_at is None else max(0.0, next_at - time.time())
+
+    def _set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value)
+            )
+
+
+class JobRunner:
+    """
+    Drains a `JobQueue` through the model in batches of `batch_size`.
+
+    Failed generations (backend errors, empty responses) are retried with
+    jittered exponential backoff up to `max_attempts`; a prompt that can't
+    fit the context or an answer that doesn't validate (`ValueError`,
+    including pydantic's `ValidationError`) fails right away. Requests are
+    throttled by the rate limit of the configured backend
+    (`GENERATION_RATE`). Pairs whose question is a near-duplicate in
+    `dedup` are dropped (the job is done). Claimed jobs are leased while
+    the batch runs, so a second runner on the same queue doesn't take
+    them over.
+    """
+
+    def __init__(
+        self,
+        jobs: JobQueue,
+        llm,
+        batch_size: int = 32,
+        max_attempts: int = 5,
+        backoff: float = 2.0,
+        params: dict = {},
+        use_cache: bool = True,
+        dedup: DuplicateIndex | None = None,
+    ) -> None:
+        self.jobs = jobs
+        self.llm = llm
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.params = params
+        self.use_cache = use_cache
+        self.dedup = dedup
+        self.limiter = get_rate_limiter(settings.ENVIRONMENT)
+
+    def run(
+        self,
+        sink: JsonlSink,
+        stop: threading.Event | None = None,
+        poll: float = 1.0,
+    ) -> int:
+        """
+        Process jobs until none is left (or `stop` is set), waiting while
+        the queue is paused or retries are not due. Finished pairs are
+        appended to `sink`. Returns the number of pairs written.
+        """
+        stop = stop or threading.Event()
+        self.jobs.requeue_running()
+        written = 0
+        while not stop.is_set():
+            if self.jobs.paused:
+                stop.wait(poll)
+                continue
+            tasks = self.jobs.claim(self.batch_size)
+            if not tasks:
+                wait = self.jobs.next_ready_in()
+                if wait is None:
+                    break
+                stop.wait(min(wait, poll))
+                continue
+            with self._leased([task.id for task in tasks]):
+                written += self._run_batch(tasks, sink)
+        return written
+
+    @contextlib.contextmanager
+    def _leased(self, ids: list[int]):
+        """Keep renewing the lease of `ids` until the block exits"""
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(self.jobs.lease / 3):
+                self.jobs.heartbeat(ids)
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def _run_batch(self, tasks: list[Task], sink: JsonlSink) -> int:
+        ready: list[tuple[Task, list[int]]] = []
+        prompts: list[str] = []
+        max_tokens = self.params.get("max_tokens", 100)
+        for task in tasks:
+            try:
+                packed = pack_prompt(
+                    task.type,
+                    [task.article.chunks[i] for i in task.chunks],
+                    max_tokens,
+                )
+            except (ValueError, IndexError) as e:
+                self.jobs.fail(task.id, str(e))
+                continue
+            if not packed.kept:
+                self.jobs.fail(task.id, "no chunk fits CTX_WINDOW")
+                continue
+            self.limiter.wait()
+            prompts.append(packed.prompt)
+            ready.append((task, [task.chunks[i] for i in packed.kept]))
+        if not prompts:
+            return 0
+
+        try:
+            results = generate_batch(
+                prompts, self.llm, self.params, self.use_cache
+            )
+        except Exception as e:
+            # the whole call failed, e.g. the server is down
+            results = [e] * len(prompts)
+
+        done = []
+        written = 0
+        for (task, chunks), result in zip(ready, results):
+            if isinstance(result, Exception):
+                error = f"{type(result).__name__}: {result}"
+                # permanent: the same prompt would fail the same way
+                permanent = isinstance(result, ValueError)
+                if permanent or task.attempts + 1 >= self.max_attempts:
+                    self.jobs.fail(task.id, error)
+                else:
+                    self.jobs.retry(task.id, error, self._delay(task))
+                continue
+            done.append(task.id)
+            qa = QA(
+                type=task.type,
+                language=task.article.language,
+                article_title=task.article.title,
+                chunks=chunks,
+                question=result.question,
+                answer=result.answer,
+            )
+            if self.dedup is not None and self.dedup.add_qa(qa):
+                continue
+            sink.write(qa)
+            written += 1
+        # on disk before the jobs are marked done: a crash in between
+        # means a pair written twice, never a lost one
+        sink.flush()
+        self.jobs.complete(done)
+        return written
+
+    def _delay(self, task: Task) -> float:
+        delay = min(self.backoff * 2**task.attempts, 300.0)
+        return delay * (1 + random.random() / 2)
+
+
+@functools.cache
+def get_rate_limiter(backend: str) -> RateLimiter:
+    """
+    Limiter shared by every runner of a backend, from `GENERATION_RATE`,
+    e.g. `dev=20;prod=0` (requests per second, 0 or missing = unlimited)
+    """
+    rates = {}
+    for entry in filter(None, settings.GENERATION_RATE.split(";")):
+        name, rate = entry.split("=", 1)
+        rates[name.strip()] = float(rate)
+    rate = rates.get(backend, 0)
+    return RateLimiter(rate, burst=max(1, int(rate)))
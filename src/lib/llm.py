@@ -1,43 +1,279 @@
-from openai import OpenAI
-from vllm import LLM, SamplingParams
-from vllm.sampling_params import GuidedDecodingParams
+import asyncio
+import random
+import threading
+import time
+from typing import TYPE_CHECKING
 
+import httpx
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+from pydantic import ValidationError
+
+from lib.budget import check_prompt
+from lib.cache import get_response_cache
+from lib.telemetry import telemetry
 from lib.types import QAFormat
 from settings import settings
 
+if TYPE_CHECKING:
+    # vLLM pulls in torch and CUDA: only imported once a model is loaded
+    from vllm import LLM
+
+
+class AsyncOpenAIClient:
+    """
+    OpenAI-compatible backend (e.g. `vllm serve`) driven by asyncio.
+
+    Owns an event loop on a daemon thread and one pooled HTTP client, so
+    synchronous callers (Gradio handlers, the CLI) share keep-alive
+    connections and up to `concurrency` in-flight requests.
+    """
+
+    def __init__(
+        self,
+        base_url: str = settings.CLIENT_URL,
+        concurrency: int = settings.CLIENT_CONCURRENCY,
+        timeout: float = settings.CLIENT_TIMEOUT,
+        max_retries: int = settings.CLIENT_MAX_RETRIES,
+        backoff: float = 0.5,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.client = AsyncOpenAI(
+            api_key="API",
+            base_url=base_url,
+            max_retries=0,  # retries are handled in `_complete`
+            http_client=httpx.AsyncClient(
+                transport=transport,
+                timeout=httpx.Timeout(timeout, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=concurrency,
+                    max_keepalive_connections=concurrency,
+                ),
+            ),
+        )
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="openai-client", daemon=True
+        )
+        self._thread.start()
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def generate_batch(
+        self, prompts: list[str], params: dict = {}
+    ) -> list[QAFormat | Exception]:
+        future = asyncio.run_coroutine_threadsafe(
+            self.agenerate_batch(prompts, params), self._loop
+        )
+        try:
+            return future.result()
+        except BaseException:
+            # e.g. KeyboardInterrupt: cancel the requests still in flight
+            future.cancel()
+            raise
+
+    async def agenerate_batch(
+        self, prompts: list[str], params: dict = {}
+    ) -> list[QAFormat | Exception]:
+        """Run every prompt concurrently; results keep the input order"""
+        return await asyncio.gather(*(self._generate(p, params) for p in prompts))
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(
+            self.client.close(), self._loop
+        ).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _generate(self, prompt: str, params: dict) -> QAFormat | Exception:
+        if error := check_prompt(prompt, params.get("max_tokens", 100)):
+            return error
+        async with self._semaphore:
+            try:
+                response = await self._complete(prompt, params)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return e
+        return _parse_response(response)
+
+    async def _complete(self, prompt: str, params: dict) -> str | None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                start = time.perf_counter()
+                completion = await self.client.chat.completions.create(
+                    messages=[{"role": "assistant", "content": prompt}],
+                    model=settings.LLM_MODEL,
+                    extra_body={"guided_json": QAFormat.model_json_schema()},
+                    max_tokens=params.get("max_tokens", 100),
+                    temperature=params.get("temperature", 0.25),
+                    top_p=params.get("top_p", 0.95),
+                    frequency_penalty=params.get("frequency_penalty", 0.5),
+                    presence_penalty=params.get("presence_penalty", 1.2),
+                )
+                if completion.usage:
+                    _count_tokens(
+                        completion.usage.prompt_tokens,
+                        completion.usage.completion_tokens,
+                        time.perf_counter() - start,
+                    )
+                return completion.choices[0].message.content
+            except APIStatusError as e:
+                if e.status_code != 429 and e.status_code < 500:
+                    raise
+                if attempt == self.max_retries:
+                    raise
+                retry_after = e.response.headers.get("retry-after", "")
+                delay = (
+                    float(retry_after)
+                    if retry_after.isdigit()
+                    else self.backoff * 2**attempt
+                )
+            except APIConnectionError:  # includes timeouts
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff * 2**attempt
+            await asyncio.sleep(delay * (1 + random.random() / 2))
+        return None
+
 
-def get_client() -> LLM | OpenAI:
+def get_client() -> "LLM | AsyncOpenAIClient":
     match settings.ENVIRONMENT:
         case "dev":
-            model = OpenAI(api_key="API", base_url=settings.CLIENT_URL)
+            model = AsyncOpenAIClient()
         case "prod":
+            from vllm import LLM
+
             model = LLM(
                 model=settings.LLM_MODEL,
                 dtype=settings.DTYPE,
                 task="generate",
                 enforce_eager=False,
                 max_model_len=settings.CTX_WINDOW,
-                max_num_seqs=2,
+                max_num_seqs=settings.MAX_NUM_SEQS,
                 enable_chunked_prefill=True,
+                enable_prefix_caching=settings.PREFIX_CACHING,
             )
         case _:
             raise ValueError("env should be dev | prod")
     return model
 
 
-def generate(prompt: str, llm: LLM | OpenAI, params: dict = {}) -> QAFormat:
-    assert len(prompt) // 4 < settings.CTX_WINDOW, "Prompt too large!!"
+class SharedClient:
+    """
+    Process-wide client built on first use, so importing the app does not
+    load the model. `warm_up` starts loading it in the background (e.g.
+    while the UI starts serving) and `status` reports readiness.
+    """
+
+    def __init__(self) -> None:
+        self._client: "LLM | AsyncOpenAIClient | None" = None
+        self._lock = threading.Lock()
+        self._error: Exception | None = None
+        self._load_seconds: float | None = None
+
+    def get(self) -> "LLM | AsyncOpenAIClient":
+        with self._lock:
+            if self._client is None:
+                start = time.perf_counter()
+                try:
+                    self._client = get_client()
+                except Exception as e:
+                    self._error = e
+                    raise
+                self._error = None
+                self._load_seconds = time.perf_counter() - start
+        return self._client
+
+    def warm_up(self) -> threading.Thread:
+        def load() -> None:
+            try:
+                self.get()
+            except Exception as e:
+                print(f"Error loading the model: {e}")
+
+        thread = threading.Thread(target=load, name="llm-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def ready(self) -> bool:
+        return self._client is not None
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "loading": self._lock.locked() and not self.ready,
+            "model": settings.LLM_MODEL,
+            "environment": settings.ENVIRONMENT,
+            "load_seconds": self._load_seconds,
+            "error": str(self._error) if self._error else None,
+        }
 
+
+shared_client = SharedClient()
+
+
+def generate(
+    prompt: str,
+    llm: "LLM | AsyncOpenAIClient",
+    params: dict = {},
+    use_cache: bool = True,
+) -> QAFormat:
+    result = generate_batch([prompt], llm, params, use_cache)[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+@telemetry.timed("generate")
+def generate_batch(
+    prompts: list[str],
+    llm: "LLM | AsyncOpenAIClient",
+    params: dict = {},
+    use_cache: bool = True,
+) -> list[QAFormat | Exception]:
+    """
+    Generate one Q/A pair per prompt in a single engine call.
+
+    Results keep the order of `prompts`. An item that fails (prompt too
+    large, empty response, invalid JSON) holds the exception instead of a
+    `QAFormat`, so one bad job never discards the rest of the batch.
+    Successful pairs are stored in the response cache and served from it
+    for the same model, prompt and sampling params unless `use_cache` is
+    False.
+    """
     max_tokens = params.get("max_tokens", 100)
     temperature = params.get("temperature", 0.25)
     top_p = params.get("top_p", 0.95)
     frequency_penalty = params.get("frequency_penalty", 0.5)
     presence_penalty = params.get("presence_penalty", 1.2)
     repetition_penalty = params.get("repetition_penalty", 1.2)
+    sampling = {
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "top_p": top_p,
+        "frequency_penalty": frequency_penalty,
+        "presence_penalty": presence_penalty,
+        "repetition_penalty": repetition_penalty,
+    }
+
+    results: list[QAFormat | Exception | None] = [
+        check_prompt(prompt, max_tokens) for prompt in prompts
+    ]
+    cache = get_response_cache() if use_cache else None
+    if cache:
+        for i, result in enumerate(results):
+            if result is None:
+                results[i] = cache.get(settings.LLM_MODEL, prompts[i], sampling)
+    pending = [i for i, result in enumerate(results) if result is None]
 
-    response = ""
     match settings.ENVIRONMENT:
         case "prod":
+            from vllm import LLM, SamplingParams
+            from vllm.sampling_params import GuidedDecodingParams
+
             assert isinstance(llm, LLM), (
                 "LLM should be an instance of LLM class"
             )
@@ -52,28 +288,73 @@ def generate(prompt: str, llm: LLM | OpenAI, params: dict = {}) -> QAFormat:
                     json=QAFormat.model_json_schema()
                 ),
             )
-            response = llm.generate(prompt, sampling_params)[0].outputs[0].text
-        case "dev":
-            assert isinstance(llm, OpenAI), (
-                "LLM should be and instance of OpenAI class"
-            )
-            response = (
-                llm.chat.completions.create(
-                    messages=[{"role": "assistant", "content": prompt}],
-                    model=settings.LLM_MODEL,
-                    extra_body={"guided_json": QAFormat.model_json_schema()},
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    top_p=top_p,
-                    frequency_penalty=frequency_penalty,
-                    presence_penalty=presence_penalty,
+            if pending and settings.PREFIX_CACHING:
+                # adjacent prompts sharing a prefix reuse its KV cache
+                pending.sort(key=prompts.__getitem__)
+            if pending:
+                # vLLM schedules the whole list together and returns the
+                # outputs in the same order as the prompts
+                start = time.perf_counter()
+                outputs = llm.generate(
+                    [prompts[i] for i in pending], sampling_params
+                )
+                _count_tokens(
+                    sum(len(o.prompt_token_ids or ()) for o in outputs),
+                    sum(len(o.outputs[0].token_ids) for o in outputs),
+                    time.perf_counter() - start,
                 )
-                .choices[0]
-                .message.content
+                for i, output in zip(pending, outputs):
+                    results[i] = _parse_response(output.outputs[0].text)
+        case "dev":
+            assert isinstance(llm, AsyncOpenAIClient), (
+                "LLM should be and instance of AsyncOpenAIClient class"
             )
-            if not response:
-                raise RuntimeError("Something appened while trying to generate")
+            if pending:
+                outputs = llm.generate_batch([prompts[i] for i in pending], params)
+                for i, output in zip(pending, outputs):
+                    results[i] = output
         case _:
             raise ValueError("Correctly configure the env to be dev | prod")
 
-    return QAFormat.model_validate_json(response)
+    if cache:
+        for i in pending:
+            if isinstance(result := results[i], QAFormat):
+                cache.put(settings.LLM_MODEL, prompts[i], sampling, result)
+    for result in results:
+        if isinstance(result, Exception):
+            telemetry.inc(
+                "generation_failures_total", reason=_failure_reason(result)
+            )
+    return results  # type: ignore[return-value]
+
+
+def _count_tokens(
+    prompt_tokens: int, completion_tokens: int, seconds: float
+) -> None:
+    telemetry.inc("prompt_tokens_total", prompt_tokens)
+    telemetry.inc("completion_tokens_total", completion_tokens)
+    if completion_tokens and seconds > 0:
+        telemetry.observe(
+            "generation_tokens_per_second", completion_tokens / seconds
+        )
+
+
+def _failure_reason(error: Exception) -> str:
+    match error:
+        case ValidationError():
+            return "validation"
+        case ValueError():  # `check_prompt`
+            return "prompt_too_long"
+        case RuntimeError():  # `_parse_response`
+            return "empty"
+        case _:
+            return "error"
+
+
+def _parse_response(response: str | None) -> QAFormat | Exception:
+    if not response:
+        return RuntimeError("Something appened while trying to generate")
+    try:
+        return QAFormat.model_validate_json(response)
+    except ValidationError as e:
+        return e
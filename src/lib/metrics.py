@@ -0,0 +1,178 @@
+from collections.abc import Iterable, Sequence
+from itertools import chain
+from pathlib import Path
+
+import numpy as np
+
+from lib.sink import read_jsonl
+
+METRICS = ["precision", "recall", "hit_rate", "mrr", "ndcg", "map"]
+GROUPS = ["type", "language", "article_title"]
+CHUNK_IDS = 1 << 20  # more chunks than any article has
+
+
+def pad(rows: Iterable[list[int]], fill: int, width: int | None = None):
+    """Stack ragged id lists into a `(n, width)` int matrix padded with `fill`"""
+    rows = list(rows)
+    lengths = np.fromiter((len(row) for row in rows), int, len(rows))
+    width = int(lengths.max(initial=0)) if width is None else width
+    matrix = np.full((len(rows), width), fill, dtype=np.int64)
+    lengths = np.minimum(lengths, width)
+    mask = np.arange(width) < lengths[:, None]
+    matrix[mask] = np.fromiter(
+        chain.from_iterable(row[:width] for row in rows),
+        np.int64,
+        int(lengths.sum()),
+    )
+    return matrix
+
+
+def relevance(ranked: np.ndarray, gold: np.ndarray) -> np.ndarray:
+    """
+    `(queries, k)` boolean matrix: is the i-th result of a query one of its
+    gold documents. `ranked` is padded with -1 and `gold` with -2 so
+    padding never matches.
+    """
+    return (ranked[:, :, None] == gold[:, None, :]).any(axis=2)
+
+
+def retrieval_metrics(
+    rel: np.ndarray, n_gold: np.ndarray, ks: Sequence[int]
+) -> dict[str, np.ndarray]:
+    """
+    Per-query Precision, Recall, Hit Rate, MRR, NDCG and MAP at every k,
+    as `{"precision@5": array of shape (queries,), ...}`.
+
+    `rel` is the relevance matrix of the ranked results and `n_gold` the
+    number of gold documents of every query.
+    """
+    rel = rel.astype(np.float64)
+    n_gold = n_gold.astype(np.float64)
+    depth = rel.shape[1]
+    ranks = np.arange(1, max(max(ks), depth) + 1, dtype=np.float64)
+    discounts = 1 / np.log2(ranks + 1)
+    ideal = np.cumsum(discounts)
+    hits_at = np.cumsum(rel, axis=1)
+    # rank of the first hit, past every k when there is none
+    first = np.full(len(rel), len(ranks))
+    if depth:
+        first = np.where(rel.any(axis=1), rel.argmax(axis=1), len(ranks))
+
+    scores = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for k in ks:
+            kk = min(k, depth)
+            hits = hits_at[:, kk - 1] if kk else np.zeros(len(rel))
+            n_ideal = np.minimum(n_gold, k)
+            scores[f"precision@{k}"] = hits / k
+            scores[f"recall@{k}"] = np.where(n_gold > 0, hits / n_gold, 0.0)
+            scores[f"hit_rate@{k}"] = (hits > 0).astype(np.float64)
+            scores[f"mrr@{k}"] = np.where(first < k, 1 / (first + 1), 0.0)
+            dcg = rel[:, :kk] @ discounts[:kk]
+            idcg = np.where(
+                n_ideal > 0, ideal[np.maximum(n_ideal, 1).astype(int) - 1], 1
+            )
+            scores[f"ndcg@{k}"] = dcg / idcg
+            precision_at = hits_at[:, :kk] / ranks[:kk]
+            ap = (precision_at * rel[:, :kk]).sum(axis=1)
+            scores[f"map@{k}"] = np.where(n_ideal > 0, ap / n_ideal, 0.0)
+    return scores
+
+
+def group_means(
+    scores: dict[str, np.ndarray], labels: list[str]
+) -> dict[str, dict[str, float]]:
+    """Average every metric over the queries sharing a label"""
+    names, codes = np.unique(
+        np.asarray(labels, dtype=object), return_inverse=True
+    )
+    counts = np.bincount(codes, minlength=len(names))
+    means = {
+        metric: np.bincount(codes, weights=values, minlength=len(names))
+        / counts
+        for metric, values in scores.items()
+    }
+    return {
+        str(name): {"queries": int(counts[i])}
+        | {metric: float(means[metric][i]) for metric in scores}
+        for i, name in enumerate(names)
+    }
+
+
+def encode_run(
+    qa: list[dict], runs: Iterable[dict]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Turn gold pairs and ranked results into padded id matrices:
+    `ranked (queries, depth)` padded with -1, `gold (queries, max gold)`
+    padded with -2, and the number of gold chunks per query.
+
+    A run record names its query by `id` (line number in the QA file) or by
+    `question`, and lists the retrieved `chunks` best first, either as chunk
+    indices of the query's article or as `[article_title, index]`. Queries
+    without a run record count as retrieving nothing.
+    """
+    articles: dict[tuple[str, str], int] = {}
+    by_question = {pair["question"]: i for i, pair in enumerate(qa)}
+
+    def base(language: str, title: str) -> int:
+        # chunk `i` of an article gets the id `base + i`
+        return CHUNK_IDS * articles.setdefault((language, title), len(articles))
+
+    bases = [base(pair["language"], pair["article_title"]) for pair in qa]
+    gold = [
+        [offset + i for i in dict.fromkeys(pair["chunks"])]
+        for pair, offset in zip(qa, bases)
+    ]
+    # ranked ids relative to the query's own article, shifted in one go
+    ranked: list[list[int]] = [[] for _ in qa]
+    for run in runs:
+        i = run["id"] if "id" in run else by_question.get(run.get("question"))
+        if i is None or not 0 <= i < len(qa):
+            continue
+        # a chunk retrieved twice only counts once
+        try:
+            ranked[i] = list(dict.fromkeys(run["chunks"]))
+        except TypeError:  # some `[article_title, index]` entries
+            language = qa[i]["language"]
+            ranked[i] = list(
+                dict.fromkeys(
+                    base(language, chunk[0]) - bases[i] + chunk[1]
+                    if isinstance(chunk, list)
+                    else chunk
+                    for chunk in run["chunks"]
+                )
+            )
+    n_gold = np.fromiter(map(len, gold), np.int64, len(gold))
+    ranked_ids = pad(ranked, -1)
+    ranked_ids = np.where(
+        ranked_ids == -1, -1, ranked_ids + np.asarray(bases)[:, None]
+    )
+    return ranked_ids, pad(gold, -2), n_gold
+
+
+def evaluate(
+    qa: list[dict],
+    runs: Iterable[dict],
+    ks: Sequence[int] = (1, 3, 5, 10),
+    groups: list[str] = GROUPS,
+) -> dict:
+    """Mean of every metric at every k, overall and per group value"""
+    ranked, gold, n_gold = encode_run(qa, runs)
+    scores = retrieval_metrics(relevance(ranked, gold), n_gold, ks)
+    return {
+        "queries": len(qa),
+        "overall": {
+            metric: float(values.mean()) if len(values) else 0.0
+            for metric, values in scores.items()
+        },
+    } | {
+        group: group_means(scores, [pair[group] for pair in qa])
+        for group in groups
+    }
+
+
+def evaluate_files(
+    qa_path: str | Path, runs_path: str | Path, **kwargs
+) -> dict:
+    return evaluate(list(read_jsonl(qa_path)), read_jsonl(runs_path), **kwargs)
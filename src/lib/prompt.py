@@ -1,8 +1,13 @@
 from typing import Final, TypedDict
 
+from lib.types import Chunk
+from lib.utils import format_context
+from settings import settings
+
 
 class Prompt(TypedDict):
     factual_qa_pair: str
+    multihop_qa_pair: str
 
 
 PROMPT: Final[Prompt] = {
@@ -10,5 +15,51 @@ PROMPT: Final[Prompt] = {
         "Generate one factual question and answer in the text's language.\n"
         "Use only information from this text:\n"
         "{context}\n\n"
-    )
+    ),
+    "multihop_qa_pair": (
+        "Generate one question and answer in the text's language that can "
+        "only be answered by combining facts from at least two of the "
+        "sections below.\n"
+        "Use only information from these sections:\n"
+        "{context}\n\n"
+    ),
+}
+
+# Context-first layout for prefix caching: every prompt over the same chunks
+# starts with the same tokens and only the instruction differs
+CONTEXT_FIRST: Final[str] = "Text:\n{context}\n\n"
+INSTRUCTION: Final[Prompt] = {
+    "factual_qa_pair": (
+        "Generate one factual question and answer in the text's language.\n"
+        "Use only information from the text above.\n"
+    ),
+    "multihop_qa_pair": (
+        "Generate one question and answer in the text's language that can "
+        "only be answered by combining facts from at least two of the "
+        "sections above.\n"
+        "Use only information from the text above.\n"
+    ),
 }
+
+
+def build_prompt(
+    type_q: str, context: list[Chunk], context_first: bool | None = None
+) -> str:
+    """
+    Fill the prompt template of a question type with the given chunks.
+    With `context_first` (default: `PREFIX_CACHING`) the chunks go before
+    the instruction so prompts over the same chunks share their prefix.
+    """
+    match type_q:
+        case "factual":
+            key = "factual_qa_pair"
+        case "multihop":
+            key = "multihop_qa_pair"
+        case _:
+            raise ValueError(f"Unsupported question type: '{type_q}'")
+    if context_first is None:
+        context_first = settings.PREFIX_CACHING
+    context_str = format_context(context)
+    if context_first:
+        return CONTEXT_FIRST.format(context=context_str) + INSTRUCTION[key]
+    return PROMPT[key].format(context=context_str)
@@ -0,0 +1,145 @@
+import random
+
+import numpy as np
+
+from lib.index import tokenize
+from lib.types import Article
+
+# relatedness bonus of two chunks of the same section
+SECTION_BONUS = 0.2
+
+
+def sections(article: Article) -> list[int]:
+    """
+    Parent of every chunk from the heading levels: the closest chunk before
+    it with a lower level, -1 for top-level chunks
+    """
+    parents, stack = [], []
+    for i, chunk in enumerate(article.chunks):
+        while stack and article.chunks[stack[-1]]["level"] >= chunk["level"]:
+            stack.pop()
+        parents.append(stack[-1] if stack else -1)
+        stack.append(i)
+    return parents
+
+
+def relatedness(article: Article) -> np.ndarray:
+    """
+    `(chunks, chunks)` scores: TF-IDF cosine similarity of the chunk texts,
+    plus `SECTION_BONUS` for chunks of the same section (consecutive
+    chunks with the same heading and level, a long section split up),
+    under the same heading or nested in each other. The diagonal is -1.
+    """
+    n = len(article.chunks)
+    vocab: dict[str, int] = {}
+    rows, cols, counts = [], [], []
+    for i, chunk in enumerate(article.chunks):
+        for term in tokenize(chunk["content"]):
+            if len(term) > 3:  # mostly skips stopwords
+                rows.append(i)
+                cols.append(vocab.setdefault(term, len(vocab)))
+                counts.append(1.0)
+    tf = np.zeros((n, len(vocab)))
+    np.add.at(tf, (rows, cols), counts)
+    df = (tf > 0).sum(axis=0)
+    vectors = np.log1p(tf) * np.log((1 + n) / (1 + df) + 1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = np.divide(
+        vectors, norms, out=np.zeros_like(vectors), where=norms > 0
+    )
+    scores = vectors @ vectors.T
+
+    # every piece of a split section stands for its first one
+    keys = [(chunk["heading"], chunk["level"]) for chunk in article.chunks]
+    first = list(range(n))
+    for i in range(1, n):
+        if keys[i] == keys[i - 1]:
+            first[i] = first[i - 1]
+    index = np.array(first, dtype=int)
+    parents = np.array([first[p] if p >= 0 else -1 for p in sections(article)])
+    same_section = (index[:, None] == index[None, :]) | (
+        (parents[:, None] == parents[None, :]) & (parents[:, None] >= 0)
+    )
+    nested = (parents[:, None] == index[None, :]) | (
+        parents[None, :] == index[:, None]
+    )
+    scores += SECTION_BONUS * (same_section | nested)
+    np.fill_diagonal(scores, -1.0)
+    return scores
+
+
+def anchors(article: Article, n: int, rng: random.Random) -> list[int]:
+    """
+    `n` chunks spread over the article: round robin over its top-level
+    sections, in shuffled order, then over again once every chunk is used.
+    Chunks without text are skipped.
+    """
+    usable = _usable(article)
+    if not usable:
+        return []
+    top = {}
+    for i, parent in enumerate(sections(article)):
+        top[i] = i if parent < 0 else top[parent]
+    groups: dict[int, list[int]] = {}
+    for i in usable:
+        groups.setdefault(top[i], []).append(i)
+    queues = list(groups.values())
+    for queue in queues:
+        rng.shuffle(queue)
+    rng.shuffle(queues)
+    order = [
+        queue[depth]
+        for depth in range(max(map(len, queues)))
+        for queue in queues
+        if depth < len(queue)
+    ]
+    return [order[i % len(order)] for i in range(n)]
+
+
+def sample_chunks(
+    article: Article, type_q: str, n: int, seed: int = 0, salt: str = ""
+) -> list[list[int]]:
+    """
+    `n` chunk sets of an article for questions of `type_q`: single chunks
+    for factual questions, a chunk and one or two related ones (lexical
+    overlap, same section) for multihop. The same `seed` and `salt` give the
+    same sets, and every type starts from the same anchor chunks so their
+    prompts can share a prefix.
+    """
+    rng = random.Random(f"{seed}:{salt}:{article.language}:{article.title}")
+    picks = anchors(article, n, rng)
+    match type_q:
+        case "multihop":
+            return _related_sets(article, picks, rng)
+        case _:
+            return [[i] for i in picks]
+
+
+def _usable(article: Article) -> list[int]:
+    return [i for i, c in enumerate(article.chunks) if c["content"].strip()]
+
+
+def _related_sets(
+    article: Article, picks: list[int], rng: random.Random
+) -> list[list[int]]:
+    """Extend every anchor with one or two chunks related to it"""
+    usable = _usable(article)
+    if len(usable) < 2:
+        return [[i] for i in picks]
+    scores = relatedness(article)
+    unusable = np.ones(len(article.chunks), dtype=bool)
+    unusable[usable] = False
+    scores[:, unusable] = -np.inf
+    used = np.zeros(len(article.chunks))
+    sets = []
+    for anchor in picks:
+        size = 3 if len(usable) > 2 and rng.random() < 1 / 3 else 2
+        chosen = [anchor]
+        while len(chosen) < size:
+            # related to everything picked so far, favouring unused chunks
+            fit = scores[chosen].min(axis=0) - 0.05 * used
+            fit[chosen] = -np.inf
+            chosen.append(int(fit.argmax()))
+        used[chosen] += 1
+        sets.append(chosen)
+    return sets
@@ -0,0 +1,132 @@
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+
+from lib.sink import JsonlSink, read_jsonl
+from lib.types import QA, Article
+from settings import settings
+
+
+class Session:
+    """
+    Articles and Q/A pairs of one UI session.
+
+    With a `path`, every pair is appended to `<path>/wiki_qa.jsonl` as it
+    is added and the articles of the last fetch are kept in
+    `<path>/wiki_doc.jsonl`, so the session can be dropped from memory at
+    any time and read back as it was.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path
+        self.articles: list[Article] = []
+        self.qa: list[QA] = []
+        self._lock = threading.Lock()
+        self._sink: JsonlSink | None = None
+        if path is not None:
+            self.articles = [
+                Article.model_validate(record)
+                for record in read_jsonl(path / "wiki_doc.jsonl")
+            ]
+            self.qa = [
+                QA.model_validate(record)
+                for record in read_jsonl(path / "wiki_qa.jsonl")
+            ]
+            self._sink = JsonlSink(path / "wiki_qa.jsonl", flush_every=1)
+
+    def set_articles(self, articles: Iterable[Article]) -> None:
+        with self._lock:
+            self.articles = list(articles)
+            if self.path is not None:
+                tmp = self.path / "wiki_doc.jsonl.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.writelines(
+                        article.model_dump_json() + "\n"
+                        for article in self.articles
+                    )
+                os.replace(tmp, self.path / "wiki_doc.jsonl")
+
+    def add_qa(self, qa: QA) -> int:
+        """Append a pair, returns the number of pairs"""
+        with self._lock:
+            self.qa.append(qa)
+            if self._sink is not None:
+                self._sink.write(qa)
+            return len(self.qa)
+
+    def close(self) -> None:
+        if self._sink is not None:
+            self._sink.close()
+
+
+class SessionStore:
+    """
+    Server-side sessions, referenced from the UI by id so events don't
+    carry (and Gradio doesn't copy and compare) the whole dataset.
+
+    Sessions live in memory. With a `path`, they are also written through
+    to `<path>/<id>/`, and beyond `max_sessions` the least recently used
+    ones are dropped from memory and read back from disk when next used.
+    """
+
+    def __init__(
+        self, path: str | Path | None = None, max_sessions: int = 64
+    ) -> None:
+        self.path = Path(path) if path else None
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def new(self) -> str:
+        session_id = uuid.uuid4().hex
+        if self.path is not None:
+            (self.path / session_id).mkdir(parents=True)
+        with self._lock:
+            self._put(session_id, self._open(session_id))
+        return session_id
+
+    def get(self, session_id: str | None) -> Session:
+        with self._lock:
+            if (session := self._sessions.get(session_id)) is not None:
+                self._sessions.move_to_end(session_id)
+                return session
+            if not (
+                session_id
+                and self.path is not None
+                and (self.path / session_id).is_dir()
+            ):
+                raise KeyError(session_id)
+            # spilled, read it back
+            session = self._open(session_id)
+            self._put(session_id, session)
+            return session
+
+    def drop(self, session_id: str | None) -> None:
+        """Forget a session, also on disk"""
+        if session_id is None:
+            return
+        with self._lock:
+            if (session := self._sessions.pop(session_id, None)) is not None:
+                session.close()
+        if self.path is not None:
+            shutil.rmtree(self.path / session_id, ignore_errors=True)
+
+    def _open(self, session_id: str) -> Session:
+        return Session(None if self.path is None else self.path / session_id)
+
+    def _put(self, session_id: str, session: Session) -> None:
+        self._sessions[session_id] = session
+        # only sessions on disk can leave memory without losing them
+        while self.path is not None and len(self._sessions) > self.max_sessions:
+            _, spilled = self._sessions.popitem(last=False)
+            spilled.close()
+
+
+shared_sessions = SessionStore(settings.SESSION_DIR, settings.SESSION_MAX)
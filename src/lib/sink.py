@@ -0,0 +1,201 @@
+import atexit
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from lib.telemetry import telemetry
+from lib.types import Article
+from settings import settings
+
+
+class JsonlSink:
+    """
+    Append-only JSONL writer for dataset records (`Article`, `QA`, dicts).
+
+    Records are buffered and written `flush_every` at a time. Every
+    `checkpoint_every` seconds (and on `close`) the file is fsynced and the
+    byte offset and record count are committed to `<path>.ckpt`. Opening an
+    existing file drops whatever follows the last complete line, e.g. a
+    half-written record of a killed run, so appending resumes cleanly.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        flush_every: int = 32,
+        checkpoint_every: float = 30.0,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_path = self.path.with_name(self.path.name + ".ckpt")
+        self.flush_every = flush_every
+        self.checkpoint_every = checkpoint_every
+        self._lock = threading.Lock()
+        self._buffer: list[bytes] = []
+        self.records = self._recover()
+        self._file = open(self.path, "ab")
+        self._last_checkpoint = time.monotonic()
+
+    def write(self, record: BaseModel | dict) -> None:
+        line = (
+            json.dumps(record, ensure_ascii=False)
+            if isinstance(record, dict)
+            else record.model_dump_json()  # models and `ArticleView`s
+        )
+        with self._lock:
+            self._buffer.append(line.encode("utf-8") + b"\n")
+            if len(self._buffer) >= self.flush_every:
+                self._flush()
+            if time.monotonic() - self._last_checkpoint > self.checkpoint_every:
+                self._checkpoint()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def checkpoint(self) -> None:
+        with self._lock:
+            self._checkpoint()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            self._checkpoint()
+            self._file.close()
+
+    def __enter__(self) -> "JsonlSink":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self._file.write(b"".join(self._buffer))
+            self.records += len(self._buffer)
+            self._buffer.clear()
+        self._file.flush()
+
+    def _checkpoint(self) -> None:
+        self._flush()
+        os.fsync(self._file.fileno())
+        state = {"offset": self._file.tell(), "records": self.records}
+        tmp = self.checkpoint_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state), encoding="utf-8")
+        os.replace(tmp, self.checkpoint_path)
+        self._last_checkpoint = time.monotonic()
+
+    def _recover(self) -> int:
+        """Truncate a torn last line and count the records kept"""
+        if not self.path.exists():
+            return 0
+        offset = records = 0
+        if self.checkpoint_path.exists():
+            state = json.loads(self.checkpoint_path.read_text("utf-8"))
+            if state["offset"] <= self.path.stat().st_size:
+                offset, records = state["offset"], state["records"]
+        with open(self.path, "rb+") as f:
+            f.seek(offset)
+            for line in iter(f.readline, b""):
+                if not line.endswith(b"\n"):
+                    if _complete(line):  # written by hand, not torn
+                        f.write(b"\n")
+                        offset += len(line) + 1
+                        records += 1
+                    break
+                offset += len(line)
+                records += 1
+            f.truncate(offset)
+        return records
+
+
+@functools.cache
+def get_dataset_sink(name: str) -> JsonlSink | None:
+    """
+    Shared sink writing every record straight to `DATASET_DIR/<name>`,
+    disabled with `DATASET_DIR=`
+    """
+    if not settings.DATASET_DIR:
+        return None
+    sink = JsonlSink(Path(settings.DATASET_DIR) / name, flush_every=1)
+    atexit.register(sink.close)
+    return sink
+
+
+_articles_lock = threading.Lock()
+
+
+@functools.cache
+def _saved_articles(name: str) -> set[tuple[str, str]]:
+    return {
+        (doc["title"], doc["language"])
+        for doc in read_jsonl(Path(settings.DATASET_DIR) / name)
+    }
+
+
+def save_articles(
+    articles: Iterable[Article], name: str = "wiki_doc.jsonl"
+) -> int:
+    """
+    Stream articles to `DATASET_DIR/<name>` through `get_dataset_sink`,
+    each (title, language) once. Returns the number written.
+    """
+    if not (sink := get_dataset_sink(name)):
+        return 0
+    written = 0
+    with _articles_lock:
+        saved = _saved_articles(name)
+        for article in articles:
+            key = (article.title, article.language)
+            if key not in saved:
+                saved.add(key)
+                sink.write(article)
+                written += 1
+    return written
+
+
+def read_jsonl(path: str | Path) -> Iterator[dict]:
+    """Stream the records of a JSONL file, skipping a torn last line"""
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.endswith("\n") and line.strip():
+                yield json.loads(line)
+            elif _complete(line):  # last line without a newline
+                yield json.loads(line)
+
+
+def _complete(line: str | bytes) -> bool:
+    try:
+        json.loads(line)
+    except ValueError:
+        return False
+    return True
+
+
+@telemetry.timed("export")
+def export_jsonl(
+    records: Iterable[BaseModel | dict], prefix: str = "data_"
+) -> str:
+    """Write records one line at a time to a new temp `.jsonl` file"""
+    with tempfile.NamedTemporaryFile(
+        mode="w", suffix=".jsonl", prefix=prefix, delete=False, encoding="utf-8"
+    ) as f:
+        for record in records:
+            f.write(
+                record.model_dump_json()
+                if isinstance(record, BaseModel)
+                else json.dumps(record, ensure_ascii=False)
+            )
+            f.write("\n")
+        return f.name
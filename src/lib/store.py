@@ -0,0 +1,197 @@
+import sys
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+
+from lib.corpus import load_articles
+from lib.types import Article, Chunk
+
+
+class ArticleStore:
+    """
+    Compact in-memory corpus.
+
+    The chunk contents of an article are joined into one UTF-8 buffer and
+    every chunk is a (start, end, heading id, level) row of flat `array`s,
+    with headings and languages interned, so a chunk costs a few machine
+    words instead of a dict and its own heading string. `store[j]` is a lazy
+    `ArticleView`; chunk dicts are only built when read.
+    """
+
+    __slots__ = (
+        "titles",
+        "sources",
+        "languages",
+        "summaries",
+        "texts",
+        "first_chunk",
+        "starts",
+        "ends",
+        "levels",
+        "heading_ids",
+        "headings",
+        "_heading_index",
+        "_positions",
+    )
+
+    def __init__(self, articles: Iterable[Article] = ()) -> None:
+        self.titles: list[str] = []
+        self.sources: list[str] = []
+        self.languages: list[str] = []
+        self.summaries: list[str] = []
+        self.texts: list[bytes] = []
+        self.first_chunk = array("q", [0])
+        self.starts = array("q")
+        self.ends = array("q")
+        self.levels = array("b")
+        self.heading_ids = array("l")
+        self.headings: list[str] = []
+        self._heading_index: dict[str, int] = {}
+        self._positions: dict[tuple[str, str], int] = {}
+        self.extend(articles)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "ArticleStore":
+        """Read a `wiki_doc.jsonl` file or a corpus directory"""
+        return cls(load_articles(path))
+
+    def add(self, article: "Article | ArticleView") -> int:
+        position = len(self.titles)
+        self.titles.append(article.title)
+        self.sources.append(article.source)
+        self.languages.append(sys.intern(article.language))
+        self.summaries.append(article.summary)
+        offset = 0
+        contents = []
+        for chunk in article.chunks:
+            heading = chunk["heading"]
+            if (heading_id := self._heading_index.get(heading)) is None:
+                heading_id = self._heading_index[heading] = len(self.headings)
+                self.headings.append(heading)
+            contents.append(chunk["content"].encode("utf-8"))
+            self.starts.append(offset)
+            offset += len(contents[-1])
+            self.ends.append(offset)
+            self.levels.append(chunk["level"])
+            self.heading_ids.append(heading_id)
+        self.texts.append(b"".join(contents))
+        self.first_chunk.append(len(self.starts))
+        self._positions[(article.title, article.language)] = position
+        return position
+
+    def extend(self, articles: Iterable["Article | ArticleView"]) -> None:
+        for article in articles:
+            self.add(article)
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def __getitem__(self, j: int) -> "ArticleView":
+        if not -len(self) <= j < len(self):
+            raise IndexError(j)
+        return ArticleView(self, j % len(self))
+
+    def __iter__(self) -> Iterator["ArticleView"]:
+        for j in range(len(self)):
+            yield ArticleView(self, j)
+
+    def find(self, title: str, language: str) -> "ArticleView | None":
+        j = self._positions.get((title, language))
+        return None if j is None else ArticleView(self, j)
+
+    def chunk(self, j: int, i: int) -> Chunk:
+        """Chunk `i` of article `j`"""
+        first, last = self.first_chunk[j], self.first_chunk[j + 1]
+        if not 0 <= i < last - first:
+            raise IndexError(f"article {j} has no chunk {i}")
+        row = first + i
+        content = self.texts[j][self.starts[row] : self.ends[row]]
+        return Chunk(
+            heading=self.headings[self.heading_ids[row]],
+            level=self.levels[row],
+            content=content.decode("utf-8"),
+        )
+
+
+class ChunkList(Sequence):
+    """The chunks of a stored article, built on access"""
+
+    __slots__ = ("_store", "_article")
+
+    def __init__(self, store: ArticleStore, article: int) -> None:
+        self._store = store
+        self._article = article
+
+    def __len__(self) -> int:
+        first = self._store.first_chunk
+        return first[self._article + 1] - first[self._article]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self._store.chunk(self._article, i)
+
+
+class ArticleView:
+    """
+    Read-only `Article` stand-in backed by an `ArticleStore`: same fields
+    (`chunks` is a lazy sequence of chunk dicts), `model_dump_json`,
+    `to_json`, and `to_article` for a real pydantic copy.
+    """
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: ArticleStore, index: int) -> None:
+        self._store = store
+        self._index = index
+
+    @property
+    def title(self) -> str:
+        return self._store.titles[self._index]
+
+    @property
+    def source(self) -> str:
+        return self._store.sources[self._index]
+
+    @property
+    def language(self) -> str:
+        return self._store.languages[self._index]
+
+    @property
+    def summary(self) -> str:
+        return self._store.summaries[self._index]
+
+    @property
+    def chunks(self) -> ChunkList:
+        return ChunkList(self._store, self._index)
+
+    def to_article(self) -> Article:
+        return Article(
+            title=self.title,
+            source=self.source,
+            language=self.language,
+            chunks=list(self.chunks),
+            summary=self.summary,
+        )
+
+    def to_json(self) -> dict:
+        return self.to_article().to_json()
+
+    def model_dump_json(self) -> str:
+        return self.to_article().model_dump_json()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ArticleView | Article):
+            return (
+                self.title == other.title
+                and self.language == other.language
+                and self.source == other.source
+                and self.summary == other.summary
+                and list(self.chunks) == list(other.chunks)
+            )
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ArticleView({self.language}:{self.title})"
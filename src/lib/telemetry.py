@@ -0,0 +1,190 @@
+import atexit
+import bisect
+import functools
+import json
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from settings import settings
+
+PREFIX = "wikiqa_"
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+THROUGHPUT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+BUCKETS = {
+    "stage_seconds": LATENCY_BUCKETS,
+    "generation_tokens_per_second": THROUGHPUT_BUCKETS,
+}
+HELP = {
+    "stage_seconds": "Latency of a pipeline stage",
+    "stage_errors_total": "Calls of a stage that raised",
+    "prompt_tokens_total": "Prompt tokens sent to the model",
+    "completion_tokens_total": "Completion tokens generated by the model",
+    "generation_tokens_per_second": "Completion tokens per second of an "
+    "engine call",
+    "cache_requests_total": "Cache lookups by result (hit, miss)",
+    "generation_failures_total": "Generations without a valid Q/A pair",
+    "parse_failures_total": "LLM outputs `parse_qa_output` couldn't parse",
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Telemetry:
+    """
+    Process-wide counters and histograms, with an optional JSONL trace.
+
+    `span(stage)` (or the `timed(stage)` decorator) times a block into the
+    `stage_seconds` histogram, counts the calls that raise, and writes one
+    trace record per call to `trace_path`. `render` gives every metric in
+    the Prometheus text format.
+    """
+
+    def __init__(self, trace_path: str | Path | None = None) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[Labels, float]] = {}
+        # per label set: [count per bucket (last one is +Inf), sum]
+        self._histograms: dict[str, dict[Labels, list]] = {}
+        self._trace = None
+        if trace_path:
+            Path(trace_path).parent.mkdir(parents=True, exist_ok=True)
+            # line buffered: a record is on disk once its span ends
+            self._trace = open(trace_path, "a", buffering=1, encoding="utf-8")
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        buckets = BUCKETS.get(name, LATENCY_BUCKETS)
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            counts, _ = series.setdefault(key, [[0] * (len(buckets) + 1), 0.0])
+            counts[bisect.bisect_left(buckets, value)] += 1
+            series[key][1] += value
+
+    @contextmanager
+    def span(self, stage: str, **attrs) -> Iterator[dict]:
+        """
+        Time the block as `stage`; the yielded dict is written to the trace
+        record, so the block can add to it (e.g. token counts)
+        """
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield attrs
+            ok = True
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe("stage_seconds", seconds, stage=stage)
+            if not ok:
+                self.inc("stage_errors_total", stage=stage)
+            if self._trace is not None:
+                record = {
+                    "time": time.time(),
+                    "stage": stage,
+                    "seconds": round(seconds, 6),
+                    "ok": ok,
+                    **attrs,
+                }
+                line = json.dumps(record, ensure_ascii=False) + "\n"
+                with self._lock:
+                    if self._trace is not None:  # not closed meanwhile
+                        self._trace.write(line)
+
+    def timed(self, stage: str) -> Callable[[Callable], Callable]:
+        """Decorator running every call of the function in a `span`"""
+
+        def decorator(fn: Callable) -> Callable:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def value(self, name: str, **labels: str) -> float:
+        """Current value of a counter, or count of a histogram"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            if name in self._histograms:
+                counts, _ = self._histograms[name].get(key, ([0], 0.0))
+                return sum(counts)
+            return self._counters.get(name, {}).get(key, 0)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines += _header(name, "counter")
+                for labels, value in series.items():
+                    lines.append(f"{PREFIX}{name}{_labels(labels)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                buckets = BUCKETS.get(name, LATENCY_BUCKETS)
+                lines += _header(name, "histogram")
+                for labels, (counts, total) in series.items():
+                    cumulative = 0
+                    for le, count in zip([*buckets, "+Inf"], counts):
+                        cumulative += count
+                        bucket = _labels((*labels, ("le", f"{le}")))
+                        lines.append(
+                            f"{PREFIX}{name}_bucket{bucket} {cumulative}"
+                        )
+                    lines.append(
+                        f"{PREFIX}{name}_sum{_labels(labels)} {total:g}"
+                    )
+                    lines.append(
+                        f"{PREFIX}{name}_count{_labels(labels)} {cumulative}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+
+def _header(name: str, kind: str) -> list[str]:
+    return [
+        f"# HELP {PREFIX}{name} {HELP.get(name, name)}",
+        f"# TYPE {PREFIX}{name} {kind}",
+    ]
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = (f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+telemetry = Telemetry(settings.TRACE_FILE or None)
+atexit.register(telemetry.close)
@@ -0,0 +1,88 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+
+from settings import settings
+
+# Rough ratio for English/Spanish prose with BPE vocabularies
+CHARS_PER_TOKEN = 4
+
+
+@functools.cache
+def get_tokenizer():
+    """
+    Hugging Face tokenizer named by `TOKENIZER` (the `LLM_MODEL` one by
+    default), or None when it can't be loaded or `TOKENIZER=approx`, in which
+    case token counts are approximated from the text length.
+    """
+    name = settings.TOKENIZER or settings.LLM_MODEL
+    if name == "approx":
+        return None
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        return None
+    try:
+        return AutoTokenizer.from_pretrained(name)
+    except (OSError, ValueError) as e:
+        print(f"Could not load tokenizer '{name}', approximating: {e}")
+        return None
+
+
+def tokenizer_name() -> str:
+    """Identifies how tokens are counted, e.g. for cache keys"""
+    if get_tokenizer() is None:
+        return "approx"
+    return settings.TOKENIZER or settings.LLM_MODEL
+
+
+def digest_cache(maxsize: int) -> Callable[[Callable], Callable]:
+    """
+    `functools.lru_cache` for functions of one string, keyed by a digest of
+    it: cached entries don't keep (possibly large) texts alive
+    """
+
+    def decorator(fn: Callable[[str], int]) -> Callable[[str], int]:
+        cache: OrderedDict[bytes, int] = OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(fn)
+        def wrapper(text: str) -> int:
+            key = hashlib.blake2b(
+                text.encode("utf-8", "surrogatepass"), digest_size=16
+            ).digest()
+            with lock:
+                if (value := cache.get(key)) is not None:
+                    cache.move_to_end(key)
+                    return value
+            value = fn(text)
+            with lock:
+                cache[key] = value
+                if len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return value
+
+        def cache_clear() -> None:
+            with lock:
+                cache.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in `text`"""
+    if get_tokenizer() is None:
+        # cheaper than hashing the text for the cache
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return count_encoded(text)
+
+
+@digest_cache(maxsize=1 << 16)
+def count_encoded(text: str) -> int:
+    """Tokenizer count of `text` (cached, pieces get counted repeatedly)"""
+    return len(get_tokenizer().encode(text, add_special_tokens=False))
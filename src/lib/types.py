@@ -1,6 +1,6 @@
 import typing as t
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_serializer
 
 
 class Chunk(t.TypedDict):
@@ -33,9 +33,19 @@ class QA(BaseModel):
     chunks: list[int]
     question: str
     answer: str
+    # the chunks the job asked for, when some of them didn't fit the prompt
+    requested_chunks: list[int] | None = None
+
+    @model_serializer(mode="wrap")
+    def _serialize(self, handler) -> dict:
+        # only rows with a cut context carry `requested_chunks`
+        data = handler(self)
+        if data.get("requested_chunks") is None:
+            data.pop("requested_chunks", None)
+        return data
 
     def to_json(self) -> dict:
-        return self.__dict__
+        return self.model_dump()
 
 
 class QAFormat(BaseModel):
@@ -1,11 +1,42 @@
-import json
 import re
-import tempfile
-from typing import Any
+import threading
+import time
 
+from lib.telemetry import telemetry
 from lib.types import Chunk
 
-
+INVISIBLE_CHARS = "\u2060\u200b\u200c\u200d"
+PUNCT_AFTER_SPACE = frozenset(",.!?;:)")
+RE_SPACES = re.compile(r"[ \t]+")
+# Everything `clean_text` rewrites, found in one scan. The leading `[\s{]`
+# lets the regex engine skip ahead to candidates; the lookbehinds then tell
+# which branch the consumed character belongs to:
+#   - a `{\displaystyle ...}` block
+#   - a lone variable between newlines, with the whitespace around it
+#   - a whitespace run that changes: longer than one character, any
+#     character other than a space, or a space at the edges, after "(" or
+#     before punctuation
+RE_CLEAN = re.compile(
+    r"[\s{](?:"
+    r"(?<=\{)(?P<latex>\s*\\displaystyle\s*[^}]+\})"
+    r"|(?:(?<=[^\S\n])[^\S\n]*\n|(?<=\n))\s*(?P<var>[a-zA-Z])\s*\n[^\S\n]*"
+    r"|(?<=\s)\s+"
+    r"|(?<=[^\S ])"
+    r"|(?<=\A )|(?<=\( )|(?<= )(?=[,.!?;:)]|\Z)"
+    r")"
+)
+# The original passes, applied to a matched LaTeX block only
+RE_LATEX_STEPS = [
+    (re.compile(r"\n\s*([a-zA-Z])\s*\n"), r" \1 "),
+    (re.compile(r"\{\s*\\displaystyle\s*([^}]+)\s*\}"), r"{\\displaystyle \1}"),
+    (RE_SPACES, " "),
+    (re.compile(r"\s+([,.!?;:])"), r"\1"),
+    (re.compile(r"\(\s+"), "("),
+    (re.compile(r"\s+\)"), ")"),
+]
+
+
+@telemetry.timed("format_context")
 def format_context(context: list[Chunk]) -> str:
     context_str = ""
     for chunk in context:
@@ -14,14 +45,6 @@ def format_context(context: list[Chunk]) -> str:
     return context_str
 
 
-def create_json_file(data: Any, prefix: str = "data_") -> str:
-    with tempfile.NamedTemporaryFile(
-        mode="w+", suffix=".json", prefix=prefix, delete=False, encoding="utf-8"
-    ) as temp_f:
-        json.dump(data, temp_f, indent=2, ensure_ascii=False)
-        return temp_f.name
-
-
 def parse_qa_output(llm_output: str) -> tuple[str, str] | None:
     """
     Parses the LLM output string to extract the Question and Answer.
@@ -55,6 +78,7 @@ def parse_qa_output(llm_output: str) -> tuple[str, str] | None:
 
     if not llm_output:
         print("`llm_output` should be defined.")
+        telemetry.inc("parse_failures_total", reason="empty")
         return None
 
     pattern = r"Question:\s*(.*?)\s*Answer:\s*(.*)"
@@ -68,6 +92,7 @@ def parse_qa_output(llm_output: str) -> tuple[str, str] | None:
     else:
         # Handle cases where the pattern wasn't found at all
         print(f"Warning: Could not parse Q/A structure from: {llm_output}")
+        telemetry.inc("parse_failures_total", reason="no_match")
         return None
 
 
@@ -78,78 +103,68 @@ def clean_text(text: str) -> str:
     2. Removing excessive newlines around variables
     3. Normalizing whitespace
     4. Keeping meaningful punctuation
+
+    Single scan over the text: every span the old step-by-step version
+    would touch (whitespace runs, lone variables between newlines and
+    `{\\displaystyle ...}` blocks) is matched by `RE_CLEAN` and rewritten
+    in place, giving the same output.
     """
     # Remove invisible Unicode characters
-    text = re.sub(r"[\u2060\u200b\u200c\u200d]", "", text)
-
-    # Fix spacing around single variables
-    text = re.sub(r"\n\s*([a-zA-Z])\s*\n", r" \1 ", text)
-
-    # Normalize LaTeX displaystyle blocks
-    text = re.sub(
-        r"\{\s*\\displaystyle\s*([^}]+)\s*\}", r"{\\displaystyle \1}", text
-    )
-
-    # Compress multiple spaces
-    text = re.sub(r"[ \t]+", " ", text)
-
-    # Fix spacing before punctuation
-    text = re.sub(r"\s+([,.!?;:])", r"\1", text)
-
-    # Remove space after opening and before closing parentheses
-    text = re.sub(r"\(\s+", "(", text)
-    text = re.sub(r"\s+\)", ")", text)
-
-    # Remove leading/trailing whitespace
-    text = text.strip()
-
-    return text
-
-
-def split_text(text: str, max_size: int) -> list[str]:
-    """Split text into chunks of maximum size, trying to break at sentence boundaries"""
-    chunks = []
-    current_chunk = ""
-
-    # First try to split at paragraphs
-    paragraphs = text.split("\n\n")
-
-    for para in paragraphs:
-        if len(current_chunk) + len(para) + 2 > max_size and current_chunk:
-            chunks.append(current_chunk.strip())
-            current_chunk = para
-        else:
-            if current_chunk:
-                current_chunk += "\n\n" + para
-            else:
-                current_chunk = para
-
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-
-    # If any chunk is still too large, split at sentence boundaries
-    final_chunks = []
-    for chunk in chunks:
-        if len(chunk) <= max_size:
-            final_chunks.append(chunk)
-            continue
-
-        sentences = re.split(r"(?<=[.!?])\s+", chunk)
-        current_sentence_chunk = ""
-        for sentence in sentences:
-            if (
-                len(current_sentence_chunk) + len(sentence) + 1 > max_size
-                and current_sentence_chunk
-            ):
-                final_chunks.append(current_sentence_chunk.strip())
-                current_sentence_chunk = sentence
-            else:
-                if current_sentence_chunk:
-                    current_sentence_chunk += " " + sentence
-                else:
-                    current_sentence_chunk = sentence
-
-        if current_sentence_chunk:
-            final_chunks.append(current_sentence_chunk.strip())
-
-    return final_chunks
+    for char in INVISIBLE_CHARS:
+        text = text.replace(char, "")
+    end = len(text)
+
+    def replace(match: re.Match) -> str:
+        start, stop = match.span()
+        found = match.group()
+        # a space is dropped at the edges, after "(" and before punctuation
+        drop_left = start == 0 or text[start - 1] == "("
+        drop_right = stop == end or text[stop] in PUNCT_AFTER_SPACE
+        if match["latex"]:
+            for pattern, repl in RE_LATEX_STEPS:
+                found = pattern.sub(repl, found)
+            return found
+        if var := match["var"]:
+            # spacing around single variables
+            head = found[: found.index("\n")]
+            tail = found[found.rindex("\n") + 1 :]
+            left = "" if drop_left else RE_SPACES.sub(" ", head + " ")
+            right = "" if drop_right else RE_SPACES.sub(" ", " " + tail)
+            return left + var + right
+        if drop_left or drop_right:
+            return ""
+        return RE_SPACES.sub(" ", found)
+
+    return RE_CLEAN.sub(replace, text)
+
+
+class RateLimiter:
+    """Token bucket shared between threads: at most `rate` calls per second"""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+def page_bounds(total: int, page: int, size: int) -> tuple[range, int, int]:
+    """Items shown on `page` (clamped to the last one), the page, pages"""
+    pages = max(1, -(-total // size))
+    page = min(max(page, 0), pages - 1)
+    return range(page * size, min(total, (page + 1) * size)), page, pages
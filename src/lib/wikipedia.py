@@ -1,62 +1,360 @@
+import re
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import batched
+
+import requests
 import wikipediaapi as wiki
+from requests.adapters import HTTPAdapter
 
+from lib.cache import ArticleCache, get_article_cache
+from lib.chunker import chunk_text
+from lib.telemetry import telemetry
+from lib.tokenizer import tokenizer_name
 from lib.types import Article, Chunk
-from lib.utils import clean_text, split_text
+from lib.utils import RateLimiter, clean_text
+from settings import settings
+
+USER_AGENT = "WikiQA (merlin@example.com)"
+API_URL = "https://{lang}.wikipedia.org/w/api.php"
+MAX_TITLES_PER_QUERY = 50  # MediaWiki limit for anonymous clients
+RE_SECTION = wiki.RE_SECTION[wiki.ExtractFormat.WIKI]
+
+wk = wiki.Wikipedia(user_agent=USER_AGENT, language="en")
 
-wk = wiki.Wikipedia(user_agent="WikiQA (merlin@example.com)", language="en")
+# Bump whenever `clean_text` or the chunking output changes, so cached
+# articles built by an older version are not served anymore
+CHUNKING_VERSION = 3
 
 
+@telemetry.timed("fetch")
 def get_wikipedia_article(
-    title: str, langs: str | list[str] = "en", max_chunk_size: int = 2000
+    title: str,
+    langs: str | list[str] = "en",
+    max_chunk_tokens: int = settings.CHUNK_TOKENS,
+    cache: ArticleCache | None = None,
 ) -> list[Article]:
     """Fetch and chunk a Wikipedia article"""
     langs = [langs] if isinstance(langs, str) else langs
+    cache = cache or get_article_cache()
+    params = _chunking_params(max_chunk_tokens)
 
     # Theres only needed to fetch the en version
+    wanted = ["en", *filter(lambda x: x != "en", langs)]
+    if cache:
+        cached = [cache.latest(title, lang, params) for lang in wanted]
+        if all(cached):
+            return cached  # type: ignore[return-value]
+
     page = wk.page(title)
-    pages = [page] if page.exists() else []
+    pages = [("en", page)] if page.exists() else []
 
-    for lang in filter(lambda x: x != "en", langs):
+    for lang in wanted[1:]:
         lang_page = page.langlinks.get(lang)
         if lang_page:
-            pages.append(lang_page)
-
-    return [
-        Article(
-            title=page.title,
-            source=page.fullurl or "unknow",
-            language=page.language,
-            chunks=_get_chunks(page.sections, max_chunk_size),
-            summary=clean_text(page.summary),
+            pages.append((lang, lang_page))
+
+    articles = []
+    for lang, page in pages:
+        article = (
+            cache.get(title, lang, page.lastrevid, params) if cache else None
+        )
+        if article is None:
+            article = _build_article(page, max_chunk_tokens)
+            if cache:
+                cache.put(title, lang, page.lastrevid, params, article)
+        articles.append(article)
+    return articles
+
+
+def get_wikipedia_articles(
+    titles: list[str], langs: str | list[str] = "en", **kwargs
+) -> dict[str, list[Article]]:
+    """Bulk version of `get_wikipedia_article`, keyed by requested title"""
+    langs = [langs] if isinstance(langs, str) else langs
+    wanted = ["en", *filter(lambda x: x != "en", langs)]
+    found: dict[str, dict[str, Article]] = {title: {} for title in titles}
+    for title, lang, article in iter_wikipedia_articles(
+        titles, langs, **kwargs
+    ):
+        found[title][lang] = article
+    return {
+        title: [articles[lang] for lang in wanted if lang in articles]
+        for title, articles in found.items()
+    }
+
+
+def iter_wikipedia_articles(
+    titles: list[str],
+    langs: str | list[str] = "en",
+    max_chunk_tokens: int = settings.CHUNK_TOKENS,
+    cache: ArticleCache | None = None,
+    max_workers: int = 8,
+    rate: float = 20.0,
+    api_url: str = API_URL,
+) -> Iterator[tuple[str, str, Article]]:
+    """
+    Fetch many articles at once, yielding `(title, lang, article)` as each
+    one is ready.
+
+    Titles are resolved with multi-title queries (info and langlinks for up
+    to 50 pages per request), then every page whose revision is not cached
+    gets its extract fetched concurrently. All requests share one pooled
+    session and are throttled to `rate` requests per second.
+    """
+    langs = [langs] if isinstance(langs, str) else langs
+    cache = cache or get_article_cache()
+    params = _chunking_params(max_chunk_tokens)
+    wanted = ["en", *filter(lambda x: x != "en", langs)]
+
+    pending = []
+    for title in dict.fromkeys(titles):
+        cached = (
+            [cache.latest(title, lang, params) for lang in wanted]
+            if cache
+            else []
+        )
+        if cached and all(cached):
+            for lang, article in zip(wanted, cached):
+                yield title, lang, article  # type: ignore[misc]
+        else:
+            pending.append(title)
+    if not pending:
+        return
+
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    limiter = RateLimiter(rate, burst=max_workers)
+
+    def query(lang: str, query_params: dict) -> dict:
+        limiter.wait()
+        response = session.get(
+            api_url.format(lang=lang),
+            params={
+                "action": "query",
+                "format": "json",
+                "formatversion": 2,
+                "redirects": 1,
+                **query_params,
+            },
+            timeout=10,
         )
-        for page in pages
-    ]
+        response.raise_for_status()
+        return response.json()
+
+    def query_pages(
+        lang: str, titles: list[str], prop_params: dict
+    ) -> dict[str, dict]:
+        """Run a prop query over `titles` in groups, keyed by requested title"""
+        found: dict[str, dict] = {}
+        for group in batched(titles, MAX_TITLES_PER_QUERY):
+            pages: dict[str, dict] = {}
+            aliases: dict[str, str] = {}
+            extra: dict = {}
+            while True:
+                data = query(
+                    lang, {"titles": "|".join(group), **prop_params, **extra}
+                )
+                result = data.get("query", {})
+                for alias in result.get("normalized", []) + result.get(
+                    "redirects", []
+                ):
+                    aliases[alias["from"]] = alias["to"]
+                for page in result.get("pages", []):
+                    if page.get("missing") or page.get("invalid"):
+                        continue
+                    merged = pages.setdefault(page["title"], page)
+                    if merged is not page:
+                        merged.setdefault("langlinks", []).extend(
+                            page.get("langlinks", [])
+                        )
+                if "continue" not in data:
+                    break
+                extra = data["continue"]
+            for title in group:
+                # normalized -> redirected title
+                resolved = title
+                for _ in range(len(aliases)):
+                    resolved = aliases.get(resolved, resolved)
+                if resolved in pages:
+                    found[title] = pages[resolved]
+        return found
+
+    try:
+        with ThreadPoolExecutor(max_workers) as pool:
+            # (1) English pages and their langlinks, one grouped query per lang
+            info = pool.submit(
+                query_pages, "en", pending, {"prop": "info", "inprop": "url"}
+            )
+            links = {
+                lang: pool.submit(
+                    query_pages,
+                    "en",
+                    pending,
+                    {"prop": "langlinks", "lllang": lang, "lllimit": "max"},
+                )
+                for lang in wanted[1:]
+            }
+            pages = {
+                ("en", title): page for title, page in info.result().items()
+            }
+
+            # (2) Resolve the linked pages on every other language wiki
+            targets: dict[str, dict[str, str]] = {}
+            for lang, future in links.items():
+                for title, page in future.result().items():
+                    if ("en", title) in pages and page.get("langlinks"):
+                        targets.setdefault(lang, {})[title] = page["langlinks"][
+                            0
+                        ]["title"]
+            linked = {
+                lang: pool.submit(
+                    query_pages,
+                    lang,
+                    list(by_title.values()),
+                    {"prop": "info", "inprop": "url"},
+                )
+                for lang, by_title in targets.items()
+            }
+            for lang, future in linked.items():
+                lang_pages = future.result()
+                for title, lang_title in targets[lang].items():
+                    if lang_title in lang_pages:
+                        pages[(lang, title)] = lang_pages[lang_title]
+
+            # (3) Extracts for everything not cached at its current revision
+            def build(lang: str, title: str, page: dict) -> Article:
+                data = query(
+                    lang,
+                    {
+                        "prop": "extracts",
+                        "explaintext": 1,
+                        "exsectionformat": "wiki",
+                        "pageids": page["pageid"],
+                    },
+                )
+                article = article_from_extract(
+                    title=page["title"],
+                    source=page.get("fullurl") or "unknow",
+                    language=lang,
+                    extract=data["query"]["pages"][0].get("extract", ""),
+                    max_chunk_tokens=max_chunk_tokens,
+                )
+                if cache:
+                    cache.put(title, lang, page["lastrevid"], params, article)
+                return article
+
+            futures = {}
+            for (lang, title), page in pages.items():
+                article = (
+                    cache.get(title, lang, page["lastrevid"], params)
+                    if cache
+                    else None
+                )
+                if article:
+                    yield title, lang, article
+                else:
+                    futures[pool.submit(build, lang, title, page)] = (
+                        title,
+                        lang,
+                    )
+            for future in as_completed(futures):
+                title, lang = futures[future]
+                try:
+                    yield title, lang, future.result()
+                except Exception as e:
+                    print(f"Error fetching '{title}' ({lang}): {e}")
+
+    finally:
+        session.close()
+
+
+@telemetry.timed("chunk")
+def article_from_extract(
+    title: str,
+    source: str,
+    language: str,
+    extract: str,
+    max_chunk_tokens: int,
+) -> Article:
+    """Build an Article from plain text with `== Heading ==` section markers"""
+    summary, sections = _parse_extract(extract)
+    return Article(
+        title=title,
+        source=source,
+        language=language,
+        chunks=_get_chunks(sections, max_chunk_tokens),
+        summary=clean_text(summary),
+    )
+
+
+def _parse_extract(extract: str) -> tuple[str, list[wiki.WikipediaPageSection]]:
+    """Split a plain-text extract into summary and section tree like wikipediaapi"""
+    matches = list(re.finditer(RE_SECTION, extract))
+    if not matches:
+        return extract.strip(), []
+
+    summary = extract[: matches[0].start()].strip()
+    root: list[wiki.WikipediaPageSection] = []
+    stack: list[wiki.WikipediaPageSection] = []
+    for i, match in enumerate(matches):
+        if i + 1 < len(matches):
+            text = extract[match.end() : matches[i + 1].start()].strip()
+        else:
+            text = extract[match.end() :]
+        level = len(match.group(1)) - 1
+        section = wiki.WikipediaPageSection(
+            wk, match.group(2).strip(), level, text
+        )
+        while len(stack) >= level:
+            stack.pop()
+        (stack[-1].sections if stack else root).append(section)
+        stack.append(section)
+    return summary, root
+
+
+@telemetry.timed("chunk")
+def _build_article(page: wiki.WikipediaPage, max_chunk_tokens: int) -> Article:
+    return Article(
+        title=page.title,
+        source=page.fullurl or "unknow",
+        language=page.language,
+        chunks=_get_chunks(page.sections, max_chunk_tokens),
+        summary=clean_text(page.summary),
+    )
+
+
+def _chunking_params(max_chunk_tokens: int) -> dict:
+    """Everything the chunks depend on, part of the article cache key"""
+    return {
+        "max_chunk_tokens": max_chunk_tokens,
+        "chunk_overlap": settings.CHUNK_OVERLAP,
+        "tokenizer": tokenizer_name(),
+        "version": CHUNKING_VERSION,
+    }
 
 
 def _get_chunks(
     sections: list[wiki.WikipediaPageSection],
-    max_chunk_size: int = 300,
+    max_chunk_tokens: int = 512,
     level: int = 0,
 ) -> list[Chunk]:
     chunks: list[Chunk] = []
     for section in sections:
         cleaned_text = clean_text(section.text)
-        if len(cleaned_text) == 0:
-            continue
-        if len(cleaned_text) > max_chunk_size:
-            chunk_parts = split_text(cleaned_text, max_chunk_size)
-            for part in chunk_parts:
-                chunks.append({
+        for span in chunk_text(
+            cleaned_text, max_chunk_tokens, settings.CHUNK_OVERLAP
+        ):
+            chunks.append(
+                {
                     "heading": section.title,
                     "level": level + 1,
-                    "content": part,
-                })
-        else:
-            chunks.append({
-                "heading": section.title,
-                "level": level + 1,
-                "content": cleaned_text,
-            })
-        subsections = _get_chunks(section.sections, level + 1)
+                    "content": span.text,
+                }
+            )
+        subsections = _get_chunks(section.sections, max_chunk_tokens, level + 1)
         chunks.extend(subsections)
     return chunks
@@ -2,36 +2,53 @@ from typing import Literal
 
 import gradio as gr
 import pandas as pd
-
-from lib.llm import generate, get_client
-from lib.prompt import PROMPT
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from lib.batcher import shared_batcher
+from lib.budget import pack_prompt
+from lib.dedup import get_duplicate_index
+from lib.dump import get_dump_articles
+from lib.llm import shared_client
+from lib.sampler import sample_chunks
+from lib.session import Session, shared_sessions
+from lib.sink import export_jsonl, get_dataset_sink, save_articles
+from lib.telemetry import telemetry
 from lib.types import QA, Article
-from lib.utils import create_json_file, format_context
+from lib.utils import page_bounds
 from lib.wikipedia import get_wikipedia_article
+from settings import settings
 
 # --- Constants ---
 
-SOURCES = ["Wikipedia"]
+SOURCES = ["Wikipedia", "Wikipedia dump"]
 LANGUAGES = ["en", "es"]
 TYPES_QUERIES = ["factual", "multihop"]
-MAX_CHUNKS_PER_QA = 3
-llm = get_client()
+CHUNK_COLUMNS = ["#", "heading", "level", "content"]
+CHUNKS_PER_PAGE = 20  # chunk table rows shown at once
+QA_SLOTS = 5  # Q/A pairs shown at once
+QA_PREVIEW = 10  # newest Q/A pairs shown as JSON
 
 # --- Backend & Data Handling
 
 
 def get_articles(
-    source: Literal["Wikipedia"], title: str, langs: list[str]
+    source: Literal["Wikipedia", "Wikipedia dump"],
+    title: str,
+    langs: list[str],
 ) -> list[Article]:
-    articles: list[Article] | None
+    articles: list[Article] = []
 
     try:
         match source:
             case "Wikipedia":
                 articles = get_wikipedia_article(title, langs)
+            case "Wikipedia dump":
+                articles = get_dump_articles(title, langs)
             case _:
                 raise ValueError(
-                    f"Unsupported source: '{source}'. Only 'Wikipedia' is currently supported."
+                    f"Unsupported source: '{source}'. Only {SOURCES} are currently supported."
                 )
     except ConnectionError as e:
         print(f"Network error while fetching from {source}: {str(e)}")
@@ -41,19 +58,47 @@ def get_articles(
     return articles
 
 
+def get_session(session_id: str | None) -> Session:
+    try:
+        return shared_sessions.get(session_id)
+    except KeyError:
+        raise gr.Error("Session expired, reload the page.") from None
+
+
+def fetch_articles(
+    session_id: str,
+    articles_rev: int,
+    source: Literal["Wikipedia", "Wikipedia dump"],
+    title: str,
+    langs: list[str],
+) -> int:
+    """Fetch articles into the session, returns the next articles revision"""
+    articles = get_articles(source, title, langs) or []
+    get_session(session_id).set_articles(articles)
+    # saved with the pairs, which only refer to them by title
+    save_articles(articles)
+    return articles_rev + 1
+
+
 def generate_syntetic_qa_pair(
     type_q: Literal["factual", "multihop"],
     article: Article,
     chunks_idx: list[int],
 ):
     chunks = [article.chunks[chunk_idx] for chunk_idx in chunks_idx]
-    context = format_context(chunks)
-    match type_q:
-        case "factual":
-            prompt = PROMPT["factual_qa_pair"].format(context=context)
 
     try:
-        qa_pair = generate(prompt=prompt, llm=llm)
+        packed = pack_prompt(type_q, chunks)
+        if not packed.kept:
+            raise ValueError("none of the selected chunks fits CTX_WINDOW")
+        if packed.dropped or packed.trimmed:
+            gr.Warning(
+                f"Context cut to fit CTX_WINDOW: {len(packed.trimmed)} "
+                f"chunk(s) trimmed, {len(packed.dropped)} dropped"
+            )
+        # every click should give a new pair, not the cached one
+        # batched with the clicks of other sessions
+        qa_pair = shared_batcher.generate(packed.prompt, use_cache=False)
         return (
             gr.update(
                 value=qa_pair.question,
@@ -65,6 +110,8 @@ def generate_syntetic_qa_pair(
                 visible=True,
                 interactive=True,
             ),
+            # only record the chunks the prompt actually used
+            gr.update(value=[chunks_idx[i] for i in packed.kept]),
         )
     except Exception as e:
         raise gr.Error(f"Error to generate {e}")
@@ -77,8 +124,10 @@ def add_to_qa_dataset(
     chunks: list[int],
     question: str,
     answer: str,
-    qa_data: list[QA],
-) -> list[QA]:
+    session_id: str,
+) -> int:
+    """Add a pair to the session and the dataset, returns the pair count"""
+    session = get_session(session_id)
     qa = QA(
         type=type,
         language=language,
@@ -87,14 +136,42 @@ def add_to_qa_dataset(
         question=question,
         answer=answer,
     )
-    qa_data.append(qa)
-    return qa_data
+    if (index := get_duplicate_index("wiki_qa.jsonl")) is not None and (
+        duplicate := index.add_qa(qa)
+    ):
+        gr.Warning(f"Not added, near-duplicate of: {duplicate}")
+        return len(session.qa)
+    # saved right away, a crash or a closed tab doesn't lose it
+    if sink := get_dataset_sink("wiki_qa.jsonl"):
+        sink.write(qa)
+    return session.add_qa(qa)
 
 
 # --- UI Builder Functions ---
 
 
-def build_article_tab(articles_state: gr.State) -> None:
+def article_choices(articles: list[Article]) -> list[tuple[str, int]]:
+    return [(f"({a.language}) - {a.title}", j) for j, a in enumerate(articles)]
+
+
+def show_chunks(articles: list[Article], j: int | None, page: int) -> tuple:
+    """Summary and one page of the chunk table of article `j`"""
+    if not articles or j is None:
+        return "", pd.DataFrame(columns=CHUNK_COLUMNS), "", 0
+    article = articles[j]
+    rows, page, pages = page_bounds(len(article.chunks), page, CHUNKS_PER_PAGE)
+    table = pd.DataFrame(
+        [{"#": i, **article.chunks[i]} for i in rows], columns=CHUNK_COLUMNS
+    )
+    return (
+        f"**Summary:** {article.summary or 'No summary available.'}",
+        table,
+        f"Page {page + 1} of {pages} ({len(article.chunks)} chunks)",
+        page,
+    )
+
+
+def build_article_tab(session: gr.State, articles_rev: gr.State) -> None:
     with gr.Tab("(1) Get Article"):
         with gr.Row():
             source = gr.Dropdown(
@@ -114,114 +191,247 @@ def build_article_tab(articles_state: gr.State) -> None:
             submit_btn=True,
         )
         title.submit(
-            get_articles,
-            inputs=[source, title, languages],
-            outputs=[articles_state],
+            fetch_articles,
+            inputs=[session, articles_rev, source, title, languages],
+            outputs=[articles_rev],
+        )
+
+        # one article and one page of its chunks at a time
+        fetched = gr.Markdown("No articles fetched yet.")
+        article = gr.Dropdown(label="Article", choices=[], interactive=True)
+        summary = gr.Markdown()
+        chunks_table = gr.DataFrame(
+            headers=CHUNK_COLUMNS, wrap=True, interactive=False
+        )
+        with gr.Row():
+            prev_page = gr.Button("Previous", size="sm")
+            page_label = gr.Markdown()
+            next_page = gr.Button("Next", size="sm")
+        page = gr.State(0)
+
+        page_outputs = [summary, chunks_table, page_label, page]
+
+        def show_fetched(session_id: str) -> tuple:
+            articles = get_session(session_id).articles
+            return (
+                f"Fetched {len(articles)} article(s)"
+                if articles
+                else "No articles fetched yet.",
+                gr.update(
+                    choices=article_choices(articles),
+                    value=0 if articles else None,
+                ),
+                *show_chunks(articles, 0, 0),
+            )
+
+        articles_rev.change(
+            show_fetched,
+            inputs=[session],
+            outputs=[fetched, article, *page_outputs],
         )
+        article.input(
+            lambda session_id, j: show_chunks(
+                get_session(session_id).articles, j, 0
+            ),
+            inputs=[session, article],
+            outputs=page_outputs,
+        )
+        for button, step in [(prev_page, -1), (next_page, 1)]:
+            button.click(
+                lambda session_id, j, page, step=step: show_chunks(
+                    get_session(session_id).articles, j, page + step
+                ),
+                inputs=[session, article, page],
+                outputs=page_outputs,
+            )
+
+
+def show_slots(
+    session_id: str,
+    j: int | None,
+    type_q: str,
+    count: int,
+    page: int,
+    saved: dict,
+) -> list:
+    """
+    Fill the `QA_SLOTS` slot components with one page of the Q/A pairs of
+    article `j` of the session: chunks picked by hand or suggested, and the pairs already
+    generated. Slots past the count are hidden.
+    """
+    hidden = [gr.update(visible=False), gr.update(), gr.update(), gr.update()]
+    articles = get_session(session_id).articles
+    if not articles or j is None:
+        return ["Fetch an article in Tab (1) first.", 0, *hidden * QA_SLOTS]
+    article = articles[j]
+    shown, page, pages = page_bounds(int(count or 1), page, QA_SLOTS)
+    suggested = sample_chunks(article, type_q, shown.stop)
+    choices = [(chunk["heading"], i) for i, chunk in enumerate(article.chunks)]
+    updates = []
+    for k in range(QA_SLOTS):
+        if k >= len(shown):
+            updates += hidden
+            continue
+        i = shown[k]
+        slot = saved.get(slot_key(j, type_q, i), {})
+        chunks = slot.get("chunks", suggested[i] if i < len(suggested) else [])
+        updates += [
+            gr.update(visible=True),
+            gr.update(
+                label=f"Pair {i + 1}: context chunks",
+                choices=choices,
+                value=chunks,
+            ),
+            gr.update(
+                value=slot.get("question", ""), visible="question" in slot
+            ),
+            gr.update(value=slot.get("answer", ""), visible="answer" in slot),
+        ]
+    label = f"Pairs {shown.start + 1}-{shown.stop} of {int(count or 1)}"
+    return [f"{label} (page {page + 1} of {pages})", page, *updates]
+
+
+def slot_key(j: int, type_q: str, i: int) -> str:
+    return f"{j}:{type_q}:{i}"
 
-        @gr.render([articles_state])
-        def display_articles(fetched_articles: list[Article]):
-            if not fetched_articles:
-                gr.Markdown("No articles fetched yet.")
-                return
-
-            gr.Markdown(f"Fetched {len(fetched_articles)} article(s):")
-            for article in fetched_articles:
-                with gr.Accordion(
-                    f"({article.language}) - {article.title}", open=False
-                ):
-                    gr.Markdown("**Summary:**")
-                    gr.Markdown(article.summary or "No summary available.")
-
-                    gr.Markdown("**Chunks:**")
-                    if article.chunks:
-                        df = pd.DataFrame(article.chunks)
-                        gr.DataFrame(df, wrap=True)
-                    else:
-                        gr.Markdown("No chunks found for this article.")
-
-
-def build_qa_tab(articles_state: gr.State, qa_data_state: gr.State) -> None:
+
+def build_qa_tab(
+    session: gr.State, articles_rev: gr.State, qa_count: gr.State
+) -> None:
     with gr.Tab("(2) Generate Q/A"):
         with gr.Row():
+            article = gr.Dropdown(
+                label="Article", choices=[], interactive=True, scale=3
+            )
             type_q = gr.Dropdown(
                 label="Question Type",
                 choices=TYPES_QUERIES,
                 value=TYPES_QUERIES[0],
                 interactive=True,
-                scale=3,
+                scale=2,
             )
             qa_counter = gr.Number(
                 1, label="Q/A count", minimum=1, scale=1, interactive=True
             )
 
         gr.Markdown("### Generate Questions per Article")
+        page_label = gr.Markdown("Fetch an article in Tab (1) first.")
+        page = gr.State(0)
+        # chunks picked by hand and generated pairs, by `slot_key`
+        saved = gr.State({})
+
+        # a fixed set of slots showing one page of pairs: changing the
+        # count or the page only updates them
+        slots: list[tuple] = []
+        for k in range(QA_SLOTS):
+            with gr.Group(visible=False) as group:
+                chunks = gr.Dropdown(
+                    label="Select Context Chunks",
+                    choices=[],
+                    multiselect=True,
+                    interactive=True,
+                )
+                question = gr.Textbox(label="Question", visible=False)
+                answer = gr.TextArea(label="Answer", visible=False, lines=5)
+                generate_qa_button = gr.Button("Generate")
+            slots.append((group, chunks, question, answer))
+
+            def pick_chunks(j, type_name, page, chunks_idx, saved, k=k):
+                key = slot_key(j, type_name, page * QA_SLOTS + k)
+                return saved | {
+                    key: saved.get(key, {}) | {"chunks": chunks_idx}
+                }
+
+            def generate_slot(
+                session_id, j, type_name, page, chunks_idx, saved, k=k
+            ):
+                question, answer, chunks = generate_syntetic_qa_pair(
+                    type_q=type_name,
+                    article=get_session(session_id).articles[j],
+                    chunks_idx=chunks_idx,
+                )
+                key = slot_key(j, type_name, page * QA_SLOTS + k)
+                saved = saved | {
+                    key: {
+                        "chunks": chunks["value"],
+                        "question": question["value"],
+                        "answer": answer["value"],
+                    }
+                }
+                return question, answer, chunks, saved
+
+            chunks.input(
+                pick_chunks,
+                inputs=[article, type_q, page, chunks, saved],
+                outputs=[saved],
+            )
+            generate_qa_button.click(
+                generate_slot,
+                inputs=[session, article, type_q, page, chunks, saved],
+                outputs=[question, answer, chunks, saved],
+                # let clicks run together so they can be batched
+                concurrency_limit=settings.BATCH_MAX_SIZE,
+                concurrency_id="generate",
+            ).success(
+                lambda session_id, j, type_name, chunks, question, answer: (
+                    add_to_qa_dataset(
+                        type=type_name,
+                        language=get_session(session_id).articles[j].language,
+                        article_title=get_session(session_id).articles[j].title,
+                        chunks=chunks,
+                        question=question,
+                        answer=answer,
+                        session_id=session_id,
+                    )
+                ),
+                inputs=[session, article, type_q, chunks, question, answer],
+                outputs=[qa_count],
+            )
+
+        with gr.Row():
+            prev_page = gr.Button("Previous", size="sm")
+            next_page = gr.Button("Next", size="sm")
+
+        slot_outputs = [page_label, page, *(c for slot in slots for c in slot)]
+        inputs = [session, article, type_q, qa_counter]
+        articles_rev.change(
+            lambda session_id, _, type_name, count: (
+                gr.update(
+                    choices=article_choices(get_session(session_id).articles),
+                    value=0 if get_session(session_id).articles else None,
+                ),
+                {},
+                *show_slots(session_id, 0, type_name, count, 0, {}),
+            ),
+            inputs=inputs,
+            outputs=[article, saved, *slot_outputs],
+        )
+        for control in [article, type_q]:
+            control.input(
+                lambda session_id, j, type_name, count, saved: show_slots(
+                    session_id, j, type_name, count, 0, saved
+                ),
+                inputs=[*inputs, saved],
+                outputs=slot_outputs,
+            )
+        qa_counter.change(
+            show_slots, inputs=[*inputs, page, saved], outputs=slot_outputs
+        )
+        for button, step in [(prev_page, -1), (next_page, 1)]:
+            button.click(
+                lambda session_id, j, type_name, count, page, saved, step=step: (
+                    show_slots(
+                        session_id, j, type_name, count, page + step, saved
+                    )
+                ),
+                inputs=[*inputs, page, saved],
+                outputs=slot_outputs,
+            )
+
 
-        @gr.render([articles_state, qa_counter])
-        def display_select_chunks(
-            fetched_articles: list[Article], qa_counter: int
-        ):
-            if not fetched_articles:
-                gr.Markdown("Fetch an article in Tab (1) first.")
-                return
-
-            # Show accordion with list of QA for each lang
-            for article in fetched_articles:
-                with gr.Accordion(
-                    f"({article.language}) - {article.title}", open=True
-                ):
-                    for i in range(qa_counter):
-                        chunks = gr.Dropdown(
-                            label="Select Context Chunks",
-                            choices=[
-                                (chunk["heading"], id)
-                                for id, chunk in enumerate(article.chunks)
-                            ],
-                            multiselect=True,
-                            max_choices=3,
-                            container=False,
-                        )
-                        question = gr.Textbox(label="Question", visible=False)
-                        answer = gr.TextArea(
-                            label="Answer", visible=False, lines=5
-                        )
-                        generate_qa_button = gr.Button("Generate")
-                        generate_qa_button.click(
-                            lambda type_q,
-                            chunks_idx,
-                            art=article: generate_syntetic_qa_pair(
-                                type_q=type_q,
-                                article=art,
-                                chunks_idx=chunks_idx,
-                            ),
-                            inputs=[type_q, chunks],
-                            outputs=[question, answer],
-                        ).then(
-                            lambda type,
-                            chunks,
-                            question,
-                            answer,
-                            qa_data_state: add_to_qa_dataset(
-                                type=type,
-                                language=article.language,
-                                article_title=article.title,
-                                chunks=chunks,
-                                question=question,
-                                answer=answer,
-                                qa_data=qa_data_state,
-                            ),
-                            inputs=[
-                                type_q,
-                                chunks,
-                                question,
-                                answer,
-                                qa_data_state,
-                            ],
-                            outputs=[qa_data_state],
-                        )
-
-
-def build_save_tab(articles_state: gr.State, qa_data_state: gr.State) -> None:
+def build_save_tab(
+    session: gr.State, articles_rev: gr.State, qa_count: gr.State
+) -> None:
     with gr.Tab("(3) Save Dataset"):
         gr.Markdown("### Review and Download Data")
 
@@ -230,51 +440,62 @@ def build_save_tab(articles_state: gr.State, qa_data_state: gr.State) -> None:
                 gr.Markdown("**Fetched Articles (JSON)**")
                 article_json = gr.JSON(label="Articles Data")
                 article_file = gr.File(
-                    label="Download Article JSON File", file_count="single"
+                    label="Download Article JSONL File", file_count="single"
                 )
                 download_articles_button = gr.DownloadButton(
-                    "Download Articles JSON", variant="primary"
+                    "Download Articles JSONL", variant="primary"
                 )
             with gr.Column(scale=3):
                 gr.Markdown("**Generated Q/A Pairs (JSON)**")
                 qa_json = gr.JSON(label="Q/A Data")
                 qa_file = gr.File(
-                    label="Download Q/A JSON File", file_count="single"
+                    label="Download Q/A JSONL File", file_count="single"
                 )
                 download_qa_button = gr.DownloadButton(
-                    "Download Q/A JSON", variant="primary"
+                    "Download Q/A JSONL", variant="primary"
                 )
 
-        articles_state.change(
-            lambda articles: [a.to_json() for a in articles],
-            inputs=[articles_state],
+        articles_rev.change(
+            lambda session_id: [
+                a.to_json() for a in get_session(session_id).articles
+            ],
+            inputs=[session],
             outputs=[article_json],
         )
 
-        qa_data_state.change(
-            lambda qa_pairs: [qa.to_json() for qa in qa_pairs],
-            inputs=[qa_data_state],
+        # only the newest pairs: adding one sends a few records, not all
+        qa_count.change(
+            lambda session_id, count: gr.update(
+                value=[
+                    qa.to_json()
+                    for qa in get_session(session_id).qa[-QA_PREVIEW:]
+                ],
+                label=f"Q/A Data (last {min(count, QA_PREVIEW)} of {count})",
+            ),
+            inputs=[session, qa_count],
             outputs=[qa_json],
         )
 
-        def handle_article_download_click(article_data: list[dict]) -> str:
-            if not article_data:
+        def handle_article_download_click(session_id: str) -> str:
+            articles = get_session(session_id).articles
+            if not articles:
                 raise gr.Error("No article data to download.")
-            return create_json_file(article_data, prefix="wiki_articles_")
+            return export_jsonl(articles, prefix="wiki_doc_")
 
-        def handle_qa_download_click(qa_data: list[dict]) -> str:
+        def handle_qa_download_click(session_id: str) -> str:
+            qa_data = get_session(session_id).qa
             if not qa_data:
                 raise gr.Error("No Q/A data to download.")
-            return create_json_file(qa_data, prefix="wiki_qa_")
+            return export_jsonl(qa_data, prefix="wiki_qa_")
 
         download_articles_button.click(
             fn=handle_article_download_click,
-            inputs=[article_json],
+            inputs=[session],
             outputs=[article_file],
         )
         download_qa_button.click(
             fn=handle_qa_download_click,
-            inputs=[qa_json],
+            inputs=[session],
             outputs=[qa_file],
         )
 
@@ -282,10 +503,43 @@ def build_save_tab(articles_state: gr.State, qa_data_state: gr.State) -> None:
 # --- Main Application Launch ---
 
 
-def launch() -> None:
+def build_app() -> FastAPI:
+    """
+    Gradio UI plus `/health` (liveness), `/ready` (model loaded) and
+    `/metrics` (Prometheus)
+    """
+    app = FastAPI()
+
+    @app.get("/health")
+    def health() -> dict:
+        return {"status": "ok"}
+
+    @app.get("/ready")
+    def ready() -> JSONResponse:
+        status = shared_client.status()
+        return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+    @app.get("/metrics")
+    def metrics() -> PlainTextResponse:
+        return PlainTextResponse(
+            telemetry.render(), media_type="text/plain; version=0.0.4"
+        )
+
+    return gr.mount_gradio_app(app, build_ui(), path="/")
+
+
+def build_ui() -> gr.Blocks:
     with gr.Blocks() as demo:
-        articles = gr.State([])
-        qa_data = gr.State([])
+        # the session's data stays in `shared_sessions`, events only carry
+        # its id and the counters announcing changes
+        session = gr.State(
+            None,
+            time_to_live=settings.SESSION_TTL,
+            delete_callback=shared_sessions.drop,
+        )
+        articles_rev = gr.State(0)
+        qa_count = gr.State(0)
+        demo.load(shared_sessions.new, outputs=[session])
 
         gr.Markdown("# WikiQA: Dataset Generator")
         gr.Markdown(
@@ -294,11 +548,18 @@ def launch() -> None:
         )
 
         # --- Build UI Tabs ---
-        build_article_tab(articles)
-        build_qa_tab(articles, qa_data)
-        build_save_tab(articles, qa_data)
+        build_article_tab(session, articles_rev)
+        build_qa_tab(session, articles_rev, qa_count)
+        build_save_tab(session, articles_rev, qa_count)
 
-    demo.launch()
+    return demo
+
+
+def launch() -> None:
+    # the page is served right away, the model loads in the background
+    if settings.WARMUP:
+        shared_client.warm_up()
+    uvicorn.run(build_app(), host=settings.HOST, port=settings.PORT)
 
 
 if __name__ == "__main__":
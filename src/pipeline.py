@@ -0,0 +1,506 @@
+"""
+Headless dataset builder: topic list -> articles -> Q/A pairs (JSONL).
+
+Each line of the topics file is either a plain article title or a JSON
+object overriding the command line defaults, e.g.
+
+    Prime number
+    {"title": "Quantum mechanics", "langs": ["en", "es"], "pairs": 10}
+
+Usage:
+    python src/pipeline.py topics.txt --out dataset --langs en es --pairs 5
+    python src/pipeline.py topics.txt --out dataset --queue
+    python src/pipeline.py --out dataset --status pause
+    python src/pipeline.py --dump eswiki-latest-pages-articles.xml.bz2 --langs es
+    python src/pipeline.py --docs dataset/wiki_doc.corpus --langs en es --out out
+"""
+
+import argparse
+import json
+import queue
+import threading
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import NamedTuple
+
+from pydantic import BaseModel
+
+from lib.budget import pack_prompt
+from lib.dedup import DuplicateIndex
+from lib.dump import WikiDump, index_path_for
+from lib.jobs import JobQueue, JobRunner
+from lib.llm import generate_batch, get_client
+from lib.sampler import sample_chunks
+from lib.sink import JsonlSink, read_jsonl
+from lib.store import ArticleStore, ArticleView
+from lib.types import QA, Article
+from lib.wikipedia import iter_wikipedia_articles
+from settings import settings
+
+_DONE = object()
+
+
+class Topic(BaseModel):
+    """One line of the topics file"""
+
+    title: str
+    langs: list[str] = ["en"]
+    types: list[str] = ["factual"]
+    pairs: int = 1
+
+
+class Job(NamedTuple):
+    """A single Q/A pair to generate"""
+
+    type: str
+    article: Article
+    chunks: list[int]
+
+
+def read_topics(
+    path: str | Path, langs: list[str], types: list[str], pairs: int
+) -> list[Topic]:
+    defaults = {"langs": langs, "types": types, "pairs": pairs}
+    topics = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                topics.append(Topic.model_validate(defaults | json.loads(line)))
+            else:
+                topics.append(Topic(title=line, **defaults))
+    return topics
+
+
+def article_jobs(topic: Topic, article: Article, seed: int) -> list[Job]:
+    """
+    Jobs for one article, grouped by chunk set so that consecutive
+    generations over the same context can reuse its KV cache. With
+    `PREFIX_CACHING` every question type starts from the same chunks, so
+    their prompts share the context prefix.
+    """
+    jobs = [
+        Job(type_q, article, chunks)
+        for type_q in topic.types
+        for chunks in sample_chunks(
+            article,
+            type_q,
+            topic.pairs,
+            seed,
+            salt="" if settings.PREFIX_CACHING else type_q,
+        )
+    ]
+    return sorted(jobs, key=lambda job: job.chunks)
+
+
+def fetch_articles(
+    topics: list[Topic], fetch_workers: int = 8
+) -> Iterator[tuple[Topic, Article]]:
+    """Live Wikipedia source: one bulk fetch per distinct set of languages"""
+    groups: dict[tuple[str, ...], dict[str, Topic]] = {}
+    for topic in topics:
+        groups.setdefault(tuple(topic.langs), {})[topic.title] = topic
+    for langs, by_title in groups.items():
+        try:
+            for title, _, article in iter_wikipedia_articles(
+                list(by_title), list(langs), max_workers=fetch_workers
+            ):
+                yield by_title[title], article
+        except Exception as e:
+            print(f"Error fetching {list(by_title)}: {e}")
+
+
+def read_dumps(
+    dumps: list[WikiDump], topics: list[Topic], defaults: Topic
+) -> Iterator[tuple[Topic, Article]]:
+    """
+    Offline source: look up the listed topics in every dump, or stream all
+    of their articles (with the `defaults` settings) when none are given.
+    """
+    for dump in dumps:
+        if not topics:
+            for article in dump:
+                yield (
+                    defaults.model_copy(update={"title": article.title}),
+                    article,
+                )
+            continue
+        if not (dump.index_path or index_path_for(dump.path)).exists():
+            dump.build_index()
+        for topic in topics:
+            if dump.language in topic.langs and (
+                article := dump.get(topic.title)
+            ):
+                yield topic, article
+
+
+def read_store(
+    store: ArticleStore, topics: list[Topic], defaults: Topic
+) -> Iterator[tuple[Topic, ArticleView]]:
+    """
+    Articles collected before, held in memory: the listed topics in each of
+    their languages, or every article in the `defaults` languages
+    """
+    if not topics:
+        for article in store:
+            if article.language in defaults.langs:
+                yield (
+                    defaults.model_copy(update={"title": article.title}),
+                    article,
+                )
+        return
+    for topic in topics:
+        for language in topic.langs:
+            if (article := store.find(topic.title, language)) is not None:
+                yield topic, article
+
+
+def run(
+    articles: Iterable[tuple[Topic, Article]],
+    out_dir: str | Path,
+    llm,
+    batch_size: int = 32,
+    linger: float = 0.5,
+    seed: int = 0,
+    params: dict = {},
+    use_cache: bool = True,
+    resume: bool = True,
+) -> tuple[int, int]:
+    """
+    Chunk and generate as concurrent stages over an article source.
+
+    The source is consumed on its own thread, which pushes jobs to a
+    bounded queue as soon as an article is ready; the generation stage
+    drains it into batches of up to `batch_size` (waiting at most `linger`
+    seconds to fill one) and appends every finished row. Articles already
+    in `out_dir` are not written again, and with `resume` neither are the
+    pairs (e.g. from a killed run). Returns the number of articles and Q/A
+    pairs written.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs: queue.Queue = queue.Queue(maxsize=batch_size * 4)
+    n_articles = n_qa = 0
+    docs = JsonlSink(out_dir / "wiki_doc.jsonl", flush_every=1)
+    qa_sink = JsonlSink(out_dir / "wiki_qa.jsonl", flush_every=batch_size)
+    done_articles, done_jobs = _written(out_dir)
+    if not resume:
+        done_jobs.clear()
+    dedup = duplicate_index(out_dir if resume else None)
+    # set when the generation stage leaves (done, error or Ctrl-C)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        """Wait for room in the queue, unless the consumer is gone"""
+        while not stop.is_set():
+            try:
+                jobs.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        nonlocal n_articles
+        try:
+            for topic, article in articles:
+                if (article.title, article.language) not in done_articles:
+                    docs.write(article)
+                    n_articles += 1
+                for job in article_jobs(topic, article, seed):
+                    key = _job_key(job.type, article, job.chunks)
+                    if done_jobs[key] > 0:
+                        done_jobs[key] -= 1
+                        continue
+                    if not put(job):
+                        return
+        finally:
+            put(_DONE)
+
+    producer = threading.Thread(target=produce, name="pipeline-fetch")
+    producer.start()
+
+    with docs, qa_sink:
+        try:
+            done = False
+            while not done:
+                batch: list[Job] = []
+                item = jobs.get()
+                while item is not _DONE:
+                    batch.append(item)
+                    if len(batch) == batch_size:
+                        break
+                    try:
+                        item = jobs.get(timeout=linger)
+                    except queue.Empty:
+                        break
+                done = item is _DONE
+                n_qa += _generate(batch, qa_sink, llm, params, use_cache, dedup)
+        finally:
+            stop.set()
+            producer.join()
+    return n_articles, n_qa
+
+
+def run_queued(
+    articles: Iterable[tuple[Topic, Article]],
+    out_dir: str | Path,
+    llm,
+    batch_size: int = 32,
+    seed: int = 0,
+    params: dict = {},
+    use_cache: bool = True,
+    stop: threading.Event | None = None,
+) -> tuple[int, int]:
+    """
+    `run` through a persistent job queue (`out_dir/jobs.db`): every job is
+    stored first, then generated with retries. Running the same command
+    again after a restart only does the jobs that are not done yet.
+    """
+    out_dir = Path(out_dir)
+    jobs = JobQueue(out_dir / "jobs.db")
+    n_articles = 0
+    with JsonlSink(out_dir / "wiki_doc.jsonl", flush_every=1) as docs:
+        for topic, article in articles:
+            if jobs.add_article(article):
+                docs.write(article)
+                n_articles += 1
+            seen: Counter = Counter()
+            for job in article_jobs(topic, article, seed):
+                key = (job.type, tuple(job.chunks))
+                jobs.add(job.type, article, job.chunks, seen[key])
+                seen[key] += 1
+
+    runner = JobRunner(
+        jobs,
+        llm,
+        batch_size=batch_size,
+        params=params,
+        use_cache=use_cache,
+        dedup=duplicate_index(out_dir),
+    )
+    with JsonlSink(
+        out_dir / "wiki_qa.jsonl", flush_every=batch_size
+    ) as qa_sink:
+        n_qa = runner.run(qa_sink, stop)
+    progress = jobs.progress()
+    if progress["failed"]:
+        print(
+            f"{progress['failed']} job(s) failed, see {out_dir / 'jobs.db'}"
+            " (--status retry-failed to queue them again)"
+        )
+    return n_articles, n_qa
+
+
+def duplicate_index(out_dir: Path | None) -> DuplicateIndex | None:
+    """
+    Near-duplicate detector for the questions of a run (`DEDUP_THRESHOLD`),
+    seeded with the pairs already in `out_dir`
+    """
+    if settings.DEDUP_THRESHOLD <= 0:
+        return None
+    index = DuplicateIndex(settings.DEDUP_THRESHOLD)
+    if out_dir is not None:
+        for qa in read_jsonl(out_dir / "wiki_qa.jsonl"):
+            index.add_qa(qa)
+    return index
+
+
+def _job_key(type_q: str, article: Article, chunks: list[int]) -> tuple:
+    return (type_q, article.language, article.title, tuple(chunks))
+
+
+def _written(out_dir: Path) -> tuple[set[tuple[str, str]], Counter]:
+    """Articles and jobs already in the output files"""
+    articles = {
+        (doc["title"], doc["language"])
+        for doc in read_jsonl(out_dir / "wiki_doc.jsonl")
+    }
+    jobs = Counter(
+        (
+            qa["type"],
+            qa["language"],
+            qa["article_title"],
+            tuple(qa.get("requested_chunks") or qa["chunks"]),
+        )
+        for qa in read_jsonl(out_dir / "wiki_qa.jsonl")
+    )
+    return articles, jobs
+
+
+def _generate(
+    batch: list[Job],
+    qa_sink: JsonlSink,
+    llm,
+    params: dict,
+    use_cache: bool = True,
+    dedup: DuplicateIndex | None = None,
+) -> int:
+    prompts: list[str] = []
+    ready: list[tuple[Job, list[int]]] = []  # and the chunks that made it in
+    max_tokens = params.get("max_tokens", 100)
+    for job in batch:
+        try:
+            packed = pack_prompt(
+                job.type,
+                [job.article.chunks[i] for i in job.chunks],
+                max_tokens,
+            )
+        except ValueError as e:
+            print(f"Skipping job for '{job.article.title}': {e}")
+            continue
+        if not packed.kept:
+            print(f"Skipping job for '{job.article.title}': no chunk fits")
+            continue
+        if packed.dropped or packed.trimmed:
+            print(
+                f"Context of '{job.article.title}' cut to fit CTX_WINDOW: "
+                f"{len(packed.trimmed)} chunk(s) trimmed, "
+                f"{len(packed.dropped)} dropped"
+            )
+        prompts.append(packed.prompt)
+        ready.append((job, [job.chunks[i] for i in packed.kept]))
+    if not prompts:
+        return 0
+
+    written = 0
+    for (job, chunks), result in zip(
+        ready, generate_batch(prompts, llm, params, use_cache)
+    ):
+        if isinstance(result, Exception):
+            print(f"Error generating for '{job.article.title}': {result}")
+            continue
+        qa = QA(
+            type=job.type,
+            language=job.article.language,
+            article_title=job.article.title,
+            chunks=chunks,
+            question=result.question,
+            answer=result.answer,
+            # resume finds the job by what it asked for
+            requested_chunks=job.chunks if chunks != job.chunks else None,
+        )
+        if dedup is not None and (duplicate := dedup.add_qa(qa)):
+            print(
+                f"Dropping near-duplicate question for '{job.article.title}':"
+                f" {qa.question!r} ~ {duplicate!r}"
+            )
+            continue
+        qa_sink.write(qa)
+        written += 1
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "topics",
+        nargs="?",
+        help="file with one title (or JSON topic) per line; "
+        "optional with --dump, which then uses every article",
+    )
+    parser.add_argument(
+        "--dump",
+        action="append",
+        default=[],
+        help="read articles from a local dump instead of the live API "
+        "(XML, XML.bz2 or extracted JSONL; repeat for several languages)",
+    )
+    parser.add_argument(
+        "--docs",
+        help="generate for articles collected before (a wiki_doc.jsonl file "
+        "or corpus directory), loaded into memory; without a topics file "
+        "every article in --langs is used",
+    )
+    parser.add_argument("--out", default="dataset", help="output directory")
+    parser.add_argument("--langs", nargs="+", default=["en"])
+    parser.add_argument("--types", nargs="+", default=["factual"])
+    parser.add_argument(
+        "--pairs", type=int, default=1, help="Q/A pairs per article and type"
+    )
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--fetch-workers", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--queue",
+        action="store_true",
+        help="go through a persistent job queue in the output directory, "
+        "with retries and rate limits",
+    )
+    parser.add_argument(
+        "--status",
+        choices=["progress", "pause", "resume", "retry-failed"],
+        help="inspect or control the job queue of --out (e.g. of a running "
+        "--queue build) and exit",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="generate again the pairs already in the output directory",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always run the model instead of reusing cached responses",
+    )
+    args = parser.parse_args()
+
+    if args.status:
+        jobs = JobQueue(Path(args.out) / "jobs.db")
+        match args.status:
+            case "pause":
+                jobs.pause()
+            case "resume":
+                jobs.resume()
+            case "retry-failed":
+                print(f"Queued {jobs.retry_failed()} failed job(s) again")
+        print(("paused " if jobs.paused else "") + json.dumps(jobs.progress()))
+        return
+    if not args.topics and not args.dump and not args.docs:
+        parser.error(
+            "a topics file is required unless --dump or --docs is given"
+        )
+    topics = (
+        read_topics(args.topics, args.langs, args.types, args.pairs)
+        if args.topics
+        else []
+    )
+    defaults = Topic(
+        title="", langs=args.langs, types=args.types, pairs=args.pairs
+    )
+    if args.docs:
+        articles = read_store(ArticleStore.load(args.docs), topics, defaults)
+    elif args.dump:
+        articles = read_dumps(
+            [WikiDump(path) for path in args.dump], topics, defaults
+        )
+    else:
+        articles = fetch_articles(topics, args.fetch_workers)
+
+    if args.queue:
+        n_articles, n_qa = run_queued(
+            articles,
+            args.out,
+            llm=get_client(),
+            batch_size=args.batch_size,
+            seed=args.seed,
+            use_cache=not args.no_cache,
+        )
+    else:
+        n_articles, n_qa = run(
+            articles,
+            args.out,
+            llm=get_client(),
+            batch_size=args.batch_size,
+            seed=args.seed,
+            use_cache=not args.no_cache,
+            resume=not args.no_resume,
+        )
+    print(f"Wrote {n_articles} article(s) and {n_qa} Q/A pair(s) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
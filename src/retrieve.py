@@ -0,0 +1,66 @@
+"""
+BM25 baseline retriever over the chunks of a dataset.
+
+Usage:
+    python src/retrieve.py build dataset/wiki_doc.jsonl --index dataset/bm25
+    python src/retrieve.py search dataset/wiki_qa.jsonl --index dataset/bm25 \
+        --k 10 --out runs.jsonl
+    python src/evaluate.py dataset/wiki_qa.jsonl runs.jsonl
+"""
+
+import argparse
+import json
+import time
+from collections import defaultdict
+
+from lib.corpus import load_articles
+from lib.index import BM25Index
+from lib.sink import read_jsonl
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=["build", "search"])
+    parser.add_argument(
+        "input",
+        help="wiki_doc.jsonl (or corpus) to build, wiki_qa.jsonl to search",
+    )
+    parser.add_argument("--index", default="dataset/bm25")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--out", default="runs.jsonl")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    match args.command:
+        case "build":
+            index = BM25Index.build(load_articles(args.input))
+            index.save(args.index)
+            print(
+                f"{len(index)} chunks, {len(index.terms)} terms indexed"
+                f" in {time.perf_counter() - start:.1f}s"
+            )
+        case "search":
+            index = BM25Index.load(args.index)
+            by_language = defaultdict(list)
+            for i, pair in enumerate(read_jsonl(args.input)):
+                by_language[pair["language"]].append((i, pair["question"]))
+            runs = {}
+            for language, queries in by_language.items():
+                results = index.search(
+                    [question for _, question in queries], args.k, language
+                )
+                for (i, _), hits in zip(queries, results):
+                    runs[i] = [[hit.title, hit.chunk] for hit in hits]
+            # a new run file per search, evaluate.py scores every line
+            with open(args.out, "w", encoding="utf-8") as f:
+                for i in sorted(runs):
+                    record = {"id": i, "chunks": runs[i]}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            print(
+                f"{len(runs)} queries searched"
+                f" in {time.perf_counter() - start:.1f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,6 @@
 import os
 from typing import Literal
 
-import torch
 from dotenv import load_dotenv
 from pydantic import BaseModel, computed_field
 
@@ -14,15 +13,50 @@ class Settings(BaseModel):
     )
     DTYPE: str = os.getenv("DTYPE", "float16")
     CTX_WINDOW: int = int(os.getenv("CTX_WINDOW", "2048"))
-    TORCH_DEVICE: Literal["cuda", "cpu"] | None = None
+    MAX_NUM_SEQS: int = int(os.getenv("MAX_NUM_SEQS", "16"))
+    BATCH_MAX_SIZE: int = int(os.getenv("BATCH_MAX_SIZE", "16"))
+    BATCH_WINDOW_MS: float = float(os.getenv("BATCH_WINDOW_MS", "20"))
+    TORCH_DEVICE: Literal["cuda", "cpu"] | None = (
+        os.getenv("TORCH_DEVICE") or None  # type: ignore[assignment]
+    )
     ENVIRONMENT: str | Literal["dev", "prod"] = os.getenv("ENVIRONMENT", "prod")
     CLIENT_URL: str = os.getenv("CLIENT_URL", "http://localhost:8000/v1")
+    CLIENT_CONCURRENCY: int = int(os.getenv("CLIENT_CONCURRENCY", "16"))
+    CLIENT_TIMEOUT: float = float(os.getenv("CLIENT_TIMEOUT", "60"))
+    CLIENT_MAX_RETRIES: int = int(os.getenv("CLIENT_MAX_RETRIES", "5"))
+    CACHE_DIR: str = os.getenv("CACHE_DIR", ".cache")
+    ARTICLE_CACHE_MB: int = int(os.getenv("ARTICLE_CACHE_MB", "512"))
+    ARTICLE_CACHE_TTL: float = float(os.getenv("ARTICLE_CACHE_TTL", "86400"))
+    RESPONSE_CACHE_MB: int = int(os.getenv("RESPONSE_CACHE_MB", "256"))
+    RESPONSE_CACHE_TTL: float = float(
+        os.getenv("RESPONSE_CACHE_TTL", str(30 * 24 * 3600))
+    )
+    GENERATION_RATE: str = os.getenv("GENERATION_RATE", "dev=20")
+    DATASET_DIR: str = os.getenv("DATASET_DIR", "output")
+    SESSION_DIR: str = os.getenv("SESSION_DIR", "")
+    SESSION_MAX: int = int(os.getenv("SESSION_MAX", "64"))
+    SESSION_TTL: float = float(os.getenv("SESSION_TTL", str(6 * 3600)))
+    TRACE_FILE: str = os.getenv("TRACE_FILE", "")
+    DEDUP_THRESHOLD: float = float(os.getenv("DEDUP_THRESHOLD", "0.6"))
+    WIKI_DUMPS: str = os.getenv("WIKI_DUMPS", "")
+    TOKENIZER: str = os.getenv("TOKENIZER", "")
+    CHUNK_TOKENS: int = int(os.getenv("CHUNK_TOKENS", "512"))
+    CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "0"))
+    WARMUP: bool = os.getenv("WARMUP", "1").lower() in ("1", "true")
+    HOST: str = os.getenv("HOST", "127.0.0.1")
+    PORT: int = int(os.getenv("PORT", "7860"))
+    PREFIX_CACHING: bool = os.getenv("PREFIX_CACHING", "0").lower() in (
+        "1",
+        "true",
+    )
 
     @computed_field
     @property
     def DEVICE(self) -> Literal["cuda", "cpu"]:
         if self.TORCH_DEVICE:
             return self.TORCH_DEVICE
+        import torch  # slow, only when the device is actually needed
+
         if torch.cuda.is_available():
             return "cuda"
         return "cpu"
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from lib import batcher as batcher_module
+from lib.batcher import MicroBatcher
+from lib.types import QAFormat
+
+
+class FakeClient:
+    def get(self):
+        return "engine"
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def fake_generate_batch(prompts, llm, params, use_cache):
+        calls.append((list(prompts), params))
+        return [
+            ValueError(p)
+            if p.startswith("bad")
+            else QAFormat(question=p, answer="A")
+            for p in prompts
+        ]
+
+    monkeypatch.setattr(batcher_module, "generate_batch", fake_generate_batch)
+    return calls
+
+
+def test_concurrent_requests_share_a_call(calls):
+    batcher = MicroBatcher(FakeClient(), max_batch=16, window=0.5)
+    results = {}
+
+    def click(i):
+        try:
+            results[i] = batcher.generate(f"{'bad' if i == 3 else 'ok'}{i}")
+        except ValueError as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=click, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1 and len(calls[0][0]) == 6
+    assert results[0].question == "ok0"
+    assert isinstance(results[3], ValueError) and str(results[3]) == "bad3"
+
+
+def test_batches_are_capped_and_split_by_params(calls):
+    batcher = MicroBatcher(FakeClient(), max_batch=3, window=0.2)
+    futures = [batcher.submit(f"p{i}") for i in range(4)]
+    futures.append(batcher.submit("hot", {"temperature": 1.0}))
+    assert [f.result(5).question for f in futures] == [
+        "p0",
+        "p1",
+        "p2",
+        "p3",
+        "hot",
+    ]
+    assert [len(prompts) for prompts, _ in calls] == [3, 1, 1]
+    assert calls[-1][1] == {"temperature": 1.0}
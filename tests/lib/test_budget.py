@@ -0,0 +1,81 @@
+import pytest
+
+from lib import budget
+from lib.budget import check_prompt, pack_prompt, prompt_budget
+from lib.prompt import build_prompt
+from settings import settings
+
+
+def words(text: str) -> int:
+    return len(text.split())
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(budget, "count_tokens", words)
+    monkeypatch.setattr(budget, "TEMPLATE_RESERVE", 0)
+
+
+def chunk(heading: str, n_sentences: int):
+    content = " ".join(f"Sentence {i} is here." for i in range(n_sentences))
+    return {"heading": heading, "level": 1, "content": content}
+
+
+def test_everything_fits(monkeypatch):
+    monkeypatch.setattr(settings, "CTX_WINDOW", 1000)
+    context = [chunk("A", 2), chunk("B", 2)]
+    packed = pack_prompt("factual", context, max_tokens=100)
+
+    assert packed.prompt == build_prompt("factual", context)
+    assert packed.kept == [0, 1]
+    assert packed.trimmed == packed.dropped == []
+    assert packed.tokens == words(packed.prompt)
+
+
+def test_trims_by_sentence_and_drops_the_rest(monkeypatch):
+    empty = words(build_prompt("factual", []))
+    frame = words(build_prompt("factual", [chunk("A", 0)])) - empty
+    # room for chunk A and 3 sentences (4 words each) of chunk B
+    one = words(build_prompt("factual", [chunk("A", 2)])) - empty
+    monkeypatch.setattr(
+        settings, "CTX_WINDOW", 100 + empty + one + frame + 3 * 4 + 2
+    )
+    packed = pack_prompt(
+        "factual", [chunk("A", 2), chunk("B", 10), chunk("C", 1)], 100
+    )
+
+    assert packed.kept == [0, 1]
+    assert packed.trimmed == [1]
+    assert packed.dropped == [2]
+    assert "Sentence 2 is here." in packed.prompt
+    assert "Sentence 3 is here." not in packed.prompt
+    assert packed.tokens <= prompt_budget(100)
+
+
+def test_check_prompt(monkeypatch):
+    monkeypatch.setattr(settings, "CTX_WINDOW", 110)
+    assert check_prompt("word " * 10, max_tokens=100) is None
+    assert isinstance(check_prompt("word " * 11, max_tokens=100), ValueError)
+
+
+def test_packed_prompt_always_passes_check_prompt(monkeypatch):
+    # chars / 4 rounds up, so chunk costs don't simply add up
+    monkeypatch.setattr(budget, "count_tokens", lambda t: -(-len(t) // 4))
+
+    def ragged(heading: str, n: int):
+        sentences = (f"Sentence {'x' * (i * n % 7)} {i}." for i in range(n))
+        return {"heading": heading, "level": 1, "content": " ".join(sentences)}
+
+    for pad in range(4):
+        for n in [4, 7, 11]:
+            context = [
+                ragged("A" * (1 + pad), 3),
+                ragged("B", n),
+                chunk("C", 4),
+            ]
+            for window in range(170, 260):
+                monkeypatch.setattr(settings, "CTX_WINDOW", window)
+                for type_q in ["factual", "multihop"]:
+                    packed = pack_prompt(type_q, context, max_tokens=100)
+                    error = check_prompt(packed.prompt, 100)
+                    assert error is None, (pad, n, window, type_q)
@@ -0,0 +1,138 @@
+import sqlite3
+import time
+
+from lib.cache import ArticleCache, ResponseCache
+from lib.types import Article, QAFormat
+
+PARAMS = {"max_chunk_size": 2000, "version": 1}
+
+
+def _article(title: str, size: int = 10) -> Article:
+    return Article(
+        title=title,
+        source="https://en.wikipedia.org/wiki/" + title,
+        language="en",
+        chunks=[{"heading": "Intro", "level": 1, "content": "x" * size}],
+        summary="",
+    )
+
+
+def test_article_cache_roundtrip(tmp_path):
+    cache = ArticleCache(tmp_path / "articles.db")
+    article = _article("Prime number")
+    cache.put("Prime number", "en", 42, PARAMS, article)
+
+    assert cache.get("Prime number", "en", 42, PARAMS) == article
+    assert cache.latest("Prime number", "en", PARAMS) == article
+    # new revision, language or chunking params are misses
+    assert cache.get("Prime number", "en", 43, PARAMS) is None
+    assert cache.get("Prime number", "es", 42, PARAMS) is None
+    assert (
+        cache.get("Prime number", "en", 42, {**PARAMS, "max_chunk_size": 300})
+        is None
+    )
+
+
+def test_article_cache_persists(tmp_path):
+    ArticleCache(tmp_path / "articles.db").put(
+        "Batman", "en", 1, PARAMS, _article("Batman")
+    )
+    assert ArticleCache(tmp_path / "articles.db").get("Batman", "en", 1, PARAMS)
+
+
+def test_article_cache_ttl(tmp_path):
+    cache = ArticleCache(tmp_path / "articles.db", ttl=0.05)
+    cache.put("Batman", "en", 1, PARAMS, _article("Batman"))
+    time.sleep(0.1)
+
+    assert cache.latest("Batman", "en", PARAMS) is None
+    assert cache.get("Batman", "en", 1, PARAMS) is not None
+
+
+def test_article_cache_evicts_least_recently_used(tmp_path):
+    cache = ArticleCache(tmp_path / "articles.db")
+    articles = {title: _article(title, size=2000) for title in "ABC"}
+    cache.put("A", "en", 1, PARAMS, articles["A"])
+    (size,) = cache._db.execute("SELECT size FROM articles").fetchone()
+    cache.max_bytes = 2 * size
+
+    cache.put("B", "en", 1, PARAMS, articles["B"])
+    cache.get("A", "en", 1, PARAMS)
+    cache.put("C", "en", 1, PARAMS, articles["C"])
+
+    assert cache.get("A", "en", 1, PARAMS) == articles["A"]
+    assert cache.get("B", "en", 1, PARAMS) is None
+    assert cache.get("C", "en", 1, PARAMS) == articles["C"]
+
+
+def test_response_cache_ttl_and_eviction(tmp_path, monkeypatch):
+    cache = ResponseCache(tmp_path / "responses.db", ttl=60)
+    qa = QAFormat(question="Q", answer="A")
+    cache.put("model", "prompt", {"temperature": 0.25}, qa)
+
+    assert cache.get("model", "prompt", {"temperature": 0.25}) == qa
+    assert cache.get("model", "prompt", {"temperature": 0.5}) is None
+    assert cache.get("other", "prompt", {"temperature": 0.25}) is None
+
+    # shared through the file with another connection (e.g. process)
+    other = ResponseCache(tmp_path / "responses.db", ttl=60)
+    assert other.get("model", "prompt", {"temperature": 0.25}) == qa
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("model", "prompt", {"temperature": 0.25}) is None
+
+    size = len(qa.model_dump_json())
+    small = ResponseCache(tmp_path / "small.db", max_bytes=2 * size)
+    for prompt in ["a", "b", "c"]:
+        small.put("model", prompt, {}, qa)
+    assert small.get("model", "a", {}) is None
+    assert small.get("model", "c", {}) == qa
+
+
+def test_cache_keeps_a_running_total_size(tmp_path):
+    path = tmp_path / "responses.db"
+    # a file written before the size triggers: the total is counted once
+    old = sqlite3.connect(path)
+    old.executescript(
+        """
+        CREATE TABLE responses (key TEXT PRIMARY KEY, data TEXT NOT NULL,
+            size INTEGER NOT NULL, created REAL NOT NULL,
+            accessed REAL NOT NULL);
+        INSERT INTO responses VALUES ('old', 'x', 7, 1e12, 0);
+        """
+    )
+    old.close()
+
+    qa = QAFormat(question="Q", answer="A")
+    size = len(qa.model_dump_json())
+    cache = ResponseCache(path, max_bytes=7 + 3 * size)
+    assert cache.total_size() == 7
+
+    cache.put("model", "a", {}, qa)
+    cache.put("model", "a", {}, qa)  # replaced, not counted twice
+    assert cache.total_size() == 7 + size
+    for prompt in "bcd":
+        cache.put("model", prompt, {}, qa)
+    # 'old' (least recently used) and 'a' are evicted
+    assert cache.total_size() == 3 * size
+    (total,) = cache._db.execute("SELECT SUM(size) FROM responses").fetchone()
+    assert total == cache.total_size()
+    assert cache.get("model", "a", {}) is None
+
+
+def test_article_cache_reads_dont_extend_the_ttl(tmp_path, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache = ArticleCache(tmp_path / "articles.db", ttl=1.0)
+    cache.put("Batman", "en", 1, PARAMS, _article("Batman"))
+
+    for _ in range(3):
+        now += 0.3
+        assert cache.latest("Batman", "en", PARAMS) is not None
+    now += 0.3  # 1.2s after the fetch, read every 0.3s
+    assert cache.latest("Batman", "en", PARAMS) is None
+
+    # a get with a revid just fetched is a check
+    assert cache.get("Batman", "en", 1, PARAMS) is not None
+    assert cache.latest("Batman", "en", PARAMS) is not None
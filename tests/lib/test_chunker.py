@@ -0,0 +1,87 @@
+import pytest
+
+from lib.chunker import chunk_text
+
+
+def words(text: str) -> int:
+    return len(text.split())
+
+
+TEXT = (
+    "  One two three. Four five six.\n\n"
+    "Seven eight. Nine ten eleven twelve.\n\n"
+    "Thirteen.  "
+)
+
+
+def test_fits_in_one_chunk():
+    [span] = chunk_text(TEXT, 100, count=words)
+    assert span.text == TEXT.strip()
+    assert TEXT[span.start : span.end] == span.text
+    assert span.tokens == 13
+
+
+def test_splits_paragraphs_then_sentences():
+    spans = chunk_text(TEXT, 6, count=words)
+    assert [s.text for s in spans] == [
+        "One two three. Four five six.",
+        "Seven eight. Nine ten eleven twelve.",
+        "Thirteen.",
+    ]
+    assert all(TEXT[s.start : s.end] == s.text for s in spans)
+    assert all(s.tokens <= 6 for s in spans)
+
+
+def test_merges_small_paragraphs():
+    spans = chunk_text(TEXT, 8, count=words)
+    assert [s.text for s in spans] == [
+        "One two three. Four five six.",
+        "Seven eight. Nine ten eleven twelve.\n\nThirteen.",
+    ]
+
+
+def test_splits_long_sentences_at_words():
+    spans = chunk_text("a b c d e f g", 3, count=words)
+    assert [s.text for s in spans] == ["a b c", "d e f", "g"]
+
+
+def test_cuts_words_over_the_budget():
+    spans = chunk_text("x" * 10, 2, count=len)
+    assert [s.text for s in spans] == ["xx"] * 5
+
+
+def test_overlap():
+    spans = chunk_text("a b c d e f g", 4, overlap=1, count=words)
+    assert [s.text for s in spans] == ["a b c d", "d e f g"]
+    spans = chunk_text("a b c d e f g", 3, overlap=2, count=words)
+    assert [s.text for s in spans] == [
+        "a b c",
+        "b c d",
+        "c d e",
+        "d e f",
+        "e f g",
+    ]
+
+
+def test_empty_and_invalid():
+    assert chunk_text(" \n ", 10, count=words) == []
+    with pytest.raises(ValueError):
+        chunk_text("a b", 2, overlap=2, count=words)
+
+
+def test_separators_count_towards_the_budget():
+    # every character is a token, so the spaces between words count too
+    spans = chunk_text("aaaa bbbb cccc dddd", 8, count=len)
+    assert [s.text for s in spans] == ["aaaa", "bbbb", "cccc", "dddd"]
+    spans = chunk_text("aaaa bbbb cccc dddd", 9, overlap=4, count=len)
+    assert [s.text for s in spans] == ["aaaa bbbb", "bbbb cccc", "cccc dddd"]
+    assert all(s.tokens == len(s.text) <= 9 for s in spans)
+
+
+def test_overlap_never_makes_a_chunk_on_its_own():
+    def approx(text: str) -> int:
+        return -(-len(text) // 4)
+
+    spans = chunk_text("a a bbbba", 2, overlap=1, count=approx)
+    assert [s.text for s in spans] == ["a a", "a bbbba"]
+    assert all(s.tokens == approx(s.text) <= 2 for s in spans)
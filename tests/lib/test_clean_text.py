@@ -0,0 +1,61 @@
+import json
+import random
+import re
+from pathlib import Path
+
+import pytest
+
+from lib.utils import clean_text
+
+CORPUS = Path(__file__).parents[2] / "dataset" / "wiki_doc.jsonl"
+
+
+def legacy_clean_text(text: str) -> str:
+    """The multi-pass implementation `clean_text` must reproduce"""
+    text = re.sub(r"[\u2060\u200b\u200c\u200d]", "", text)
+    text = re.sub(r"\n\s*([a-zA-Z])\s*\n", r" \1 ", text)
+    text = re.sub(
+        r"\{\s*\\displaystyle\s*([^}]+)\s*\}", r"{\\displaystyle \1}", text
+    )
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\s+([,.!?;:])", r"\1", text)
+    text = re.sub(r"\(\s+", "(", text)
+    text = re.sub(r"\s+\)", ")", text)
+    return text.strip()
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "  \n ",
+        "Let\n x \nbe a prime ( see below ) .",
+        "where\n\n  n\n  \n, and\n k \n)",
+        "{ \\displaystyle \n a^{2}\u2060 + b }  = c",
+        "x\u200b  \t y\r\n\xa0z :",
+    ],
+)
+def test_clean_text_cases(text):
+    assert clean_text(text) == legacy_clean_text(text)
+
+
+@pytest.mark.skipif(not CORPUS.exists(), reason="bundled corpus missing")
+def test_clean_text_matches_corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        for line in f:
+            doc = json.loads(line)
+            for text in [
+                doc["summary"],
+                *(c["content"] for c in doc["chunks"]),
+            ]:
+                assert clean_text(text) == legacy_clean_text(text)
+
+
+def test_clean_text_matches_random_text():
+    pieces = [" ", "  ", "\t", "\n", "\n  ", "\r", "\xa0", "\u2060", "\u200b"]
+    pieces += ["a", "Z", "ab", "1", ",", ".", ":", "(", ")", "{", "}", "é"]
+    pieces += ["\\displaystyle", "{\\displaystyle ", "\\frac{a}{b}"]
+    rng = random.Random(0)
+    for _ in range(20_000):
+        text = "".join(rng.choices(pieces, k=rng.randint(0, 40)))
+        assert clean_text(text) == legacy_clean_text(text), repr(text)
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from lib.corpus import (
+    Corpus,
+    corpus_to_jsonl,
+    jsonl_to_corpus,
+    load_articles,
+    write_corpus,
+)
+from lib.types import Article
+
+
+def article(title: str, language: str, n: int) -> Article:
+    return Article(
+        title=title,
+        source=f"https://{language}.wikipedia.org/wiki/{title}",
+        language=language,
+        chunks=[
+            {
+                "heading": f"H{i}",
+                "level": 1 + i % 2,
+                "content": f"{title} ñ {i}",
+            }
+            for i in range(n)
+        ],
+        summary=f"About {title}",
+    )
+
+
+ARTICLES = [
+    article("Prime number", "en", 3),
+    article("Número primo", "es", 0),
+    article("Batman", "en", 2),
+]
+
+
+def test_round_trip_and_random_access(tmp_path):
+    src = tmp_path / "wiki_doc.jsonl"
+    src.write_text("".join(a.model_dump_json() + "\n" for a in ARTICLES))
+
+    assert jsonl_to_corpus(src, tmp_path / "wiki_doc.corpus") == 3
+    corpus = Corpus(tmp_path / "wiki_doc.corpus")
+    assert len(corpus) == 3
+    assert corpus.chunk(2, 1) == ARTICLES[2].chunks[1]
+    assert corpus.article(1) == ARTICLES[1]
+    assert corpus.find("Batman", "en") == 2
+    assert corpus.find("Batman", "es") is None
+    with pytest.raises(IndexError):
+        corpus.chunk(1, 0)
+
+    assert corpus_to_jsonl(corpus.path, tmp_path / "back.jsonl") == 3
+    back = [json.loads(line) for line in open(tmp_path / "back.jsonl")]
+    assert back == [a.model_dump() for a in ARTICLES]
+    assert list(load_articles(tmp_path / "back.jsonl")) == list(
+        load_articles(corpus.path)
+    )
+
+
+def test_corpus_to_jsonl_replaces_the_output(tmp_path):
+    write_corpus(ARTICLES, tmp_path / "wiki_doc.corpus")
+    dst = tmp_path / "back.jsonl"
+    for _ in range(2):
+        assert corpus_to_jsonl(tmp_path / "wiki_doc.corpus", dst) == 3
+    assert len(dst.read_text().splitlines()) == 3
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "back.jsonl",
+        "wiki_doc.corpus",
+    ]
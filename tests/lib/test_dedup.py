@@ -0,0 +1,67 @@
+import json
+import random
+import string
+
+from lib import dedup
+from lib.dedup import DuplicateIndex, lsh_params
+
+
+def test_near_duplicates_within_scope():
+    index = DuplicateIndex(threshold=0.6)
+    question = "What is the fundamental theorem of arithmetic?"
+    assert index.add(question, "en:Prime number") is None
+    assert (
+        index.add(
+            "What's the fundamental theorem of arithmetic", "en:Prime number"
+        )
+        == question
+    )
+    assert (
+        index.add(
+            "Who proved that there are infinitely many primes?",
+            "en:Prime number",
+        )
+        is None
+    )
+    # same question, other article
+    assert index.add(question, "en:Arithmetic") is None
+    assert len(index) == 3
+
+
+def test_lsh_only_compares_candidates():
+    rng = random.Random(0)
+    words = [
+        "".join(rng.choices(string.ascii_lowercase, k=6)) for _ in range(300)
+    ]
+    texts = [" ".join(rng.sample(words, 6)) + "?" for _ in range(500)]
+    index = DuplicateIndex(threshold=0.8)
+    assert (index.bands, index.rows) == lsh_params(0.8, 128)
+    for text in texts:
+        assert index.add(text) is None
+
+    signature = index.signature(texts[12].replace("?", "!"))
+    duplicate, keys = index._find(signature, "")
+    candidates = {i for key in keys for i in index._buckets.get(key, ())}
+    assert duplicate == texts[12]
+    assert len(candidates) < 10
+
+
+def test_shared_index_is_seeded_from_dataset(tmp_path, monkeypatch):
+    qa = {
+        "type": "factual",
+        "language": "en",
+        "article_title": "Batman",
+        "chunks": [0],
+        "question": "Who created the character Batman?",
+        "answer": "Bob Kane and Bill Finger.",
+    }
+    (tmp_path / "wiki_qa.jsonl").write_text(json.dumps(qa) + "\n")
+    monkeypatch.setattr(dedup.settings, "DATASET_DIR", str(tmp_path))
+    monkeypatch.setattr(dedup.settings, "DEDUP_THRESHOLD", 0.6)
+    dedup.get_duplicate_index.cache_clear()
+    try:
+        index = dedup.get_duplicate_index("wiki_qa.jsonl")
+        assert index.add_qa(qa | {"question": "Who created Batman?"}) is None
+        assert index.add_qa(qa | {"chunks": [1]}) == qa["question"]
+    finally:
+        dedup.get_duplicate_index.cache_clear()
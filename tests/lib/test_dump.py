@@ -0,0 +1,170 @@
+import bz2
+import json
+
+import pytest
+
+from lib import dump as dump_module
+from lib.dump import WikiDump, get_dump_articles, wikitext_to_text
+
+HEADER = (
+    '<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/">'
+    "<siteinfo><sitename>Wikipedia</sitename></siteinfo>\n"
+)
+FOOTER = "</mediawiki>\n"
+
+
+def _page(title: str, text: str, ns: int = 0, redirect: bool = False) -> str:
+    return (
+        f"<page><title>{title}</title><ns>{ns}</ns><id>1</id>"
+        + ('<redirect title="x" />' if redirect else "")
+        + f"<revision><id>7</id><text>{text}</text></revision></page>\n"
+    )
+
+
+PRIME = (
+    "A '''prime''' is a [[natural number]] greater than 1.{{efn|note}}"
+    "&lt;ref&gt;Cite&lt;/ref&gt;\n"
+    "== Definition ==\n"
+    "[[File:Primes.png|thumb|A [[grid]] of primes]]"
+    "It has no divisors other than 1 and &lt;math&gt;n&lt;/math&gt;.\n"
+    "=== Examples ===\n"
+    "2, 3 and [[Five (number)|five]] are primes.\n"
+)
+PAGES = [
+    _page("Prime number", PRIME),
+    _page("Talk:Prime number", "talk", ns=1),
+    _page("Primes", "#REDIRECT [[Prime number]]", redirect=True),
+    _page("Batman", "Batman is a superhero.\n== History ==\nCreated in 1939."),
+]
+
+
+@pytest.fixture
+def xml_dump(tmp_path):
+    path = tmp_path / "enwiki-latest-pages-articles.xml"
+    path.write_text(HEADER + "".join(PAGES) + FOOTER, encoding="utf-8")
+    return path
+
+
+def test_wikitext_to_text():
+    text = wikitext_to_text(
+        "A '''[[prime]]''' {{cite|x={{y}}}}<ref>r</ref> "
+        "<math>{{n}\\choose{k}}</math> [https://x.org site]\n==Uses==\nText"
+    )
+    assert text == (
+        "A prime  {\\displaystyle {{n}\\choose{k}}} site\n"
+        "\n\n== Uses ==\n\nText"
+    )
+
+
+def test_iterate_xml_dump(xml_dump):
+    articles = list(WikiDump(xml_dump))
+
+    assert [a.title for a in articles] == ["Prime number", "Batman"]
+    prime = articles[0]
+    assert prime.language == "en"
+    assert prime.source == "https://en.wikipedia.org/wiki/Prime_number"
+    assert prime.summary == "A prime is a natural number greater than 1."
+    assert [(c["heading"], c["level"]) for c in prime.chunks] == [
+        ("Definition", 1),
+        ("Examples", 2),
+    ]
+    assert prime.chunks[0]["content"] == (
+        "It has no divisors other than 1 and {\\displaystyle n}."
+    )
+    assert prime.chunks[1]["content"] == "2, 3 and five are primes."
+
+
+def test_indexed_lookup_xml(xml_dump):
+    dump = WikiDump(xml_dump)
+    dump.build_index()
+
+    assert dump.get("Batman").chunks[0]["content"] == "Created in 1939."
+    assert dump.get("Prime number") == next(iter(dump))
+    assert dump.get("Missing") is None
+
+
+def test_indexed_lookup_multistream_bz2(tmp_path, xml_dump):
+    streams = [
+        HEADER.encode(),
+        "".join(PAGES[:2]).encode(),
+        "".join(PAGES[2:]).encode(),
+        FOOTER.encode(),
+    ]
+    path = tmp_path / "eswiki-latest-pages-articles-multistream.xml.bz2"
+    index = tmp_path / "eswiki-latest-pages-articles-multistream-index.txt.bz2"
+    offset, lines = 0, []
+    with open(path, "wb") as f:
+        for i, stream in enumerate(streams):
+            if i == 1:
+                lines.append(f"{offset}:1:Prime number")
+            if i == 2:
+                lines.append(f"{offset}:2:Batman")
+            data = bz2.compress(stream)
+            f.write(data)
+            offset += len(data)
+    index.write_bytes(bz2.compress("\n".join(lines).encode() + b"\n"))
+
+    dump = WikiDump(path, index_path=index)
+    assert dump.language == "es"
+    assert [a.title for a in dump] == ["Prime number", "Batman"]
+    assert dump.get("Batman").title == "Batman"
+    assert dump.get("Prime number") == next(iter(WikiDump(xml_dump, "es")))
+
+
+def test_extracted_jsonl_dump(tmp_path):
+    path = tmp_path / "extracted.jsonl"
+    rows = [
+        {
+            "id": "1",
+            "url": "https://es.wikipedia.org/wiki?curid=1",
+            "title": "Célula",
+            "text": "La célula es la unidad.\n\nOtra frase.",
+        },
+        {
+            "id": "2",
+            "title": "Batman",
+            "text": "Intro.\n\n== Historia ==\nCreado en 1939.",
+        },
+    ]
+    path.write_text(
+        "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows),
+        encoding="utf-8",
+    )
+    dump = WikiDump(path, language="es")
+    cell, batman = list(dump)
+
+    assert cell.summary == "La célula es la unidad."
+    assert cell.chunks == [
+        {
+            "heading": "Célula",
+            "level": 1,
+            "content": "La célula es la unidad.\n\nOtra frase.",
+        }
+    ]
+    assert batman.source == "https://es.wikipedia.org/wiki/Batman"
+    assert batman.chunks[0]["heading"] == "Historia"
+
+    dump.build_index()
+    assert dump.get("Batman") == batman
+
+
+def test_get_dump_articles_names_the_dumps_without_the_title(
+    tmp_path, xml_dump, monkeypatch
+):
+    es = tmp_path / "eswiki.jsonl"
+    es.write_text(
+        json.dumps({"title": "Número primo", "text": "Un primo."}) + "\n",
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(
+        dump_module.settings, "WIKI_DUMPS", f"en={xml_dump};es={es}"
+    )
+    dump_module._configured_dumps.cache_clear()
+
+    [article] = get_dump_articles("Prime number", "en")
+    assert article.language == "en"
+    with pytest.raises(ValueError, match=r"not in the dump of: \['es'\]"):
+        get_dump_articles("Prime number", ["en", "es"])
+    with pytest.raises(ValueError, match="No dump configured"):
+        get_dump_articles("Prime number", ["fr"])
+    dump_module._configured_dumps.cache_clear()
@@ -0,0 +1,90 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from lib.index import BM25Index, tokenize
+from lib.types import Article
+
+
+def article(title: str, contents: list[str], language: str = "en") -> Article:
+    return Article(
+        title=title,
+        source="",
+        language=language,
+        summary="",
+        chunks=[
+            {"heading": "", "level": 2, "content": content}
+            for content in contents
+        ],
+    )
+
+
+ARTICLES = [
+    article(
+        "Prime number",
+        [
+            "A prime number is a natural number greater than 1.",
+            "The fundamental theorem of arithmetic.",
+            "Primes are used in public key cryptography.",
+        ],
+    ),
+    article("Photosynthesis", ["Plants convert light into chemical energy."]),
+    article("Número primo", ["Un número primo es un número natural."], "es"),
+]
+
+
+def bm25(query: str, k1: float = 1.2, b: float = 0.75) -> list[float]:
+    """Textbook BM25 of a query against every chunk of ARTICLES"""
+    docs = [
+        Counter(tokenize(f"\n{chunk['content']}"))
+        for a in ARTICLES
+        for chunk in a.chunks
+    ]
+    avgdl = sum(sum(d.values()) for d in docs) / len(docs)
+    scores = []
+    for d in docs:
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in other for other in docs)
+            if not df:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            dl = sum(d.values())
+            tf = d[term]
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        scores.append(score)
+    return scores
+
+
+def test_scores_match_bm25():
+    index = BM25Index.build(ARTICLES)
+    query = "prime number theorem"
+    [hits] = index.search([query], k=10)
+    expected = [s for s in bm25(query) if s > 0]
+    assert [h.score for h in hits] == pytest.approx(
+        sorted(expected, reverse=True), rel=1e-5
+    )
+    assert hits[0][:3] == ("en", "Prime number", 0)
+
+
+def test_batched_search_and_language_filter(tmp_path):
+    index = BM25Index.build(ARTICLES)
+    index.save(tmp_path / "bm25")
+    loaded = BM25Index.load(tmp_path / "bm25")
+    assert isinstance(loaded.postings, np.memmap)
+
+    queries = [
+        "número natural",
+        "light energy",
+        "unknown words",
+        "cryptography",
+    ]
+    batched = loaded.search(queries, k=2, batch_size=3)
+    assert batched == [index.search([q], k=2)[0] for q in queries]
+    assert batched[2] == []
+    assert [h.title for h in batched[1]] == ["Photosynthesis"]
+
+    [hits] = loaded.search(["número natural"], k=5, language="es")
+    assert {h.language for h in hits} == {"es"}
@@ -0,0 +1,194 @@
+import threading
+import time
+
+import pytest
+from pydantic import ValidationError
+
+from lib import jobs as jobs_module
+from lib.jobs import JobQueue, JobRunner
+from lib.sink import JsonlSink, read_jsonl
+from lib.types import Article, QAFormat
+
+
+def _article(title: str = "Batman") -> Article:
+    return Article(
+        title=title,
+        source=f"https://en.wikipedia.org/wiki/{title}",
+        language="en",
+        chunks=[
+            {"heading": f"H{i}", "level": 1, "content": f"{title} chunk {i}."}
+            for i in range(3)
+        ],
+        summary="",
+    )
+
+
+@pytest.fixture
+def queue(tmp_path):
+    jobs = JobQueue(tmp_path / "jobs.db")
+    article = _article()
+    jobs.add_article(article)
+    for i in range(3):
+        jobs.add("factual", article, [i])
+    return jobs
+
+
+def test_queue_is_idempotent_and_persistent(tmp_path, queue, monkeypatch):
+    assert not queue.add_article(_article())
+    assert not queue.add("factual", _article(), [0])
+    assert queue.add("factual", _article(), [0], n=1)
+
+    [task] = queue.claim(1)
+    assert (task.type, task.chunks, task.article) == (
+        "factual",
+        [0],
+        _article(),
+    )
+    # another process opening the same file, e.g. after a crash
+    reopened = JobQueue(tmp_path / "jobs.db")
+    assert reopened.progress()["running"] == 1
+    # still leased by its runner, which may be alive
+    assert reopened.requeue_running() == 0
+    now = time.time()
+    monkeypatch.setattr(jobs_module.time, "time", lambda: now + 61)
+    assert reopened.requeue_running() == 1
+    assert reopened.progress() == {
+        "pending": 4,
+        "running": 0,
+        "done": 0,
+        "failed": 0,
+    }
+
+
+def test_retry_backoff_and_failure(queue):
+    task, *_ = queue.claim(3)
+    queue.retry(task.id, "boom", delay=60)
+    assert [t.id for t in queue.claim(3)] == []
+    assert 59 < queue.next_ready_in() <= 60
+
+    queue.fail(task.id, "boom")
+    assert queue.progress()["failed"] == 1
+    assert queue.retry_failed() == 1
+    assert queue.claim(3)[0].attempts == 0
+
+
+def test_pause_is_shared(tmp_path, queue):
+    other = JobQueue(tmp_path / "jobs.db")
+    other.pause()
+    assert queue.paused
+    queue.resume()
+    assert not other.paused
+
+
+def test_runner_retries_and_writes(tmp_path, queue, monkeypatch):
+    calls = []
+    invalid = {"Batman chunk 0."}
+
+    def flaky_generate_batch(prompts, llm, params, use_cache):
+        calls.append(len(prompts))
+        if len(calls) == 1:
+            raise ConnectionError("server down")
+        results = []
+        for prompt in prompts:
+            bad = next((c for c in invalid if c in prompt), None)
+            invalid.discard(bad)
+            results.append(
+                RuntimeError("empty response")
+                if bad
+                else QAFormat(question="Q", answer="A")
+            )
+        return results
+
+    monkeypatch.setattr(jobs_module, "generate_batch", flaky_generate_batch)
+    runner = JobRunner(queue, llm=None, batch_size=8, backoff=0.01)
+    with JsonlSink(tmp_path / "wiki_qa.jsonl") as sink:
+        assert runner.run(sink, poll=0.01) == 3
+
+    # whole batch failed once, then chunk 0 got an empty answer once
+    assert calls[0] == 3 and sum(calls) == 3 + 3 + 1
+    assert queue.progress()["done"] == 3
+    qas = list(read_jsonl(tmp_path / "wiki_qa.jsonl"))
+    assert sorted(qa["chunks"] for qa in qas) == [[0], [1], [2]]
+
+
+def test_runner_gives_up_and_stops(tmp_path, queue, monkeypatch):
+    monkeypatch.setattr(
+        jobs_module,
+        "generate_batch",
+        lambda prompts, *args: [RuntimeError("empty")] * len(prompts),
+    )
+    runner = JobRunner(queue, None, max_attempts=2, backoff=0.01)
+    with JsonlSink(tmp_path / "wiki_qa.jsonl") as sink:
+        assert runner.run(sink, poll=0.01) == 0
+    assert queue.progress()["failed"] == 3
+
+    queue.retry_failed()
+    queue.pause()
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=runner.run, args=(JsonlSink(tmp_path / "x.jsonl"), stop)
+    )
+    thread.start()
+    stop.set()
+    thread.join(5)
+    assert queue.progress()["pending"] == 3
+
+
+def test_runner_fails_invalid_prompts_and_answers_at_once(
+    tmp_path, queue, monkeypatch
+):
+    try:
+        QAFormat.model_validate_json('{"question": "Q"}')
+    except ValidationError as e:
+        invalid = e
+    calls = []
+
+    def generate_batch(prompts, *args):
+        calls.append(len(prompts))
+        return [
+            ValueError("Prompt too large: 300 tokens + 100"),
+            invalid,
+            QAFormat(question="Q", answer="A"),
+        ]
+
+    monkeypatch.setattr(jobs_module, "generate_batch", generate_batch)
+    runner = JobRunner(queue, None, backoff=0.01)
+    with JsonlSink(tmp_path / "wiki_qa.jsonl") as sink:
+        assert runner.run(sink, poll=0.01) == 1
+    assert calls == [3]
+    assert queue.progress()["failed"] == 2
+
+
+def test_runner_leaves_jobs_of_another_runner(tmp_path, queue, monkeypatch):
+    # a runner on another process is working on the first job
+    [other] = JobQueue(tmp_path / "jobs.db").claim(1)
+    seen = []
+
+    def generate_batch(prompts, *args):
+        seen.extend(prompts)
+        return [QAFormat(question="Q", answer="A")] * len(prompts)
+
+    monkeypatch.setattr(jobs_module, "generate_batch", generate_batch)
+    runner = JobRunner(queue, None)
+    with JsonlSink(tmp_path / "wiki_qa.jsonl") as sink:
+        assert runner.run(sink, poll=0.01) == 2
+    assert not any("Batman chunk 0." in prompt for prompt in seen)
+    assert queue.progress()["running"] == 1
+
+
+def test_runner_keeps_its_jobs_leased(tmp_path, monkeypatch):
+    jobs = JobQueue(tmp_path / "jobs.db", lease=0.15)
+    article = _article()
+    jobs.add_article(article)
+    jobs.add("factual", article, [0])
+    requeued = []
+
+    def slow_generate_batch(prompts, *args):
+        time.sleep(0.4)
+        requeued.append(JobQueue(tmp_path / "jobs.db").requeue_running())
+        return [QAFormat(question="Q", answer="A")] * len(prompts)
+
+    monkeypatch.setattr(jobs_module, "generate_batch", slow_generate_batch)
+    with JsonlSink(tmp_path / "wiki_qa.jsonl") as sink:
+        assert JobRunner(jobs, None).run(sink, poll=0.01) == 1
+    assert requeued == [0]
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from lib import llm as llm_module
+from lib.cache import ResponseCache
+from lib.llm import AsyncOpenAIClient, generate, generate_batch
+from lib.telemetry import Telemetry
+from lib.types import QAFormat
+from settings import settings
+
+
+class FakeEngine:
+    """Offline engine stand-in that answers every prompt in one call"""
+
+    def __init__(self, responses: dict[str, str]):
+        self.responses = responses
+        self.calls: list[list[str]] = []
+
+    def generate(self, prompts, sampling_params=None, **kwargs):
+        self.calls.append(list(prompts))
+        return [
+            SimpleNamespace(
+                prompt_token_ids=list(range(len(p))),
+                outputs=[
+                    SimpleNamespace(
+                        text=self.responses[p],
+                        token_ids=list(range(len(self.responses[p]))),
+                    )
+                ],
+            )
+            for p in prompts
+        ]
+
+
+@pytest.fixture
+def fake_llm():
+    """
+    `FakeEngine` passing the prod path's `isinstance(llm, vllm.LLM)` check,
+    the tests using it are skipped without vllm
+    """
+    vllm = pytest.importorskip("vllm")
+
+    class FakeLLM(FakeEngine, vllm.LLM):
+        pass
+
+    return FakeLLM
+
+
+@pytest.fixture(autouse=True)
+def prod_env(monkeypatch):
+    monkeypatch.setattr(settings, "ENVIRONMENT", "prod")
+    monkeypatch.setattr(llm_module, "get_response_cache", lambda: None)
+
+
+def test_generate_batch_single_engine_call_in_order(fake_llm):
+    llm = fake_llm(
+        {
+            "a": '{"question": "Qa", "answer": "Aa"}',
+            "b": '{"question": "Qb", "answer": "Ab"}',
+        }
+    )
+    results = generate_batch(["b", "a"], llm)
+
+    assert llm.calls == [["b", "a"]]
+    assert results == [
+        QAFormat(question="Qb", answer="Ab"),
+        QAFormat(question="Qa", answer="Aa"),
+    ]
+
+
+def test_generate_batch_per_item_errors(fake_llm):
+    llm = fake_llm(
+        {"ok": '{"question": "Q", "answer": "A"}', "bad": "{not json"}
+    )
+    too_large = "x" * (settings.CTX_WINDOW * 4)
+    results = generate_batch(["ok", too_large, "bad"], llm)
+
+    assert llm.calls == [["ok", "bad"]]
+    assert results[0] == QAFormat(question="Q", answer="A")
+    assert isinstance(results[1], ValueError)
+    assert isinstance(results[2], Exception)
+
+
+def test_generate_batch_telemetry(monkeypatch, fake_llm):
+    recorder = Telemetry()
+    monkeypatch.setattr(llm_module, "telemetry", recorder)
+    responses = {"ok": '{"question": "Q", "answer": "A"}', "bad": "{no"}
+    generate_batch(
+        ["ok", "bad", "x" * (settings.CTX_WINDOW * 4)], fake_llm(responses)
+    )
+
+    # the fake engine has a token per character
+    assert recorder.value("prompt_tokens_total") == len("okbad")
+    assert recorder.value("completion_tokens_total") == sum(
+        map(len, responses.values())
+    )
+    assert recorder.value("generation_failures_total", reason="validation") == 1
+    assert (
+        recorder.value("generation_failures_total", reason="prompt_too_long")
+        == 1
+    )
+    assert recorder.value("generation_tokens_per_second") == 1
+
+
+def test_generate_raises_item_error(fake_llm):
+    llm = fake_llm({"bad": ""})
+    with pytest.raises(RuntimeError):
+        generate("bad", llm)
+
+
+def _completion(content: str) -> dict:
+    return {
+        "id": "cmpl",
+        "object": "chat.completion",
+        "created": 0,
+        "model": settings.LLM_MODEL,
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }
+        ],
+    }
+
+
+def test_async_client_bounded_concurrency():
+    in_flight = peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        return httpx.Response(
+            200, json=_completion(f'{{"question": "{prompt}", "answer": "A"}}')
+        )
+
+    client = AsyncOpenAIClient(
+        concurrency=3, transport=httpx.MockTransport(handler)
+    )
+    try:
+        results = client.generate_batch([f"q{i}" for i in range(10)])
+    finally:
+        client.close()
+
+    assert [r.question for r in results] == [f"q{i}" for i in range(10)]
+    assert 1 < peak <= 3
+
+
+def test_async_client_retries_then_reports_errors():
+    attempts: dict[str, int] = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        attempts[prompt] = attempts.get(prompt, 0) + 1
+        if prompt == "flaky" and attempts[prompt] < 3:
+            return httpx.Response(429, json={"error": "slow down"})
+        if prompt == "invalid":
+            return httpx.Response(400, json={"error": "bad request"})
+        return httpx.Response(
+            200, json=_completion('{"question": "Q", "answer": "A"}')
+        )
+
+    client = AsyncOpenAIClient(
+        max_retries=3, backoff=0.001, transport=httpx.MockTransport(handler)
+    )
+    try:
+        flaky, invalid = client.generate_batch(["flaky", "invalid"])
+    finally:
+        client.close()
+
+    assert flaky == QAFormat(question="Q", answer="A")
+    assert attempts["flaky"] == 3
+    assert isinstance(invalid, Exception)
+    assert attempts["invalid"] == 1
+
+
+def test_generate_batch_groups_prompts_by_prefix(monkeypatch, fake_llm):
+    monkeypatch.setattr(settings, "PREFIX_CACHING", True)
+    answer = '{{"question": "{}", "answer": "A"}}'
+    llm = fake_llm(
+        {p: answer.format(p) for p in ["ctx1 b", "ctx2 a", "ctx1 a"]}
+    )
+    results = generate_batch(["ctx1 b", "ctx2 a", "ctx1 a"], llm)
+
+    assert llm.calls == [["ctx1 a", "ctx1 b", "ctx2 a"]]
+    assert [r.question for r in results] == ["ctx1 b", "ctx2 a", "ctx1 a"]
+
+
+def test_generate_batch_response_cache(monkeypatch, tmp_path, fake_llm):
+    cache = ResponseCache(tmp_path / "responses.db")
+    monkeypatch.setattr(llm_module, "get_response_cache", lambda: cache)
+    llm = fake_llm(
+        {"a": '{"question": "Qa", "answer": "Aa"}', "bad": "{not json"}
+    )
+
+    first = generate_batch(["a", "bad"], llm)
+    second = generate_batch(["a", "bad"], llm)
+    assert llm.calls == [["a", "bad"], ["bad"]]  # errors are not cached
+    assert second[0] == first[0]
+
+    generate_batch(["a"], llm, {"temperature": 0.9})
+    generate_batch(["a"], llm, use_cache=False)
+    assert llm.calls[2:] == [["a"], ["a"]]
+
+
+def test_shared_client_warm_up(monkeypatch):
+    loaded = threading.Event()
+
+    def slow_get_client():
+        loaded.wait(5)
+        return "client"
+
+    monkeypatch.setattr(llm_module, "get_client", slow_get_client)
+    shared = llm_module.SharedClient()
+    thread = shared.warm_up()
+    assert shared.status()["ready"] is False
+
+    loaded.set()
+    thread.join(5)
+    assert shared.status()["ready"] is True
+    assert shared.get() == "client"
+
+
+def test_shared_client_reports_errors(monkeypatch):
+    def broken():
+        raise RuntimeError("no GPU")
+
+    monkeypatch.setattr(llm_module, "get_client", broken)
+    shared = llm_module.SharedClient()
+    shared.warm_up().join(5)
+    assert shared.status()["error"] == "no GPU"
+    assert not shared.ready
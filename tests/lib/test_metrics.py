@@ -0,0 +1,105 @@
+import json
+import math
+import random
+
+import pytest
+
+from lib.metrics import evaluate, evaluate_files
+
+
+def reference(ranked: list[int], gold: set[int], k: int) -> dict[str, float]:
+    """Textbook per-query definitions"""
+    top = ranked[:k]
+    rel = [doc in gold for doc in top]
+    hits = sum(rel)
+    first = next((i for i, r in enumerate(rel) if r), None)
+    dcg = sum(r / math.log2(i + 2) for i, r in enumerate(rel))
+    idcg = sum(1 / math.log2(i + 2) for i in range(min(len(gold), k)))
+    ap = sum(sum(rel[: i + 1]) / (i + 1) for i, r in enumerate(rel) if r)
+    return {
+        f"precision@{k}": hits / k,
+        f"recall@{k}": hits / len(gold),
+        f"hit_rate@{k}": float(hits > 0),
+        f"mrr@{k}": 0.0 if first is None else 1 / (first + 1),
+        f"ndcg@{k}": dcg / idcg,
+        f"map@{k}": ap / min(len(gold), k),
+    }
+
+
+def pair(title: str, chunks: list[int], type_q: str = "factual") -> dict:
+    return {
+        "type": type_q,
+        "language": "en",
+        "article_title": title,
+        "chunks": chunks,
+        "question": f"{title} {chunks}?",
+        "answer": "",
+    }
+
+
+def test_known_values():
+    qa = [pair("A", [1]), pair("A", [0, 2])]
+    runs = [{"id": 0, "chunks": [3, 1]}, {"id": 1, "chunks": [2, 5, 0]}]
+    report = evaluate(qa, runs, ks=[1, 3])["overall"]
+    assert report["hit_rate@1"] == pytest.approx(0.5)
+    assert report["mrr@3"] == pytest.approx((1 / 2 + 1) / 2)
+    assert report["recall@3"] == pytest.approx(1.0)
+    assert report["precision@3"] == pytest.approx((1 / 3 + 2 / 3) / 2)
+    assert report["map@3"] == pytest.approx((1 / 2 + (1 + 2 / 3) / 2) / 2)
+
+
+def test_matches_reference_on_random_runs():
+    rng = random.Random(0)
+    qa, runs = [], []
+    for i in range(300):
+        qa.append(
+            pair(
+                rng.choice("ABC"),
+                rng.sample(range(8), rng.randint(1, 3)),
+                rng.choice(["factual", "multihop"]),
+            )
+        )
+        if rng.random() < 0.9:  # some queries retrieve nothing
+            runs.append(
+                {"id": i, "chunks": rng.sample(range(8), rng.randint(0, 6))}
+            )
+    ks = [1, 3, 5, 10]
+    report = evaluate(qa, runs, ks=ks)
+
+    retrieved = {run["id"]: run["chunks"] for run in runs}
+    expected = [
+        {
+            name: value
+            for k in ks
+            for name, value in reference(
+                retrieved.get(i, []), set(p["chunks"]), k
+            ).items()
+        }
+        for i, p in enumerate(qa)
+    ]
+    for metric, value in report["overall"].items():
+        mean = sum(e[metric] for e in expected) / len(expected)
+        assert value == pytest.approx(mean), metric
+
+    factual = [e for e, p in zip(expected, qa) if p["type"] == "factual"]
+    assert report["type"]["factual"]["queries"] == len(factual)
+    assert report["type"]["factual"]["ndcg@5"] == pytest.approx(
+        sum(e["ndcg@5"] for e in factual) / len(factual)
+    )
+
+
+def test_runs_by_question_and_other_articles(tmp_path):
+    qa = [pair("A", [1]), pair("B", [0])]
+    qa_path = tmp_path / "wiki_qa.jsonl"
+    qa_path.write_text("".join(json.dumps(p) + "\n" for p in qa))
+    runs_path = tmp_path / "runs.jsonl"
+    runs_path.write_text(
+        json.dumps({"question": qa[1]["question"], "chunks": [["A", 0], 0]})
+        + "\n"
+        + json.dumps({"id": 0, "chunks": [["A", 1], 1]})
+        + "\n"
+    )
+    report = evaluate_files(qa_path, runs_path, ks=[1, 2])
+    assert report["article_title"]["B"]["mrr@2"] == pytest.approx(0.5)
+    # duplicates count once
+    assert report["article_title"]["A"]["precision@2"] == pytest.approx(0.5)
@@ -0,0 +1,18 @@
+from lib.prompt import build_prompt
+
+CHUNKS = [{"heading": "History", "level": 1, "content": "Created in 1939."}]
+
+
+def test_build_prompt_layouts():
+    default = build_prompt("factual", CHUNKS, context_first=False)
+    cached = build_prompt("factual", CHUNKS, context_first=True)
+
+    assert default.startswith("Generate one factual question")
+    assert cached.startswith("Text:\nHeading: History")
+    assert "Created in 1939." in default and "Created in 1939." in cached
+
+
+def test_build_prompt_multihop():
+    prompt = build_prompt("multihop", CHUNKS * 2, context_first=False)
+    assert "at least two of the sections" in prompt
+    assert prompt.count("Heading: History") == 2
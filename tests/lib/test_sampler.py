@@ -0,0 +1,71 @@
+from collections import Counter
+
+from lib.sampler import SECTION_BONUS, relatedness, sample_chunks, sections
+from lib.types import Article
+
+CHUNKS = [
+    ("Biology", 1, "Cats are small carnivorous mammals."),
+    ("Anatomy", 2, "The skeleton of cats has flexible vertebrae."),
+    ("Senses", 2, "Cats see well at night with their eyes."),
+    ("History", 1, ""),
+    ("Domestication", 2, "Cats were domesticated in the Near East."),
+    (
+        "Ancient Egypt",
+        3,
+        "Egyptians worshipped cats; the Near East spread them.",
+    ),
+    ("Culture", 1, "Cats appear in many proverbs."),
+]
+ARTICLE = Article(
+    title="Cat",
+    source="",
+    language="en",
+    summary="",
+    chunks=[
+        {"heading": h, "level": level, "content": c} for h, level, c in CHUNKS
+    ],
+)
+
+
+def test_sections_from_levels():
+    assert sections(ARTICLE) == [-1, 0, 0, -1, 3, 4, -1]
+
+
+def test_factual_picks_cover_sections_deterministically():
+    picks = sample_chunks(ARTICLE, "factual", 6, seed=1)
+    assert picks == sample_chunks(ARTICLE, "factual", 6, seed=1)
+    assert picks != sample_chunks(ARTICLE, "factual", 6, seed=2)
+    assert all(len(p) == 1 for p in picks)
+    # no empty chunk, every usable chunk once before any repeats
+    assert sorted(p[0] for p in picks) == [0, 1, 2, 4, 5, 6]
+    # the first three come from the three top-level sections
+    top = {0: 0, 1: 0, 2: 0, 4: 3, 5: 3, 6: 6}
+    assert len({top[p[0]] for p in picks[:3]}) == 3
+
+
+def test_multihop_sets_are_related():
+    sets = sample_chunks(ARTICLE, "multihop", 12, seed=0)
+    factual = sample_chunks(ARTICLE, "factual", 12, seed=0)
+    assert [s[0] for s in sets] == [f[0] for f in factual]
+    assert all(2 <= len(s) == len(set(s)) <= 3 and 3 not in s for s in sets)
+    # the domestication chunks share a section and "near east"
+    pairs = Counter(frozenset(s[:2]) for s in sets)
+    assert pairs[frozenset([4, 5])] >= 1
+
+
+def test_pieces_of_a_long_section_are_related():
+    article = ARTICLE.model_copy(
+        update={
+            "chunks": [
+                {"heading": "Biology", "level": 1, "content": "Cats hunt."},
+                {"heading": "Biology", "level": 1, "content": "Fur grows."},
+                {"heading": "Anatomy", "level": 2, "content": "Bones bend."},
+                {"heading": "Culture", "level": 1, "content": "Proverbs."},
+            ]
+        }
+    )
+    scores = relatedness(article)
+    # no shared terms: only the section bonus
+    assert scores[0, 1] == scores[1, 0] == SECTION_BONUS
+    assert scores[0, 2] == scores[1, 2] == SECTION_BONUS
+    assert scores[0, 3] == scores[1, 3] == scores[2, 3] == 0
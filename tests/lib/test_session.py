@@ -0,0 +1,55 @@
+import pytest
+
+from lib.session import SessionStore
+from lib.types import QA, Article
+
+ARTICLE = Article(
+    title="Batman",
+    source="https://en.wikipedia.org/wiki/Batman",
+    language="en",
+    chunks=[{"heading": "History", "level": 1, "content": "Gotham"}],
+    summary="",
+)
+
+
+def qa(question: str) -> QA:
+    return QA(
+        type="factual",
+        language="en",
+        article_title="Batman",
+        chunks=[0],
+        question=question,
+        answer="Gotham",
+    )
+
+
+def test_sessions_in_memory():
+    store = SessionStore()
+    first, second = store.new(), store.new()
+    assert store.get(first).add_qa(qa("Where?")) == 1
+    assert store.get(second).qa == []
+    store.drop(first)
+    with pytest.raises(KeyError):
+        store.get(first)
+    with pytest.raises(KeyError):
+        store.get(None)
+    assert len(store) == 1
+
+
+def test_spilled_sessions_are_read_back(tmp_path):
+    store = SessionStore(tmp_path, max_sessions=1)
+    first = store.new()
+    store.get(first).set_articles([ARTICLE])
+    store.get(first).add_qa(qa("Where?"))
+    store.get(first).add_qa(qa("Who?"))
+
+    second = store.new()  # pushes the first one out of memory
+    assert len(store) == 1
+    session = store.get(first)
+    assert session.articles == [ARTICLE]
+    assert [p.question for p in session.qa] == ["Where?", "Who?"]
+    assert session.add_qa(qa("When?")) == 3
+
+    store.drop(second)
+    store.drop(first)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,77 @@
+import json
+
+from lib import sink as sink_module
+from lib.sink import JsonlSink, export_jsonl, read_jsonl, save_articles
+from lib.types import Article, QAFormat
+
+
+def test_sink_batches_and_checkpoints(tmp_path):
+    path = tmp_path / "wiki_qa.jsonl"
+    sink = JsonlSink(path, flush_every=2)
+    sink.write(QAFormat(question="Q1", answer="A1"))
+    assert path.read_text() == ""  # still buffered
+
+    sink.write({"question": "Q2", "answer": "Ä2"})
+    assert len(path.read_text().splitlines()) == 2
+    sink.write(QAFormat(question="Q3", answer="A3"))
+    sink.close()
+
+    assert [r["question"] for r in read_jsonl(path)] == ["Q1", "Q2", "Q3"]
+    state = json.loads((tmp_path / "wiki_qa.jsonl.ckpt").read_text())
+    assert state == {"offset": path.stat().st_size, "records": 3}
+
+
+def test_sink_drops_torn_record_on_resume(tmp_path):
+    path = tmp_path / "wiki_qa.jsonl"
+    with JsonlSink(path) as sink:
+        sink.write({"n": 1})
+    # a killed run: one complete record after the checkpoint, one torn
+    with open(path, "a") as f:
+        f.write('{"n": 2}\n{"n": 3, "que')
+
+    assert [r["n"] for r in read_jsonl(path)] == [1, 2]
+    with JsonlSink(path) as sink:
+        assert sink.records == 2
+        sink.write({"n": 4})
+    assert [r["n"] for r in read_jsonl(path)] == [1, 2, 4]
+
+
+def test_sink_keeps_last_line_without_newline(tmp_path):
+    path = tmp_path / "wiki_qa.jsonl"
+    path.write_text('{"n": 1}\n{"n": 2}')  # e.g. saved by an editor
+
+    assert [r["n"] for r in read_jsonl(path)] == [1, 2]
+    with JsonlSink(path) as sink:
+        assert sink.records == 2
+        sink.write({"n": 3})
+    assert [r["n"] for r in read_jsonl(path)] == [1, 2, 3]
+
+
+def test_export_jsonl_streams_records():
+    def records():
+        for i in range(3):
+            yield QAFormat(question=f"Q{i}", answer="A")
+
+    path = export_jsonl(records(), prefix="wiki_qa_")
+    assert path.endswith(".jsonl")
+    assert [r["question"] for r in read_jsonl(path)] == ["Q0", "Q1", "Q2"]
+
+
+def test_save_articles_writes_each_article_once(tmp_path, monkeypatch):
+    def article(title: str) -> Article:
+        return Article(
+            title=title, source="", language="en", chunks=[], summary=""
+        )
+
+    monkeypatch.setattr(sink_module.settings, "DATASET_DIR", str(tmp_path))
+    sink_module.get_dataset_sink.cache_clear()
+    sink_module._saved_articles.cache_clear()
+    (tmp_path / "wiki_doc.jsonl").write_text(article("A").model_dump_json())
+
+    assert save_articles([article("A"), article("B"), article("B")]) == 1
+    assert save_articles([article("B")]) == 0
+    sink_module.get_dataset_sink("wiki_doc.jsonl").close()
+    sink_module.get_dataset_sink.cache_clear()
+    sink_module._saved_articles.cache_clear()
+    titles = [doc["title"] for doc in read_jsonl(tmp_path / "wiki_doc.jsonl")]
+    assert titles == ["A", "B"]
@@ -0,0 +1,46 @@
+import json
+
+from lib.index import BM25Index
+from lib.sink import JsonlSink
+from lib.store import ArticleStore
+from lib.types import Article
+
+
+def article(title: str, language: str) -> Article:
+    return Article(
+        title=title,
+        source=f"https://{language}.wikipedia.org/wiki/{title}",
+        language=language,
+        chunks=[
+            {"heading": "History", "level": 1, "content": f"{title} — año 1"},
+            {"heading": "See also", "level": 2, "content": ""},
+            {"heading": "Notes", "level": 2, "content": "ok"},
+        ],
+        summary="",
+    )
+
+
+ARTICLES = [article("Batman", "en"), article("Batman", "es")]
+
+
+def test_views_match_articles():
+    store = ArticleStore(ARTICLES)
+    assert len(store) == 2
+    assert store.headings == ["History", "See also", "Notes"]
+    view = store.find("Batman", "es")
+    assert view == ARTICLES[1] and view.to_article() == ARTICLES[1]
+    assert view.chunks[0]["content"] == "Batman — año 1"
+    assert view.chunks[-1] == ARTICLES[1].chunks[-1]
+    assert list(store) == ARTICLES
+    assert store.find("Batman", "fr") is None
+
+
+def test_views_work_with_existing_callers(tmp_path):
+    store = ArticleStore(ARTICLES)
+    with JsonlSink(tmp_path / "wiki_doc.jsonl") as sink:
+        sink.write(store[0])
+    [line] = open(tmp_path / "wiki_doc.jsonl")
+    assert json.loads(line) == ARTICLES[0].model_dump()
+
+    [hits] = BM25Index.build(store).search(["año"], k=5, language="es")
+    assert [(h.title, h.chunk) for h in hits] == [("Batman", 0)]
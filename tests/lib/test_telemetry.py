@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from lib.telemetry import Telemetry
+
+
+def test_spans_fill_histograms_and_trace(tmp_path):
+    telemetry = Telemetry(tmp_path / "trace.jsonl")
+
+    @telemetry.timed("fetch")
+    def fetch(fail: bool) -> str:
+        if fail:
+            raise ConnectionError("offline")
+        return "ok"
+
+    assert fetch(False) == "ok"
+    with pytest.raises(ConnectionError):
+        fetch(True)
+    with telemetry.span("generate", prompts=2) as span:
+        span["completion_tokens"] = 40
+    telemetry.close()
+
+    assert telemetry.value("stage_seconds", stage="fetch") == 2
+    assert telemetry.value("stage_errors_total", stage="fetch") == 1
+    trace = [
+        json.loads(line)
+        for line in (tmp_path / "trace.jsonl").read_text().splitlines()
+    ]
+    assert [(r["stage"], r["ok"]) for r in trace] == [
+        ("fetch", True),
+        ("fetch", False),
+        ("generate", True),
+    ]
+    assert trace[-1]["prompts"] == 2 and trace[-1]["completion_tokens"] == 40
+
+
+def test_render_prometheus_text():
+    telemetry = Telemetry()
+    telemetry.inc("cache_requests_total", cache="response", result="hit")
+    telemetry.inc("cache_requests_total", 2, cache="response", result="miss")
+    telemetry.inc("parse_failures_total", reason='say "no"')
+    for seconds in [0.003, 0.2, 100]:
+        telemetry.observe("stage_seconds", seconds, stage="chunk")
+
+    lines = telemetry.render().splitlines()
+    assert "# TYPE wikiqa_cache_requests_total counter" in lines
+    assert (
+        'wikiqa_cache_requests_total{cache="response",result="miss"} 2' in lines
+    )
+    assert 'wikiqa_parse_failures_total{reason="say \\"no\\""} 1' in lines
+    assert "# TYPE wikiqa_stage_seconds histogram" in lines
+    # buckets are cumulative, the last one counts everything
+    assert 'wikiqa_stage_seconds_bucket{stage="chunk",le="0.005"} 1' in lines
+    assert 'wikiqa_stage_seconds_bucket{stage="chunk",le="60.0"} 2' in lines
+    assert 'wikiqa_stage_seconds_bucket{stage="chunk",le="+Inf"} 3' in lines
+    assert 'wikiqa_stage_seconds_count{stage="chunk"} 3' in lines
+    assert 'wikiqa_stage_seconds_sum{stage="chunk"} 100.203' in lines
@@ -0,0 +1,33 @@
+import gc
+import weakref
+
+from lib.tokenizer import digest_cache
+
+
+class Text(str):
+    """A str that can be weakly referenced"""
+
+
+def test_digest_cache_keeps_counts_not_texts():
+    calls = []
+
+    @digest_cache(maxsize=2)
+    def count(text: str) -> int:
+        calls.append(len(text))
+        return len(text)
+
+    text = Text("x" * 1000)
+    ref = weakref.ref(text)
+    assert count(text) == count("x" * 1000) == 1000
+    assert len(calls) == 1
+    del text
+    gc.collect()
+    assert ref() is None
+
+    count("a")
+    count("bb")  # evicts the least recently used entry
+    assert count("x" * 1000) == 1000
+    assert len(calls) == 4
+    count.cache_clear()
+    count("a")
+    assert len(calls) == 5
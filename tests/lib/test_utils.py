@@ -1,5 +1,5 @@
 import pytest
-from src.lib.utils import parse_qa_output
+from src.lib.utils import page_bounds, parse_qa_output
 
 
 @pytest.mark.parametrize(
@@ -96,3 +96,17 @@ def test_labels_with_only_whitespace_returns_none():
     """Ensures that labels followed only by whitespace results in None."""
     input_str = "Question: \t \n Answer:     "
     assert parse_qa_output(input_str) is None
+
+
+@pytest.mark.parametrize(
+    "total, page, size, expected",
+    [
+        (45, 0, 20, (range(0, 20), 0, 3)),
+        (45, 2, 20, (range(40, 45), 2, 3)),
+        (45, 9, 20, (range(40, 45), 2, 3)),  # clamped to the last page
+        (45, -1, 20, (range(0, 20), 0, 3)),
+        (0, 0, 20, (range(0, 0), 0, 1)),
+    ],
+)
+def test_page_bounds(total, page, size, expected):
+    assert page_bounds(total, page, size) == expected
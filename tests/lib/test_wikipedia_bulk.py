@@ -0,0 +1,148 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from lib.cache import ArticleCache
+from lib.wikipedia import _parse_extract, get_wikipedia_articles
+
+EXTRACT = (
+    "Summary of {title}.\n\n"
+    "== History ==\n"
+    "Old  text ( see below ) .\n\n"
+    "=== Early ===\n"
+    "Earliest records.\n\n"
+    "== Uses ==\n"
+    "Many uses."
+)
+
+# lang -> title -> (pageid, revid)
+PAGES = {
+    "en": {"Prime number": (1, 100), "Batman": (2, 200)},
+    "es": {"Número primo": (11, 110), "Batman": (12, 210)},
+}
+LANGLINKS = {("Prime number", "es"): "Número primo", ("Batman", "es"): "Batman"}
+REDIRECTS = {"Prime Numbers": "Prime number"}
+
+
+class FakeMediaWiki(BaseHTTPRequestHandler):
+    requests: list[tuple[str, dict]] = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        lang = url.path.split("/")[1]
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.requests.append((lang, params))
+        body = json.dumps(self._query(lang, params)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _query(self, lang: str, params: dict) -> dict:
+        pages_by_id = {
+            pageid: title for title, (pageid, _) in PAGES[lang].items()
+        }
+        if params["prop"] == "extracts":
+            title = pages_by_id[int(params["pageids"])]
+            return {
+                "query": {
+                    "pages": [
+                        {"title": title, "extract": EXTRACT.format(title=title)}
+                    ]
+                }
+            }
+
+        redirects, pages = [], []
+        for title in params["titles"].split("|"):
+            if title in REDIRECTS:
+                redirects.append({"from": title, "to": REDIRECTS[title]})
+                title = REDIRECTS[title]
+            if title not in PAGES[lang]:
+                pages.append({"title": title, "missing": True})
+                continue
+            pageid, revid = PAGES[lang][title]
+            page = {"pageid": pageid, "title": title}
+            if params["prop"] == "info":
+                page["lastrevid"] = revid
+                page["fullurl"] = f"https://{lang}.wikipedia.org/wiki/{title}"
+            elif (title, params["lllang"]) in LANGLINKS:
+                page["langlinks"] = [
+                    {
+                        "lang": params["lllang"],
+                        "title": LANGLINKS[(title, params["lllang"])],
+                    }
+                ]
+            pages.append(page)
+        return {"query": {"redirects": redirects, "pages": pages}}
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_url():
+    FakeMediaWiki.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeMediaWiki)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/{{lang}}/api.php"
+    server.shutdown()
+
+
+def test_bulk_fetch_groups_queries(api_url, tmp_path):
+    cache = ArticleCache(tmp_path / "articles.db")
+    titles = ["Prime Numbers", "Batman", "Missing page"]
+    articles = get_wikipedia_articles(
+        titles, ["en", "es"], cache=cache, api_url=api_url
+    )
+
+    assert [a.title for a in articles["Prime Numbers"]] == [
+        "Prime number",
+        "Número primo",
+    ]
+    assert [a.language for a in articles["Batman"]] == ["en", "es"]
+    assert articles["Missing page"] == []
+
+    prime = articles["Prime Numbers"][0]
+    assert prime.source == "https://en.wikipedia.org/wiki/Prime number"
+    assert prime.summary == "Summary of Prime number."
+    assert [(c["heading"], c["level"]) for c in prime.chunks] == [
+        ("History", 1),
+        ("Early", 2),
+        ("Uses", 1),
+    ]
+    assert prime.chunks[0]["content"] == "Old text (see below)."
+
+    # en info + es langlinks + es info, each covering all titles at once,
+    # then one extract per page
+    lookups = [p for _, p in FakeMediaWiki.requests if p["prop"] != "extracts"]
+    assert len(lookups) == 3
+    assert all(len(p["titles"].split("|")) >= 2 for p in lookups)
+    assert len(FakeMediaWiki.requests) == 3 + 4
+
+
+def test_bulk_fetch_uses_cache(api_url, tmp_path):
+    cache = ArticleCache(tmp_path / "articles.db")
+    first = get_wikipedia_articles(
+        ["Batman"], ["en", "es"], cache=cache, api_url=api_url
+    )
+    FakeMediaWiki.requests = []
+
+    assert (
+        get_wikipedia_articles(
+            ["Batman"], ["en", "es"], cache=cache, api_url=api_url
+        )
+        == first
+    )
+    assert FakeMediaWiki.requests == []
+
+
+def test_parse_extract_without_lead_has_empty_summary():
+    summary, sections = _parse_extract("\n\n== History ==\nOld text.")
+    assert summary == ""
+    assert [(s.title, s.text) for s in sections] == [("History", "Old text.")]
+    assert _parse_extract("Only a lead.") == ("Only a lead.", [])
@@ -0,0 +1,248 @@
+import json
+import threading
+
+import pytest
+
+import pipeline
+from lib.types import Article, QAFormat
+
+
+@pytest.fixture(autouse=True)
+def no_dedup(monkeypatch):
+    # the fake backends answer the same question over and over
+    monkeypatch.setattr(pipeline.settings, "DEDUP_THRESHOLD", 0.0)
+
+
+def _article(title: str, language: str) -> Article:
+    return Article(
+        title=title,
+        source=f"https://{language}.wikipedia.org/wiki/{title}",
+        language=language,
+        chunks=[
+            {"heading": f"H{i}", "level": 1, "content": f"{title} chunk {i}."}
+            for i in range(4)
+        ],
+        summary="",
+    )
+
+
+def test_read_topics(tmp_path):
+    path = tmp_path / "topics.txt"
+    path.write_text(
+        "Prime number\n\n# comment\n"
+        '{"title": "Batman", "langs": ["en", "es"], "pairs": 3}\n'
+    )
+    topics = pipeline.read_topics(path, ["en"], ["factual"], 2)
+
+    assert [(t.title, t.langs, t.pairs) for t in topics] == [
+        ("Prime number", ["en"], 2),
+        ("Batman", ["en", "es"], 3),
+    ]
+
+
+def test_run_writes_dataset_schema(tmp_path, monkeypatch):
+    def fake_iter_articles(titles, langs, **kwargs):
+        for title in titles:
+            for lang in langs:
+                yield title, lang, _article(title, lang)
+
+    monkeypatch.setattr(pipeline, "iter_wikipedia_articles", fake_iter_articles)
+    batches = []
+
+    def fake_generate_batch(prompts, llm, params, use_cache):
+        batches.append(len(prompts))
+        return [
+            QAFormat(question=f"Q{i}", answer="A") for i in range(len(prompts))
+        ]
+
+    monkeypatch.setattr(pipeline, "generate_batch", fake_generate_batch)
+
+    topics = [
+        pipeline.Topic(title="Prime number", langs=["en", "es"], pairs=3),
+        pipeline.Topic(title="Batman", pairs=2),
+    ]
+    n_articles, n_qa = pipeline.run(
+        pipeline.fetch_articles(topics), tmp_path, llm=None, batch_size=4
+    )
+
+    docs = [json.loads(line) for line in open(tmp_path / "wiki_doc.jsonl")]
+    qas = [json.loads(line) for line in open(tmp_path / "wiki_qa.jsonl")]
+    assert (n_articles, n_qa) == (3, 8)
+    assert len(docs) == 3 and len(qas) == 8
+    assert list(docs[0]) == ["title", "source", "language", "chunks", "summary"]
+    assert list(qas[0]) == [
+        "type",
+        "language",
+        "article_title",
+        "chunks",
+        "question",
+        "answer",
+    ]
+    assert max(batches) <= 4
+
+
+def test_article_jobs_share_chunks_with_prefix_caching(monkeypatch):
+    monkeypatch.setattr(pipeline.settings, "PREFIX_CACHING", True)
+    topic = pipeline.Topic(
+        title="Batman", types=["factual", "multihop"], pairs=2
+    )
+    jobs = pipeline.article_jobs(topic, _article("Batman", "en"), seed=0)
+
+    # the multihop set starts with the factual chunk and comes right after
+    assert [job.type for job in jobs] == ["factual", "multihop"] * 2
+    for factual, multihop in zip(jobs[::2], jobs[1::2]):
+        assert multihop.chunks[: len(factual.chunks)] == factual.chunks
+        assert len(multihop.chunks) > 1
+
+
+def test_run_resumes_without_duplicates(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_generate_batch(prompts, llm, params, use_cache):
+        calls.append(len(prompts))
+        return [QAFormat(question="Q", answer="A") for _ in prompts]
+
+    monkeypatch.setattr(pipeline, "generate_batch", fake_generate_batch)
+    topic = pipeline.Topic(title="Batman", pairs=3)
+    article = _article("Batman", "en")
+
+    assert pipeline.run([(topic, article)], tmp_path, llm=None) == (1, 3)
+    # e.g. after a crash: the first 2 pairs are kept, the 3rd is redone
+    lines = open(tmp_path / "wiki_qa.jsonl").readlines()
+    with open(tmp_path / "wiki_qa.jsonl", "w") as f:
+        f.writelines(lines[:2] + [lines[2][:10]])
+    (tmp_path / "wiki_qa.jsonl.ckpt").unlink()
+
+    assert pipeline.run([(topic, article)], tmp_path, llm=None) == (0, 1)
+    assert sum(calls) == 4
+    qas = open(tmp_path / "wiki_qa.jsonl").readlines()
+    assert len(qas) == 3
+
+
+def test_run_resumes_jobs_with_a_cut_context(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_generate_batch(prompts, llm, params, use_cache):
+        calls.append(len(prompts))
+        return [QAFormat(question="Q", answer="A") for _ in prompts]
+
+    monkeypatch.setattr(pipeline, "generate_batch", fake_generate_batch)
+    # room for about one chunk: multihop contexts lose the rest
+    monkeypatch.setattr(pipeline.settings, "TOKENIZER", "approx")
+    monkeypatch.setattr(pipeline.settings, "CTX_WINDOW", 200)
+    topic = pipeline.Topic(title="Batman", types=["multihop"], pairs=2)
+    article = _article("Batman", "en")
+    article.chunks[:] = [
+        {**chunk, "content": chunk["content"] * 12} for chunk in article.chunks
+    ]
+
+    assert pipeline.run([(topic, article)], tmp_path, llm=None) == (1, 2)
+    qas = [json.loads(line) for line in open(tmp_path / "wiki_qa.jsonl")]
+    assert all(len(qa["requested_chunks"]) > len(qa["chunks"]) for qa in qas)
+
+    assert pipeline.run([(topic, article)], tmp_path, llm=None) == (0, 0)
+    assert sum(calls) == 2
+    assert len(open(tmp_path / "wiki_qa.jsonl").readlines()) == 2
+
+
+def test_run_without_resume_keeps_articles_once(tmp_path, monkeypatch):
+    def fake_generate_batch(prompts, llm, params, use_cache):
+        return [QAFormat(question="Q", answer="A") for _ in prompts]
+
+    monkeypatch.setattr(pipeline, "generate_batch", fake_generate_batch)
+    job = (pipeline.Topic(title="Batman", pairs=2), _article("Batman", "en"))
+
+    assert pipeline.run([job], tmp_path, llm=None, resume=False) == (1, 2)
+    assert pipeline.run([job], tmp_path, llm=None, resume=False) == (0, 2)
+    assert len(open(tmp_path / "wiki_doc.jsonl").readlines()) == 1
+    assert len(open(tmp_path / "wiki_qa.jsonl").readlines()) == 4
+
+
+def test_run_stops_the_producer_when_generation_fails(tmp_path, monkeypatch):
+    def failing_generate_batch(prompts, llm, params, use_cache):
+        raise RuntimeError("backend down")
+
+    monkeypatch.setattr(pipeline, "generate_batch", failing_generate_batch)
+    # more jobs than the queue holds, the producer blocks on it
+    topic = pipeline.Topic(title="Batman", pairs=20)
+    errors = []
+
+    def target():
+        try:
+            pipeline.run(
+                [(topic, _article("Batman", "en"))],
+                tmp_path,
+                llm=None,
+                batch_size=1,
+            )
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert [str(e) for e in errors] == ["backend down"]
+    assert not any(t.name == "pipeline-fetch" for t in threading.enumerate())
+
+
+def test_run_queued_skips_done_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "lib.jobs.generate_batch",
+        lambda prompts, *args: (
+            [QAFormat(question="Q", answer="A")] * len(prompts)
+        ),
+    )
+    topic = pipeline.Topic(title="Batman", pairs=3)
+    articles = [(topic, _article("Batman", "en"))]
+
+    assert pipeline.run_queued(articles, tmp_path, llm=None) == (1, 3)
+    assert pipeline.run_queued(articles, tmp_path, llm=None) == (0, 0)
+    assert len(open(tmp_path / "wiki_qa.jsonl").readlines()) == 3
+
+
+def test_run_drops_near_duplicate_questions(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline.settings, "DEDUP_THRESHOLD", 0.6)
+    questions = iter(
+        [
+            "Who created the character Batman?",
+            "Who created the character of Batman?",
+            "Which city does Batman protect?",
+        ]
+    )
+    monkeypatch.setattr(
+        pipeline,
+        "generate_batch",
+        lambda prompts, *args: [
+            QAFormat(question=next(questions), answer="A") for _ in prompts
+        ],
+    )
+    topic = pipeline.Topic(title="Batman", pairs=3)
+
+    assert pipeline.run(
+        [(topic, _article("Batman", "en"))], tmp_path, llm=None
+    ) == (1, 2)
+    qas = [json.loads(line) for line in open(tmp_path / "wiki_qa.jsonl")]
+    assert [qa["question"] for qa in qas] == [
+        "Who created the character Batman?",
+        "Which city does Batman protect?",
+    ]
+
+
+def test_read_store_picks_topics_and_languages():
+    store = pipeline.ArticleStore(
+        [
+            _article("Batman", "en"),
+            _article("Batman", "es"),
+            _article("Cat", "en"),
+        ]
+    )
+    defaults = pipeline.Topic(title="", langs=["en"])
+    every = list(pipeline.read_store(store, [], defaults))
+    assert [(t.title, a.language) for t, a in every] == [
+        ("Batman", "en"),
+        ("Cat", "en"),
+    ]
+    topic = pipeline.Topic(title="Batman", langs=["es", "fr"])
+    [(found, article)] = pipeline.read_store(store, [topic], defaults)
+    assert found is topic and article == _article("Batman", "es")